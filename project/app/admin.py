@@ -1,10 +1,17 @@
 from adminfilters.mixin import AdminFiltersMixin
 from django.contrib import admin
+from django.db.models import Count, Prefetch, Q
 from .models import *
 import nested_admin
 from django.utils.html import mark_safe, format_html
 from django.urls import reverse
 from django.utils.http import urlencode
+from . import cache, previews, search, stats
+from .imports import BulkImportMixin, ChunkedImportMixin, PreloadedForeignKeyWidget, PreloadedManyToManyWidget
+from .permissions import owns_discipline
+from .storage import ContentAddressedFileField
+from .streaming import StreamingExportMixin
+from .uploads import ChunkedFileInput
 from .utils import ru_plural
 from import_export.admin import ImportExportModelAdmin
 from import_export.fields import Field
@@ -13,6 +20,7 @@ from django.contrib.auth.admin import UserAdmin
 from import_export.admin import ExportMixin, ImportMixin, ExportActionMixin
 from django.contrib.auth.models import Group as UserGroup
 from import_export import fields, resources
+from import_export.instance_loaders import CachedInstanceLoader
 from import_export.widgets import ForeignKeyWidget, ManyToManyWidget
 
 admin.site.site_header = 'Цифровой фонд оценочных средств'
@@ -23,29 +31,49 @@ User.get_short_name = lambda user_instance: (user_instance.last_name + " " + use
     if user_instance.last_name or user_instance.first_name else user_instance.username
 
 
-class UserResource(resources.ModelResource):
+class UserResource(BulkImportMixin, resources.ModelResource):
     """
-       Класс описывает логику импорта сущности "пользователь"
+       Класс описывает логику импорта сущности "пользователь" (массовый импорт, см. app.imports)
     """
     class Meta:
         model = User
         import_id_fields = ('username',)
         fields = ('username', 'first_name', 'last_name')
+        use_bulk = True
+        instance_loader_class = CachedInstanceLoader
 
-    def after_save_instance(self, instance, using_transactions, dry_run):
+    def before_import(self, dataset, using_transactions, dry_run, **kwargs):
         """
-            Событие "после сохранения"
+            Событие "перед импортом"
         """
-        # выставляем статус персонала и группу "преподаватели" по-умолчанию
+        # группа "преподаватели" по-умолчанию (одна на весь импорт)
+        self.default_group = UserGroup.objects.first()
+        super().before_import(dataset, using_transactions, dry_run, **kwargs)
+
+    def before_save_instance(self, instance, using_transactions, dry_run):
+        """
+            Событие "перед сохранением"
+        """
+        # выставляем статус персонала
         instance.is_staff = True
-        instance.groups.add(
-            UserGroup.objects.first()
-        )
-        instance.save()
+
+    def get_bulk_update_fields(self):
+        return super().get_bulk_update_fields() + ['is_staff']
+
+    def after_bulk_save(self, instances, dry_run):
+        """
+            Событие "после сохранения порции пользователей"
+        """
+        # добавляем пользователей в группу "преподаватели" по-умолчанию
+        if self.default_group:
+            User.groups.through.objects.bulk_create([
+                User.groups.through(user_id=u.pk, group_id=self.default_group.pk) for u in instances
+            ], ignore_conflicts=True)
+        cache.invalidate(cache.TEACHERS)
 
 
 # переопределяем django-класс админской сущности "пользователь"
-class CustomUserAdmin(ImportMixin, UserAdmin):
+class CustomUserAdmin(ChunkedImportMixin, ImportMixin, UserAdmin):
     resource_class = UserResource
     pass
 
@@ -78,7 +106,7 @@ class GroupExportResource(resources.ModelResource):
 
 
 @admin.register(Group)
-class GroupAdmin(ImportExportModelAdmin):
+class GroupAdmin(StreamingExportMixin, ChunkedImportMixin, ImportExportModelAdmin):
     """
         Класс отвечает за логику управления сущностью "учебная группа"
     """
@@ -91,11 +119,17 @@ class GroupAdmin(ImportExportModelAdmin):
     def get_export_resource_class(self):
         return GroupExportResource
 
+    def get_queryset(self, request):
+        # количество дисциплин группы считаем в том же запросе, что и список групп
+        return super(GroupAdmin, self).get_queryset(request).annotate(
+            discipline_count=Count('discipline', distinct=True)
+        )
+
     def view_disciplines_link(self, obj):
         """
             Логика отображения колонки для перехода в список дисциплин группы
         """
-        count = obj.discipline_set.count()
+        count = obj.discipline_count
         url = (
                 reverse("admin:app_discipline_changelist")
                 + "?"
@@ -116,7 +150,11 @@ class QualificationAdmin(admin.ModelAdmin):
         # добавляем объект request в объект self, для доступа к нему из любой функции данного класса
         qs = super(QualificationAdmin, self).get_queryset(request)
         self.request = request
-        return qs
+        # общее количество дисциплин и количество дисциплин пользователя считаем в том же запросе
+        return qs.annotate(
+            discipline_count=Count('discipline', distinct=True),
+            own_discipline_count=Count('discipline', filter=Q(discipline__users__id=request.user.id), distinct=True),
+        )
 
     def get_list_display(self, request):
         """
@@ -130,8 +168,8 @@ class QualificationAdmin(admin.ModelAdmin):
         """
             Логика отображения страницы списка квалификаций для преподавателей
         """
-        total = obj.discipline_set.count()
-        own = obj.discipline_set.filter(users__id=self.request.user.id).count()
+        total = obj.discipline_count
+        own = obj.own_discipline_count
         url = (
                 reverse("admin:app_discipline_changelist")
                 + "?"
@@ -148,7 +186,7 @@ class QualificationAdmin(admin.ModelAdmin):
         """
             Логика отображения страницы списка квалификаций для администратора
         """
-        count = obj.discipline_set.count()
+        count = obj.discipline_count
         url = (
                 reverse("admin:app_discipline_changelist")
                 + "?"
@@ -170,7 +208,53 @@ class FosTypeAdmin(admin.ModelAdmin):
     search_fields = ['name']
 
 
-class FosDocumentAdminInline(admin.StackedInline):
+def preview_image(document, preview, height):
+    """
+        Миниатюра первой страницы документа со ссылкой на файл (см. app.previews)
+    """
+    if preview is None or not preview.image:
+        return ''
+    return format_html(
+        '<a href="{}"><img src="{}" height="{}" alt="" loading="lazy" '
+        'style="border:1px solid #ddd;vertical-align:middle;margin-right:6px"></a>',
+        reverse('document_file', args=(document.id,)), reverse('document_preview', args=(preview.sha256,)), height
+    )
+
+
+class ChunkedUploadInlineMixin:
+    """
+        Загрузка файлов документов по частям в формах документов
+    """
+
+    def formfield_for_dbfield(self, db_field, request, **kwargs):
+        """
+            Поле файла документа принимает только загрузки текущего пользователя
+        """
+        if isinstance(db_field, ContentAddressedFileField):
+            kwargs['widget'] = ChunkedFileInput(user=request.user)
+        return super().formfield_for_dbfield(db_field, request, **kwargs)
+
+
+class DocumentPreviewInlineMixin:
+    """
+        Миниатюра первой страницы файла в форме документа
+    """
+    readonly_fields = ('preview',)
+
+    def preview(self, obj):
+        """
+            Логика отображения поля "просмотр" в форме документа
+        """
+        if obj is None or not obj.pk or not obj.path:
+            return '-'
+        preview = previews.for_documents([obj]).get(obj.id)
+        if preview is None:
+            return 'Миниатюра еще не готова'
+        return format_html('{}<span class="help">{}</span>', preview_image(obj, preview, 200), preview.pages_text())
+    preview.short_description = 'Просмотр'
+
+
+class FosDocumentAdminInline(ChunkedUploadInlineMixin, DocumentPreviewInlineMixin, admin.StackedInline):
     """
         Класс отвечает за логику управления вложенной сущностью "документ в ФОСе"
     """
@@ -184,12 +268,8 @@ class FosDocumentAdminInline(admin.StackedInline):
         # разрешаем доступ только супер-администратору или если дисциплина ФОСа принадлежит пользователю
         if request.user.is_superuser or not obj:
             return True
-        if isinstance(obj, Discipline):
-            return obj.users and obj.users.filter(id=request.user.id).exists()
-        if isinstance(obj, Fos):
-            return obj.discipline.users and obj.discipline.users.filter(id=request.user.id).exists()
-        if isinstance(obj, Document):
-            return obj.fos.discipline.users and obj.fos.discipline.users.filter(id=request.user.id).exists()
+        if isinstance(obj, (Discipline, Fos, Document)):
+            return owns_discipline(request, obj)
         return True
 
     def has_change_permission(self, request, obj):
@@ -235,6 +315,24 @@ class OwnFosListFilter(admin.SimpleListFilter):
         return queryset
 
 
+class ReferenceListFilter(admin.RelatedFieldListFilter):
+    """
+        Класс отвечает за логику фильтра по справочнику (тип ФОСа, тип дисциплины, вид обучения):
+        варианты выбора берутся из кэша справочников
+    """
+    loaders = {
+        FosType: cache.fos_types,
+        DisciplineType: cache.discipline_types,
+        Qualification: cache.qualifications,
+    }
+
+    def field_choices(self, field, request, model_admin):
+        """
+            Варианты выбора в фильтре
+        """
+        return [(obj.pk, str(obj)) for obj in self.loaders[field.related_model]()]
+
+
 class DisTeachersListFilter(admin.SimpleListFilter):
     """
         Класс отвечает за логику фильтра "преподаватель через дисциплину"
@@ -246,11 +344,7 @@ class DisTeachersListFilter(admin.SimpleListFilter):
         """
             Варианты выбора в фильтре
         """
-        users = []
-        for u in User.objects.all():
-            name = u.last_name + " " + u.first_name if u.last_name or u.first_name else u.username
-            users.append((u.id, name))
-        return users
+        return [(t.id, t.name) for t in cache.teachers()]
 
     def queryset(self, request, queryset):
         """
@@ -270,11 +364,20 @@ class FosAdmin(AdminFiltersMixin, admin.ModelAdmin):
     list_display_links = ['name']
     list_select_related = ('type', 'discipline')
 
-    search_fields = (
-        'name', 'description', 'discipline__name'
-    )
+    # название, описание ФОСа, названия и текст его документов и название дисциплины ищутся через поисковый индекс
+    # (см. get_search_results), здесь - поля, которых нет в индексе
+    search_fields = ('type__name', )
     inlines = (FosDocumentAdminInline, )
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+            Поиск через поисковый индекс (см. app.search), а также по полям search_fields
+        """
+        if not search_term.strip():
+            return queryset, False
+        queryset_by_fields, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        return search.search_foses(queryset, search_term) | queryset_by_fields, may_have_duplicates
+
     def type_text(self, obj):
         """
             Добавление поля 'тип' в список таблицы
@@ -294,15 +397,42 @@ class FosAdmin(AdminFiltersMixin, admin.ModelAdmin):
         """
         links = ''
         i = 0
-        for doc in Document.objects.filter(fos=obj):
+        # документы и их миниатюры загружены одним запросом для всей страницы (см. get_queryset
+        # и get_changelist_instance)
+        for doc in obj.document_set.all():
             if doc.path:
                 i += 1
-                links += ('<a href="'+doc.path.url+'">'+str(i)+'. '+doc.name+'</a></br>')
+                preview = getattr(doc, 'preview', None)
+                links += format_html(
+                    '<div style="margin-bottom:4px">{}<a href="{}">{}. {}</a> <span class="help">{}</span></div>',
+                    preview_image(doc, preview, 48), reverse('document_file', args=(doc.id,)), i, doc.name,
+                    preview.pages_text() if preview else ''
+                )
         if not links:
             return '-'
         return mark_safe(links)
     files.short_description = 'Документы'
 
+    def get_changelist_instance(self, request):
+        """
+            Список ФОСов страницы с миниатюрами документов (одним запросом для всей страницы)
+        """
+        changelist = super().get_changelist_instance(request)
+        documents = [doc for fos in changelist.result_list for doc in fos.document_set.all()]
+        found = previews.for_documents(documents)
+        for doc in documents:
+            doc.preview = found.get(doc.id)
+        return changelist
+
+    def get_queryset(self, request):
+        """
+            Выборка ФОСов для списка и форм
+        """
+        # документы всех ФОСов страницы загружаем одним запросом (только поля, нужные для колонки "документы")
+        return super(FosAdmin, self).get_queryset(request).prefetch_related(
+            Prefetch('document_set', queryset=Document.objects.only('id', 'name', 'path', 'fos').order_by('id'))
+        )
+
     def get_form(self, request, obj=None, **kwargs):
         """
             Отображение формы
@@ -318,8 +448,7 @@ class FosAdmin(AdminFiltersMixin, admin.ModelAdmin):
             Описание прав доступа к сущности
         """
         # разрешаем доступ только супер-администратору или если дисциплина ФОСа принадлежит пользователю
-        return request.user.is_superuser or \
-            (obj and obj.discipline and obj.discipline.users and obj.discipline.users.filter(id=request.user.id))
+        return request.user.is_superuser or bool(obj and owns_discipline(request, obj))
 
     def has_change_permission(self, request, obj=None):
         """
@@ -344,8 +473,9 @@ class FosAdmin(AdminFiltersMixin, admin.ModelAdmin):
            Описание логики формирования доступного набора фильтров на странице списка
         """
         if not request.user.is_superuser:
-            return [OwnFosListFilter, 'years', 'discipline', 'type', DisTeachersListFilter, 'discipline__groups']
-        return ['years', 'discipline', 'type', DisTeachersListFilter, 'discipline__groups']
+            return [OwnFosListFilter, 'years', 'discipline', ('type', ReferenceListFilter), DisTeachersListFilter,
+                    'discipline__groups']
+        return ['years', 'discipline', ('type', ReferenceListFilter), DisTeachersListFilter, 'discipline__groups']
 
     def changelist_view(self, request, extra_context=None):
         """
@@ -366,19 +496,17 @@ class FosAdmin(AdminFiltersMixin, admin.ModelAdmin):
             discipline = Discipline.objects.get(pk=request.GET['discipline__id__exact'])
             title = discipline.name + ': ФОСы'
         if 'type__id__exact' in request.GET:
-            fos_type = FosType.objects.get(pk=request.GET['type__id__exact'])
-            title = title + " (" + fos_type.name.lower() + ")"
+            fos_type = cache.get_by_id(cache.fos_types(), request.GET['type__id__exact'])
+            if fos_type:
+                title = title + " (" + fos_type.name.lower() + ")"
 
         if 'teacher' in request.GET or ('fos_own' in request.GET and request.GET['fos_own'] == 1):
             if 'fos_own' in request.GET and request.GET['fos_own'] == 1:
-                user = request.user
+                teacher = cache.get_by_id(cache.teachers(), request.user.id)
             else:
-                user = User.objects.get(pk=request.GET['teacher'])
-            if user.first_name or user.last_name:
-                username = user.first_name + " " + user.last_name
-            else:
-                username = user.username
-            title = "("+username+") " + title
+                teacher = cache.get_by_id(cache.teachers(), request.GET['teacher'])
+            if teacher:
+                title = "("+teacher.full_name+") " + title
         elif 'discipline__groups__id__exact' in request.GET:
             group = Group.objects.get(pk=request.GET['discipline__groups__id__exact'])
             title = "(" + group.name.upper() + ") " + title
@@ -398,7 +526,8 @@ class DisciplineTypeAdmin(admin.ModelAdmin):
     search_fields = ['name']
 
 
-class DocumentAdminStackedInline(nested_admin.NestedStackedInline):
+class DocumentAdminStackedInline(ChunkedUploadInlineMixin, DocumentPreviewInlineMixin,
+                                 nested_admin.NestedStackedInline):
     """
         Класс отвечает за логику управления вложенной сущностью "Документ в ФОСе при управлении дисциплиной"
     """
@@ -412,12 +541,8 @@ class DocumentAdminStackedInline(nested_admin.NestedStackedInline):
         # разрешаем доступ только супер-администратору или если дисциплина ФОСа принадлежит пользователю
         if request.user.is_superuser or not obj:
             return True
-        if isinstance(obj, Discipline):
-            return obj.users and obj.users.filter(id=request.user.id)
-        if isinstance(obj, Fos):
-            return obj.discipline.users and obj.discipline.users.filter(id=request.user.id)
-        if isinstance(obj, Document):
-            return obj.fos.discipline.users and obj.fos.discipline.users.filter(id=request.user.id)
+        if isinstance(obj, (Discipline, Fos, Document)):
+            return owns_discipline(request, obj)
         return True
 
     def has_change_permission(self, request, obj):
@@ -452,7 +577,7 @@ class FosAdminInline(nested_admin.NestedStackedInline):
             Описание прав доступа к сущности
         """
         # разрешаем доступ только супер-администратору или если дисциплина ФОСа принадлежит пользователю
-        return request.user.is_superuser or (obj and obj.users and obj.users.filter(id=request.user.id))
+        return request.user.is_superuser or bool(obj and owns_discipline(request, obj))
 
     def has_change_permission(self, request, obj):
         """
@@ -484,11 +609,7 @@ class TeachersListFilter(admin.SimpleListFilter):
         """
             Варианты выбора в фильтре
         """
-        users = []
-        for u in User.objects.all():
-            name = u.last_name + " " + u.first_name if u.last_name or u.first_name else u.username
-            users.append((u.id, name))
-        return users
+        return [(t.id, t.name) for t in cache.teachers()]
 
     def queryset(self, request, queryset):
         """
@@ -523,32 +644,48 @@ class OwnDisciplineListFilter(admin.SimpleListFilter):
         return queryset
 
 
-class DisciplineImportResource(resources.ModelResource):
+class DisciplineImportResource(BulkImportMixin, resources.ModelResource):
     """
-       Класс описывает логику импорта сущности "дисциплина"
+       Класс описывает логику импорта сущности "дисциплина" (массовый импорт, см. app.imports)
     """
     name = Field(attribute='name', column_name='name')
     type = fields.Field(
         column_name='type', attribute='type',
-        widget=ForeignKeyWidget(DisciplineType, field='name')
+        widget=PreloadedForeignKeyWidget(DisciplineType, field='name')
     )
     qualification = fields.Field(
         column_name='qualification', attribute='qualification',
-        widget=ForeignKeyWidget(Qualification, field='name')
+        widget=PreloadedForeignKeyWidget(Qualification, field='name')
     )
     users = fields.Field(
         column_name='users', attribute='users',
-        widget=ManyToManyWidget(User, field='username', separator='|')
+        widget=PreloadedManyToManyWidget(User, field='username', separator='|')
     )
     groups = fields.Field(
         column_name='groups', attribute='groups',
-        widget=ManyToManyWidget(Group, field='name', separator='|')
+        widget=PreloadedManyToManyWidget(Group, field='name', separator='|')
     )
 
     class Meta:
         model = Discipline
         import_id_fields = ('name', )
         fields = ('name', 'type', 'qualification', 'groups', 'users')
+        use_bulk = True
+        instance_loader_class = CachedInstanceLoader
+
+    def get_queryset(self):
+        # справочники, преподаватели и группы существующих дисциплин - для сравнения "было/стало"
+        # при подтверждении импорта
+        return super().get_queryset().select_related('type', 'qualification').prefetch_related('users', 'groups')
+
+    def after_bulk_save(self, instances, dry_run):
+        """
+            Событие "после сохранения порции дисциплин"
+        """
+        search.index_disciplines(instances)
+        # вид обучения мог измениться у существующих дисциплин (сигналы сохранения не отправляются)
+        stats.sync_qualifications([d.pk for d in instances])
+        cache.invalidate(cache.TEACHERS)
 
 
 class DisciplineExportResource(resources.ModelResource):
@@ -583,24 +720,39 @@ class DisciplineExportResource(resources.ModelResource):
 
 
 @admin.register(Discipline)
-class DisciplineAdmin(ImportExportModelAdmin, ExportActionMixin, nested_admin.NestedModelAdmin):
+class DisciplineAdmin(StreamingExportMixin, ChunkedImportMixin, ImportExportModelAdmin, ExportActionMixin,
+                      nested_admin.NestedModelAdmin):
     """
         Класс отвечает за логику управления сущностью "Дисциплина"
     """
     list_display_links = ('name', )
-    search_fields = ['name', 'type__name', 'qualification__name', 'fos__document__name', 'fos__name']
+    list_select_related = ('type', 'qualification')
+    # названия дисциплины, ее ФОСов и документов ищутся через поисковый индекс (см. get_search_results),
+    # здесь - поля, которых нет в индексе
+    search_fields = ('type__name', 'qualification__name')
     inlines = [FosAdminInline]
     resource_classes = [DisciplineImportResource]
     save_on_top = True
+    # ФОСы дисциплин для колонки "Оценочные средства" выгрузки (преподаватели и группы загружает get_queryset)
+    export_prefetch_related = [Prefetch('fos_set', queryset=Fos.objects.only('id', 'name', 'discipline_id'))]
 
     def get_export_resource_class(self):
         return DisciplineExportResource
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+            Поиск через поисковый индекс (см. app.search), а также по полям search_fields
+        """
+        if not search_term.strip():
+            return queryset, False
+        queryset_by_fields, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        return search.search_disciplines(queryset, search_term) | queryset_by_fields, may_have_duplicates
+
     def view_foses_link(self, obj):
         """
             Логика отображения колонки для перехода в список ФОСов
         """
-        count = obj.fos_set.count()
+        count = obj.fos_count
         if self.request.user.is_superuser:
             url = (reverse("admin:app_fos_changelist") + "?" + urlencode({"discipline__id__exact": f"{obj.id}"}))
         else:
@@ -622,7 +774,7 @@ class DisciplineAdmin(ImportExportModelAdmin, ExportActionMixin, nested_admin.Ne
            Может ли пользователь изменять дисциплину
         """
         # разрешаем работу только со своими дисциплинами или если юзер - супер-админ
-        return (obj and obj.users and obj.users.filter(id=request.user.id).exists()) or request.user.is_superuser
+        return bool(obj and owns_discipline(request, obj)) or request.user.is_superuser
 
     def lookup_allowed(self, lookup, value):
         """
@@ -646,18 +798,16 @@ class DisciplineAdmin(ImportExportModelAdmin, ExportActionMixin, nested_admin.Ne
 
         title = 'Список учебных дисциплин'
         if 'qualification__id__exact' in request.GET:
-            qualification = Qualification.objects.get(pk=request.GET['qualification__id__exact'])
-            title = "(" + qualification.name + ") " + title
+            qualification = cache.get_by_id(cache.qualifications(), request.GET['qualification__id__exact'])
+            if qualification:
+                title = "(" + qualification.name + ") " + title
         if 'teacher' in request.GET or ('discipline_own' in request.GET and request.GET['discipline_own'] == 1):
             if 'discipline_own' in request.GET:
-                user = request.user
-            else:
-                user = User.objects.get(pk=request.GET['teacher'])
-            if user.first_name or user.last_name:
-                username = user.first_name + " " + user.last_name
+                teacher = cache.get_by_id(cache.teachers(), request.user.id)
             else:
-                username = user.username
-            title = title + " преподавателя " + username.lower()
+                teacher = cache.get_by_id(cache.teachers(), request.GET['teacher'])
+            if teacher:
+                title = title + " преподавателя " + teacher.full_name.lower()
         elif 'groups__id__exact' in request.GET:
             group = Group.objects.get(pk=request.GET['groups__id__exact'])
             title = title + " группы " + group.name.upper()
@@ -691,11 +841,15 @@ class DisciplineAdmin(ImportExportModelAdmin, ExportActionMixin, nested_admin.Ne
            Описание логики формирования доступного набора фильтров на странице списка
         """
         if not request.user.is_superuser:
-            return [OwnDisciplineListFilter, 'qualification', 'type', TeachersListFilter, 'groups', 'groups__course']
-        return ['qualification', 'type', TeachersListFilter, 'groups', 'groups__course']
+            return [OwnDisciplineListFilter, ('qualification', ReferenceListFilter), ('type', ReferenceListFilter),
+                    TeachersListFilter, 'groups', 'groups__course']
+        return [('qualification', ReferenceListFilter), ('type', ReferenceListFilter), TeachersListFilter, 'groups',
+                'groups__course']
 
     def get_queryset(self, request):
         # добавляем объект request в объект self, для доступа к нему из любой функции данного класса
         qs = super(DisciplineAdmin, self).get_queryset(request)
         self.request = request
-        return qs
+        # количество ФОСов берем из статистики ФОСов (см. app.stats) в том же запросе,
+        # преподавателей и группы загружаем одним запросом на страницу
+        return qs.annotate(fos_count=stats.fos_count_subquery()).prefetch_related('users', 'groups')
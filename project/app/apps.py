@@ -6,3 +6,7 @@ class AppConfig(AppConfig):
     default_charset = 'utf-8'
     name = "app"
     verbose_name = 'Фонды оценочных средств'
+
+    def ready(self):
+        # подключаем обработчики сигналов моделей
+        from app import signals  # noqa: F401
@@ -0,0 +1,55 @@
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections, transaction
+
+# транзакции, которые пишут в БД после чтения, в SQLite (см. app.backends.sqlite3) начинаются с BEGIN IMMEDIATE:
+# блокировка записи берется в начале транзакции (с ожиданием busy_timeout), а не при первой записи, когда
+# транзакция, начавшая с чтения, получает "database is locked" без ожидания. Остальные транзакции начинаются
+# как обычно (BEGIN DEFERRED) и не мешают друг другу читать. В других БД флага нет и ничего не меняется.
+
+# методы запросов, которые не изменяют данные
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+@contextmanager
+def begin_immediate(connection):
+    """
+        Транзакции, начатые в блоке на соединении connection, начинаются с BEGIN IMMEDIATE
+    """
+    if not hasattr(connection, 'begin_immediate'):
+        yield
+        return
+    previous = connection.begin_immediate
+    connection.begin_immediate = True
+    try:
+        yield
+    finally:
+        connection.begin_immediate = previous
+
+
+@contextmanager
+def atomic_write(using=None):
+    """
+        transaction.atomic для блока, который пишет в БД после чтения (вложенный блок выполняется в уже начатой
+        транзакции)
+    """
+    with begin_immediate(transaction.get_connection(using)), transaction.atomic(using=using):
+        yield
+
+
+class WriteRequestMiddleware:
+    """
+        Транзакции запросов, изменяющих данные (сохранение и удаление в админке, загрузка файлов),
+        начинаются с BEGIN IMMEDIATE: такие запросы читают записи перед записью
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method in SAFE_METHODS:
+            return self.get_response(request)
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(begin_immediate(connections[alias]))
+            return self.get_response(request)
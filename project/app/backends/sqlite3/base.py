@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+        SQLite с настройками для одновременной работы нескольких пользователей
+
+        - режим WAL: чтение не блокируется записью;
+        - busy_timeout: запрос ждет освобождения блокировки записи вместо ошибки "database is locked";
+        - пишущие транзакции (см. app.backends) начинаются с BEGIN IMMEDIATE: блокировка записи берется
+          в начале транзакции, иначе транзакция, начавшая с чтения, получает "database is locked" сразу, без ожидания
+          (при попытке записи после параллельной записи другим соединением). Остальные транзакции начинаются
+          с BEGIN (DEFERRED), чтобы читающие транзакции не ждали друг друга.
+    """
+
+    # начинать транзакции с BEGIN IMMEDIATE (выставляется на время пишущего блока или запроса, см. app.backends)
+    begin_immediate = False
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if settings.SQLITE_WAL and not self.is_in_memory_db():
+            conn.execute('PRAGMA journal_mode=WAL')
+            # в режиме WAL достаточно синхронизации при контрольных точках
+            conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=%d' % (conn_params.get('timeout', 5) * 1000))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.begin_immediate else 'BEGIN')
@@ -0,0 +1,191 @@
+import os
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from app.backends import atomic_write
+from app.merging import file_hash
+from app.models import Blob, Document, document_storage
+from app.storage import name_sha256
+
+# учет ссылок документов на файлы хранилища документов по содержимому (см. app/storage.py)
+#
+# количество ссылок поддерживается сигналами сохранения и удаления документов (см. app.signals). Файл без ссылок
+# удаляется не сразу, а командой collect_document_blobs спустя DOCUMENT_BLOB_GRACE_HOURS часов: за это время
+# на него может снова сослаться документ (например, при повторной загрузке того же файла)
+
+# каталог файлов документов в хранилище
+DOCUMENTS_DIR = 'documents'
+
+# сколько файлов удалять в одной транзакции
+COLLECT_BATCH_SIZE = 500
+
+# расширение временных файлов загрузок по частям
+PART_SUFFIX = '.part'
+
+
+def describe(name):
+    """
+        Хэш содержимого и размер файла хранилища
+    """
+    path = document_storage.path(name)
+    if not os.path.exists(path):
+        return name_sha256(name) or '', 0
+    return name_sha256(name) or file_hash(path), os.path.getsize(path)
+
+
+def acquire(name, count=1):
+    """
+        Увеличение количества ссылок на файл (запись о файле создается, если ее нет)
+    """
+    now = timezone.now()
+    if Blob.objects.filter(name=name).update(refcount=F('refcount') + count, updated_at=now):
+        return
+    sha256, size = describe(name)
+    try:
+        with transaction.atomic():
+            Blob.objects.create(name=name, sha256=sha256, size=size, refcount=count)
+    except IntegrityError:
+        # запись одновременно создал параллельный запрос
+        Blob.objects.filter(name=name).update(refcount=F('refcount') + count, updated_at=now)
+
+
+def reserve(name):
+    """
+        Блокировка записи о файле до конца транзакции перед тем, как сослаться на уже сохраненный файл
+
+        Пока транзакция, сохраняющая документ, не завершена, collect ждет блокировку и затем видит новую ссылку,
+        поэтому не удаляет файл (а обновленная дата изменения защищает файл еще DOCUMENT_BLOB_GRACE_HOURS).
+
+        Returns:
+            True, если запись о файле есть (иначе файл мог быть уже удален - его нужно записать заново)
+    """
+    return bool(Blob.objects.filter(name=name).update(updated_at=timezone.now()))
+
+
+def release(name, count=1):
+    """
+        Уменьшение количества ссылок на файл (файл без ссылок удаляется позже, см. collect)
+    """
+    now = timezone.now()
+    Blob.objects.filter(name=name, refcount__gte=count).update(refcount=F('refcount') - count, updated_at=now)
+    Blob.objects.filter(name=name, refcount__lt=count).update(refcount=0, updated_at=now)
+
+
+def live_counts():
+    """
+        Количество ссылок, посчитанное по таблице документов: путь к файлу => количество документов
+    """
+    rows = Document.objects.exclude(path='').exclude(path__isnull=True).values('path').annotate(
+        total=Count('id')
+    ).order_by()
+    return {row['path']: row['total'] for row in rows}
+
+
+def verify():
+    """
+        Сверка количества ссылок с таблицей документов
+
+        Returns:
+            Список расхождений: (путь к файлу, количество в записи о файле, количество по документам)
+    """
+    stored = dict(Blob.objects.values_list('name', 'refcount'))
+    live = live_counts()
+    return [
+        (name, stored.get(name), live.get(name, 0))
+        for name in sorted(set(stored) | set(live))
+        if stored.get(name) != live.get(name, 0)
+    ]
+
+
+@atomic_write()
+def rebuild():
+    """
+        Пересчет количества ссылок по таблице документов (записи о файлах без записей создаются)
+
+        Returns:
+            Количество исправленных записей
+    """
+    differences = verify()
+    now = timezone.now()
+    missing = []
+    for name, stored, live in differences:
+        if stored is None:
+            sha256, size = describe(name)
+            missing.append(Blob(name=name, sha256=sha256, size=size, refcount=live))
+        else:
+            Blob.objects.filter(name=name).update(refcount=live, updated_at=now)
+    Blob.objects.bulk_create(missing, batch_size=500)
+    return len(differences)
+
+
+def delete_files(names):
+    """
+        Удаление файлов, на которые не ссылаются ни записи о файлах, ни документы
+    """
+    names = set(names)
+    used = set(Blob.objects.filter(name__in=names).values_list('name', flat=True))
+    used |= set(Document.objects.filter(path__in=names).values_list('path', flat=True))
+    for name in names - used:
+        document_storage.delete(name)
+
+
+def collect(grace=timedelta(0), names=None, dry_run=False):
+    """
+        Удаление файлов без ссылок
+
+        Args:
+            grace: Сколько времени хранить файл после удаления последней ссылки
+            names: Проверить только эти файлы
+            dry_run: Только найти файлы, не удаляя их
+
+        Returns:
+            Список записей о файлах без ссылок (удаленных)
+    """
+    blobs = Blob.objects.filter(refcount=0, updated_at__lt=timezone.now() - grace).order_by('id')
+    if names is not None:
+        blobs = blobs.filter(name__in=names)
+    blobs = list(blobs)
+    if dry_run:
+        return blobs
+
+    for i in range(0, len(blobs), COLLECT_BATCH_SIZE):
+        batch = [blob.name for blob in blobs[i:i + COLLECT_BATCH_SIZE]]
+        with transaction.atomic():
+            # на файл могли сослаться после выборки - такие записи не удаляются. Удаление записей блокирует их
+            # до конца транзакции, поэтому файлы удаляются в ней же: сохранение документа, ссылающегося на файл
+            # (см. reserve), ждет ее завершения и затем записывает удаленный файл заново
+            Blob.objects.filter(name__in=batch, refcount=0, updated_at__lt=timezone.now() - grace).delete()
+            delete_files(batch)
+    return blobs
+
+
+def orphan_files(grace=timedelta(0)):
+    """
+        Файлы каталога документов, о которых нет записей (например, оставшиеся после сбоя загрузки),
+        измененные раньше grace назад
+
+        Returns:
+            Список путей к файлам в хранилище
+    """
+    root = document_storage.path(DOCUMENTS_DIR)
+    cutoff = (timezone.now() - grace).timestamp()
+    candidates = []
+    for directory, _, files in os.walk(root):
+        for file in files:
+            # временные файлы загрузок по частям удаляются вместе с загрузками (см. app.uploads.collect_sessions)
+            if file.endswith(PART_SUFFIX):
+                continue
+            path = os.path.join(directory, file)
+            if os.path.getmtime(path) < cutoff:
+                candidates.append(os.path.relpath(path, document_storage.location).replace(os.sep, '/'))
+
+    orphans = []
+    for i in range(0, len(candidates), COLLECT_BATCH_SIZE):
+        batch = set(candidates[i:i + COLLECT_BATCH_SIZE])
+        batch -= set(Blob.objects.filter(name__in=batch).values_list('name', flat=True))
+        batch -= set(Document.objects.filter(path__in=batch).values_list('path', flat=True))
+        orphans.extend(sorted(batch))
+    return orphans
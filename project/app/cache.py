@@ -0,0 +1,157 @@
+import datetime
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+# кэш небольших, редко меняющихся справочников (типы ФОСов, типы дисциплин, виды обучения, периоды обучения,
+# справочник преподавателей)
+#
+# 1 уровень - память процесса: значение хранится REFERENCE_CACHE_LOCAL_TTL секунд
+# 2 уровень (необязательный) - кэш Django с псевдонимом REFERENCE_CACHE_ALIAS, общий для всех процессов сервера
+#
+# при изменении или удалении записей справочника значение сбрасывается на обоих уровнях (см. app.signals),
+# другие процессы получают новое значение не позже чем через REFERENCE_CACHE_LOCAL_TTL секунд
+
+FOS_TYPES = 'fos_types'
+DISCIPLINE_TYPES = 'discipline_types'
+QUALIFICATIONS = 'qualifications'
+TEACHERS = 'teachers'
+
+# преподаватель: ID пользователя, имя для списков ("Фамилия Имя") и для заголовков ("Имя Фамилия")
+Teacher = namedtuple('Teacher', ['id', 'name', 'full_name'])
+
+# значения первого уровня: название => (значение, время загрузки)
+_local = {}
+_local_lock = threading.Lock()
+
+
+def _shared():
+    if not settings.REFERENCE_CACHE_ALIAS:
+        return None
+    return caches[settings.REFERENCE_CACHE_ALIAS]
+
+
+def _shared_key(name):
+    return 'app:reference:' + name
+
+
+def get(name, loader):
+    """
+        Значение справочника из кэша
+
+        Args:
+            name: Название справочника (ключ кэша)
+            loader: Функция загрузки значения из БД (вызывается, если значения нет ни на одном уровне кэша)
+    """
+    now = time.monotonic()
+    with _local_lock:
+        cached = _local.get(name)
+    if cached is not None and now - cached[1] < settings.REFERENCE_CACHE_LOCAL_TTL:
+        return cached[0]
+
+    shared = _shared()
+    value = shared.get(_shared_key(name)) if shared is not None else None
+    if value is None:
+        value = loader()
+        if shared is not None:
+            shared.set(_shared_key(name), value)
+    with _local_lock:
+        _local[name] = (value, now)
+    return value
+
+
+def invalidate(*names):
+    """
+        Сброс значений справочников на обоих уровнях кэша
+
+        Значение сбрасывается сразу и повторно после фиксации транзакции: иначе параллельный запрос,
+        успевший до фиксации загрузить старые данные, снова положил бы их в кэш.
+    """
+    def drop():
+        with _local_lock:
+            for name in names:
+                _local.pop(name, None)
+        shared = _shared()
+        if shared is not None:
+            shared.delete_many([_shared_key(name) for name in names])
+    drop()
+    transaction.on_commit(drop)
+
+
+def clear():
+    """
+        Очистка первого уровня кэша (память процесса)
+    """
+    with _local_lock:
+        _local.clear()
+
+
+def fos_types():
+    """
+        Типы ФОСов (в порядке добавления)
+    """
+    from app.models import FosType
+    return get(FOS_TYPES, lambda: list(FosType.objects.order_by('id')))
+
+
+def discipline_types():
+    """
+        Типы дисциплин (формы контроля знаний)
+    """
+    from app.models import DisciplineType
+    return get(DISCIPLINE_TYPES, lambda: list(DisciplineType.objects.order_by('id')))
+
+
+def qualifications():
+    """
+        Виды обучения
+    """
+    from app.models import Qualification
+    return get(QUALIFICATIONS, lambda: list(Qualification.objects.order_by('id')))
+
+
+def get_by_id(objects, pk):
+    """
+        Запись справочника по ID (None, если записи нет)
+    """
+    return next((obj for obj in objects if str(obj.id) == str(pk)), None)
+
+
+def _load_teachers():
+    from django.contrib.auth.models import User
+
+    from app.models import Discipline
+    teachers = []
+    users = User.objects.filter(
+        id__in=Discipline.users.through.objects.values('user_id')
+    ).only('id', 'username', 'first_name', 'last_name').order_by('last_name', 'first_name', 'username')
+    for u in users:
+        if u.first_name or u.last_name:
+            teachers.append(Teacher(u.id, u.last_name + " " + u.first_name, u.first_name + " " + u.last_name))
+        else:
+            teachers.append(Teacher(u.id, u.username, u.username))
+    return teachers
+
+
+def teachers():
+    """
+        Справочник преподавателей: пользователи, закрепленные хотя бы за одной дисциплиной
+        (по алфавиту фамилий)
+    """
+    return get(TEACHERS, _load_teachers)
+
+
+def years_choices():
+    """
+        Периоды обучения с 2000 года по текущий (от новых к старым)
+
+        Список вычисляется заново при смене года, поэтому новый учебный год появляется без перезапуска сервера.
+    """
+    year = datetime.date.today().year
+    return get('years_' + str(year), lambda: [
+        (str(y), str(y) + " - " + str(y + 1)) for y in reversed(range(2000, year + 1))
+    ])
@@ -0,0 +1,151 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.encoding import escape_uri_path
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+# размер блока, которым файл отдается клиенту
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(stat):
+    """
+        ETag файла по времени изменения и размеру
+    """
+    return quote_etag('{:x}-{:x}'.format(stat.st_mtime_ns, stat.st_size))
+
+
+def parse_range(header, size):
+    """
+        Разбор заголовка Range (поддерживается один диапазон байт)
+
+        Returns:
+            (начало, конец) включительно; None - если заголовок не задан или не поддерживается
+            (файл отдается целиком); False - если диапазон не может быть удовлетворен
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        # "bytes=-500" - последние 500 байт файла
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def if_range_matches(request, etag, mtime):
+    """
+        Проверка заголовка If-Range: диапазон отдается, только если файл не изменился
+    """
+    header = request.META.get('HTTP_IF_RANGE')
+    if not header:
+        return True
+    if header.startswith('"') or header.startswith('W/'):
+        return header == etag
+    header_mtime = parse_http_date_safe(header)
+    return header_mtime is not None and int(mtime) <= header_mtime
+
+
+def read_range(path, start, length):
+    """
+        Чтение части файла блоками
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def content_disposition(filename, as_attachment):
+    """
+        Заголовок Content-Disposition (имя файла с не-ASCII символами кодируется по RFC 5987)
+    """
+    disposition = 'attachment' if as_attachment else 'inline'
+    try:
+        filename.encode('ascii')
+        return '{}; filename="{}"'.format(disposition, filename.replace('\\', '\\\\').replace('"', r'\"'))
+    except UnicodeEncodeError:
+        return "{}; filename*=utf-8''{}".format(disposition, escape_uri_path(filename))
+
+
+def serve_file(request, path, filename=None, as_attachment=False, content_type=None):
+    """
+        Отдача файла с диска клиенту
+
+        Поддерживаются условные запросы (If-None-Match/If-Modified-Since), запросы части файла (Range)
+        и передача отдачи файла фронт-прокси (X-Sendfile/X-Accel-Redirect, см. настройку SENDFILE_BACKEND).
+
+        Args:
+            request: Запрос
+            path: Путь к файлу на диске
+            filename: Имя файла для скачивания (по-умолчанию - имя файла на диске)
+            as_attachment: Отдавать файл на скачивание, а не для просмотра в браузере
+            content_type: MIME-тип (по-умолчанию определяется по расширению файла)
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404('Файл не найден')
+
+    etag = file_etag(stat)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return not_modified
+
+    filename = filename or os.path.basename(path)
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    backend = settings.SENDFILE_BACKEND
+    if backend:
+        # сам файл отдает фронт-прокси, приложение только проверяет доступ и формирует заголовки
+        response = HttpResponse(content_type=content_type)
+        if backend == 'x-accel-redirect':
+            relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+            response['X-Accel-Redirect'] = escape_uri_path(settings.SENDFILE_URL + relative)
+        else:
+            response['X-Sendfile'] = path
+    else:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+        if byte_range is not None and not if_range_matches(request, etag, stat.st_mtime):
+            byte_range = None
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{}'.format(stat.st_size)
+            return response
+
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(read_range(path, start, end - start + 1), status=206,
+                                             content_type=content_type)
+            response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, stat.st_size)
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response.block_size = CHUNK_SIZE
+            response['Content-Length'] = str(stat.st_size)
+
+    response['Content-Disposition'] = content_disposition(filename, as_attachment)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
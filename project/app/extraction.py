@@ -0,0 +1,165 @@
+import os
+import re
+import zipfile
+
+import docx
+import openpyxl
+import xlrd
+from docx.oxml.ns import qn
+from pypdf import PdfReader
+
+from app import search
+from app.backends import atomic_write
+from app.models import DocumentPreview, DocumentText
+
+# чтение файлов документов: текст для поиска, количество страниц и начало документа для миниатюры (app.previews)
+# получаются за одно чтение файла (см. app.processing)
+
+# ограничение объема извлекаемого текста одного документа (символов)
+MAX_TEXT_LENGTH = 1000000
+
+# сколько строк и столбцов первого листа таблицы сохранять для миниатюры
+MAX_SHEET_ROWS = 40
+MAX_SHEET_COLUMNS = 5
+
+APP_PAGES_RE = re.compile(rb'<Pages>(\d+)</Pages>')
+
+
+class ParsedFile:
+    """
+        Прочитанный файл документа
+
+        Attributes:
+            parts: Части текста (абзацы, ячейки таблиц, страницы)
+            page_count: Количество страниц (для таблиц - листов)
+            unit: Что считается в page_count: страницы или листы (см. DocumentPreview)
+            lines: Строки начала текста (для миниатюры)
+            rows: Первые строки первого листа таблицы (для миниатюры; None - документ не таблица)
+    """
+
+    def __init__(self, parts, page_count, unit, lines=None, rows=None):
+        self.parts = parts
+        self.page_count = page_count
+        self.unit = unit
+        self.lines = lines or []
+        self.rows = rows
+
+    @property
+    def text(self):
+        text = '\n'.join(part.strip() for part in self.parts if part and part.strip())
+        return text[:MAX_TEXT_LENGTH]
+
+
+def docx_pages(path, document):
+    """
+        Количество страниц docx: из свойств, сохраненных Word (docProps/app.xml), но не меньше, чем разделено явными
+        разрывами страниц (свойства файлов, созданных не в Word, часто остаются от шаблона)
+    """
+    pages = len([br for br in document.element.body.iter(qn('w:br')) if br.get(qn('w:type')) == 'page']) + 1
+    with zipfile.ZipFile(path) as archive:
+        if 'docProps/app.xml' in archive.namelist():
+            match = APP_PAGES_RE.search(archive.read('docProps/app.xml'))
+            if match:
+                pages = max(pages, int(match.group(1)))
+    return pages
+
+
+def read_docx(path):
+    document = docx.Document(path)
+    lines = [p.text for p in document.paragraphs]
+    table_rows = [[cell.text for cell in row.cells] for table in document.tables for row in table.rows]
+    parts = lines + [cell for row in table_rows for cell in row]
+    if not any(line.strip() for line in lines):
+        # документ из одной таблицы
+        lines += [' | '.join(row) for row in table_rows]
+    return ParsedFile(parts, docx_pages(path, document), DocumentPreview.UNIT_PAGES, lines=lines)
+
+
+def read_xlsx(path):
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        parts = []
+        rows = []
+        for i, sheet in enumerate(workbook.worksheets):
+            for n, row in enumerate(sheet.iter_rows(values_only=True)):
+                parts.extend(str(value) for value in row if value is not None)
+                if i == 0 and n < MAX_SHEET_ROWS:
+                    rows.append(['' if value is None else str(value) for value in row[:MAX_SHEET_COLUMNS]])
+        return ParsedFile(parts, len(workbook.worksheets), DocumentPreview.UNIT_SHEETS, rows=rows)
+    finally:
+        workbook.close()
+
+
+def read_xls(path):
+    workbook = xlrd.open_workbook(path, on_demand=True)
+    try:
+        parts = []
+        rows = []
+        for i, sheet in enumerate(workbook.sheets()):
+            for n in range(sheet.nrows):
+                values = sheet.row_values(n)
+                parts.extend(str(value) for value in values if value != '')
+                if i == 0 and n < MAX_SHEET_ROWS:
+                    rows.append([str(value) for value in values[:MAX_SHEET_COLUMNS]])
+        return ParsedFile(parts, workbook.nsheets, DocumentPreview.UNIT_SHEETS, rows=rows)
+    finally:
+        workbook.release_resources()
+
+
+def read_pdf(path):
+    reader = PdfReader(path)
+    parts = [page.extract_text() or '' for page in reader.pages]
+    return ParsedFile(parts, len(parts), DocumentPreview.UNIT_PAGES, lines=parts[0].splitlines() if parts else [])
+
+
+# обработчики по расширениям файлов (doc и zip не читаются)
+READERS = {
+    'docx': read_docx,
+    'xlsx': read_xlsx,
+    'xls': read_xls,
+    'pdf': read_pdf,
+}
+
+
+def read_file(path):
+    """
+        Чтение файла документа
+
+        Returns:
+            ParsedFile; None, если формат не поддерживается или файл поврежден
+    """
+    reader = READERS.get(os.path.splitext(path)[1].lower().lstrip('.'))
+    if reader is None:
+        return None
+    try:
+        return reader(path)
+    except Exception:
+        # поврежденный файл или файл другого формата с подходящим расширением
+        return None
+
+
+def has_text(document_id, sha256):
+    """
+        Извлечен ли уже текст из файла документа с таким содержимым
+    """
+    return DocumentText.objects.filter(document_id=document_id, sha256=sha256).exists()
+
+
+def save_text(document, sha256, parsed):
+    """
+        Сохранение текста прочитанного файла документа (parsed - None, если файл не прочитан)
+        и обновление поискового индекса
+    """
+    content = parsed.text if parsed is not None else ''
+    with atomic_write():
+        DocumentText.objects.update_or_create(document_id=document.id, defaults={'sha256': sha256, 'content': content})
+        search.index_document(document)
+
+
+def remove_text(document):
+    """
+        Удаление текста документа, у которого нет файла
+    """
+    deleted, _ = DocumentText.objects.filter(document_id=document.id).delete()
+    if deleted:
+        search.index_document(document)
@@ -0,0 +1,408 @@
+import time
+import traceback
+
+import tablib
+from django import forms
+from django.apps import apps
+from django.conf import settings
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.urls import reverse
+from django.utils import timezone
+from import_export.forms import ImportForm
+from import_export.signals import post_import
+from import_export.widgets import ForeignKeyWidget, ManyToManyWidget, Widget
+
+from app import jobs
+from app.backends import atomic_write
+from app.models import ImportJob
+
+# массовый импорт (django-import-export): справочные значения всего файла загружаются заранее
+# одним запросом на модель, строки пишутся через bulk_create/bulk_update, связи многие-ко-многим -
+# массовой вставкой строк промежуточной таблицы
+#
+# фоновый импорт больших файлов: файл сохраняется в задаче импорта (ImportJob) и импортируется пулом фоновых
+# обработчиков порциями по IMPORT_CHUNK_SIZE строк, каждая порция - в своей транзакции вместе с отметкой о ходе
+# импорта; прерванный импорт продолжается с первой несохраненной порции
+
+# сколько строк с ошибками выводить в тексте ошибки задачи импорта
+MAX_REPORTED_ERRORS = 20
+
+
+class PreloadedForeignKeyWidget(ForeignKeyWidget):
+    """
+        ForeignKeyWidget, находящий запись по заранее загруженному словарю (см. preload)
+    """
+
+    def preload(self, values):
+        """
+            Загрузка записей со значениями values поля field одним запросом
+        """
+        self.objects = {
+            str(getattr(obj, self.field)): obj
+            for obj in self.model.objects.filter(**{self.field + '__in': set(values)})
+        }
+
+    def clean(self, value, row=None, **kwargs):
+        val = Widget.clean(self, value)
+        if not val:
+            return None
+        try:
+            return self.objects[str(val)]
+        except KeyError:
+            raise self.model.DoesNotExist(
+                '%s "%s" не найден(а)' % (self.model._meta.verbose_name, val)
+            )
+
+
+class PreloadedManyToManyWidget(ManyToManyWidget):
+    """
+        ManyToManyWidget, находящий записи по заранее загруженному словарю (см. preload)
+
+        Значения, для которых нет записей, пропускаются (как и в ManyToManyWidget).
+    """
+
+    def split(self, value):
+        if not value:
+            return []
+        if isinstance(value, (float, int)):
+            return [str(int(value))]
+        return [i.strip() for i in value.split(self.separator) if i.strip()]
+
+    def preload(self, values):
+        names = set()
+        for value in values:
+            names.update(self.split(value))
+        self.objects = {
+            str(getattr(obj, self.field)): obj
+            for obj in self.model.objects.filter(**{self.field + '__in': names})
+        }
+
+    def clean(self, value, row=None, **kwargs):
+        return [self.objects[name] for name in self.split(value) if name in self.objects]
+
+    def render(self, value, obj=None):
+        # при массовом импорте связи еще не сохранены и передаются списком
+        objects = value if isinstance(value, list) else value.all()
+        return self.separator.join(str(getattr(o, self.field)) for o in objects)
+
+
+class MissingPrimaryKeysError(Exception):
+    """
+        База данных не вернула ID записей, созданных массовой вставкой (без них не сохранить связи записей)
+    """
+    pass
+
+
+class BulkImportMixin:
+    """
+        Массовый импорт для ModelResource
+
+        - ссылки на справочники (PreloadedForeignKeyWidget, PreloadedManyToManyWidget) загружаются
+          одним запросом на модель перед импортом;
+        - существующие записи находятся одним запросом (в Meta ресурса нужно указать
+          instance_loader_class = CachedInstanceLoader), а повторная строка с ключом записи, созданной выше
+          в том же файле (порции), обновляет эту запись, а не создает вторую;
+        - записи сохраняются через bulk_create/bulk_update порциями batch_size;
+        - связи многие-ко-многим заменяются удалением и массовой вставкой строк промежуточной таблицы.
+
+        Сигналы сохранения моделей при этом не отправляются: действия обработчиков сигналов нужно
+        выполнить в after_bulk_save.
+    """
+
+    def before_import(self, dataset, using_transactions, dry_run, **kwargs):
+        for field in self.get_import_fields():
+            if hasattr(field.widget, 'preload'):
+                values = dataset[field.column_name] if field.column_name in (dataset.headers or []) else []
+                field.widget.preload([v for v in values if v not in (None, '')])
+        # записи, созданные в этом импорте: ключ строки (import_id_fields) => запись
+        self.created_by_key = {}
+        super().before_import(dataset, using_transactions, dry_run, **kwargs)
+
+    def get_m2m_fields(self):
+        return [f for f in self.get_import_fields() if isinstance(f.widget, ManyToManyWidget)]
+
+    def get_bulk_update_fields(self):
+        # связи многие-ко-многим сохраняются отдельно (см. bulk_save_related)
+        m2m = [f.attribute for f in self.get_m2m_fields()]
+        return [f for f in super().get_bulk_update_fields() if f not in m2m]
+
+    def save_m2m(self, obj, data, using_transactions, dry_run):
+        # связи запоминаются в объекте и сохраняются после массовой записи порции
+        obj._bulk_m2m = {
+            field.attribute: field.clean(data) for field in self.get_m2m_fields() if field.column_name in data
+        }
+
+    def get_row_key(self, row):
+        fields = [self.fields[f] for f in self.get_import_id_fields()]
+        if any(field.column_name not in row for field in fields):
+            return None
+        return tuple(field.clean(row) for field in fields)
+
+    def get_or_init_instance(self, instance_loader, row):
+        # CachedInstanceLoader знает только записи, существовавшие до импорта
+        key = self.get_row_key(row)
+        if key in self.created_by_key:
+            return self.created_by_key[key], False
+        instance, new = super().get_or_init_instance(instance_loader, row)
+        if new and key is not None:
+            self.created_by_key[key] = instance
+        return instance, new
+
+    def save_instance(self, instance, is_create, using_transactions=True, dry_run=False):
+        if not is_create and instance.pk is None:
+            # запись создана выше в этом файле и еще ждет массовой вставки (вставится с новыми значениями)
+            if any(obj is instance for obj in self.create_instances):
+                self.before_save_instance(instance, using_transactions, dry_run)
+                self.after_save_instance(instance, using_transactions, dry_run)
+                return
+            is_create = True
+        super().save_instance(instance, is_create, using_transactions, dry_run)
+
+    def get_instance(self, instance_loader, row):
+        instance = super().get_instance(instance_loader, row)
+        if instance is not None:
+            # связи существующей записи (загружены вместе с записями, см. get_queryset ресурса) запоминаются
+            # для сравнения "было/стало": копия записи "было" теряет загруженные связи
+            instance._m2m_original = {
+                field.attribute: list(getattr(instance, field.attribute).all()) for field in self.get_m2m_fields()
+            }
+        return instance
+
+    def export_field(self, field, obj):
+        # сравнение "было/стало" на странице подтверждения импорта: связи объекта еще не сохранены
+        if isinstance(field.widget, ManyToManyWidget):
+            for attr in ('_bulk_m2m', '_m2m_original'):
+                if field.attribute in getattr(obj, attr, {}):
+                    return field.widget.render(getattr(obj, attr)[field.attribute], obj)
+        return super().export_field(field, obj)
+
+    def bulk_create(self, using_transactions, dry_run, raise_errors, batch_size=None, result=None):
+        instances = list(self.create_instances)
+        errors = len(result.base_errors) if result is not None else 0
+        super().bulk_create(using_transactions, dry_run, raise_errors, batch_size=batch_size, result=result)
+        if result is not None and len(result.base_errors) > errors:
+            # вставка не удалась, ошибка уже в результате импорта
+            return
+        if (using_transactions or not dry_run) and any(obj.pk is None for obj in instances):
+            # ошибка импорта, как и ошибка вставки: импорт откатывается, а ошибка показывается в результате импорта
+            try:
+                raise MissingPrimaryKeysError('База данных не вернула ID созданных записей: связи и действия '
+                                              'после сохранения не могут быть выполнены')
+            except MissingPrimaryKeysError as e:
+                self.handle_import_error(result, e, raise_errors)
+            return
+        self.bulk_save_related(instances, using_transactions, dry_run)
+
+    def bulk_update(self, using_transactions, dry_run, raise_errors, batch_size=None, result=None):
+        instances = list(self.update_instances)
+        super().bulk_update(using_transactions, dry_run, raise_errors, batch_size=batch_size, result=result)
+        self.bulk_save_related(instances, using_transactions, dry_run)
+
+    def bulk_save_related(self, instances, using_transactions, dry_run):
+        """
+            Сохранение связей многие-ко-многим порции записей и действия после сохранения
+        """
+        if not instances or (not using_transactions and dry_run):
+            return
+        instances = [obj for obj in instances if obj.pk is not None]
+        model = self._meta.model
+        for field in self.get_m2m_fields():
+            rel_field = model._meta.get_field(field.attribute)
+            through = rel_field.remote_field.through
+            source = rel_field.m2m_field_name() + '_id'
+            target = rel_field.m2m_reverse_field_name() + '_id'
+            changed = [obj for obj in instances if field.attribute in getattr(obj, '_bulk_m2m', {})]
+            if not changed:
+                continue
+            through.objects.filter(**{source + '__in': [obj.pk for obj in changed]}).delete()
+            through.objects.bulk_create([
+                through(**{source: obj.pk, target: related.pk})
+                for obj in changed for related in obj._bulk_m2m[field.attribute]
+            ], batch_size=self._meta.batch_size, ignore_conflicts=True)
+        self.after_bulk_save(instances, dry_run)
+
+    def after_bulk_save(self, instances, dry_run):
+        """
+            Действия после массового сохранения порции записей (вместо обработчиков сигналов моделей)
+        """
+        pass
+
+
+class ChunkImportError(Exception):
+    """
+        Ошибки в строках порции импорта (порция не сохранена)
+    """
+    pass
+
+
+def read_dataset(job, model_admin):
+    """
+        Чтение файла задачи импорта в tablib.Dataset
+    """
+    input_format = model_admin.get_import_formats()[job.input_format]()
+    with job.file.open('rb') as f:
+        data = f.read()
+    if not input_format.is_binary():
+        data = data.decode(model_admin.from_encoding)
+    return input_format.create_dataset(data)
+
+
+def format_errors(result, offset):
+    """
+        Текст ошибок результата импорта порции (номера строк - от начала файла)
+    """
+    lines = ['Ошибка: ' + str(error.error) for error in result.base_errors]
+    for number, errors in result.row_errors():
+        lines += ['Строка ' + str(offset + number) + ': ' + str(error.error) for error in errors]
+    for row in result.invalid_rows:
+        lines.append('Строка ' + str(offset + row.number) + ': ' + '; '.join(row.error.messages))
+    if len(lines) > MAX_REPORTED_ERRORS:
+        lines = lines[:MAX_REPORTED_ERRORS] + ['... и еще ' + str(len(lines) - MAX_REPORTED_ERRORS)]
+    return '\n'.join(lines)
+
+
+def import_chunk(job, resource, chunk):
+    """
+        Импорт порции строк в одной транзакции с отметкой о ходе импорта
+
+        Если в строках порции есть ошибки, порция не сохраняется и выбрасывается ChunkImportError.
+    """
+    started = time.perf_counter()
+    with atomic_write():
+        result = resource.import_data(chunk, dry_run=False, raise_errors=False, use_transactions=True,
+                                      rollback_on_validation_errors=True, user=job.user, file_name=job.file_name)
+        if result.has_errors() or result.has_validation_errors():
+            raise ChunkImportError(format_errors(result, job.processed_rows))
+        job.processed_rows += chunk.height
+        job.new_rows += result.totals['new']
+        job.updated_rows += result.totals['update']
+        job.skipped_rows += result.totals['skip']
+        seconds = time.perf_counter() - started
+        job.chunks = job.chunks + [{
+            'number': len(job.chunks) + 1,
+            'rows': chunk.height,
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(chunk.height / seconds, 1) if seconds else None,
+        }]
+        job.save(update_fields=['processed_rows', 'new_rows', 'updated_rows', 'skipped_rows', 'chunks',
+                                'updated_at'])
+
+
+def run_import_job(job_id):
+    """
+        Выполнение (продолжение) задачи импорта с первой несохраненной порции
+
+        Returns:
+            True, если задача была выполнена этим вызовом
+    """
+    # захватываем задачу атомарно, чтобы ее не выполнили два обработчика одновременно
+    claimed = ImportJob.objects.filter(pk=job_id, status=ImportJob.STATUS_PENDING).update(
+        status=ImportJob.STATUS_RUNNING, started_at=timezone.now(), updated_at=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    job = ImportJob.objects.get(pk=job_id)
+    try:
+        model_admin = admin.site._registry[apps.get_model(job.model)]
+        dataset = read_dataset(job, model_admin)
+        if job.total_rows != dataset.height:
+            job.total_rows = dataset.height
+            job.save(update_fields=['total_rows', 'updated_at'])
+        resource_class = model_admin.get_import_resource_classes()[job.resource]
+        while job.processed_rows < dataset.height:
+            chunk = tablib.Dataset(*dataset[job.processed_rows:job.processed_rows + job.chunk_size],
+                                   headers=dataset.headers)
+            import_chunk(job, resource_class(), chunk)
+        post_import.send(sender=None, model=model_admin.model)
+        job.status = ImportJob.STATUS_DONE
+        job.error = ''
+    except ChunkImportError as e:
+        job.status = ImportJob.STATUS_FAILED
+        job.error = str(e)
+    except Exception:
+        print(traceback.format_exc())
+        job.status = ImportJob.STATUS_FAILED
+        job.error = traceback.format_exc()
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+    return True
+
+
+def enqueue_import(model_admin, form, user=None):
+    """
+        Постановка импорта файла из формы импорта админки в очередь
+
+        Задача передается пулу фоновых обработчиков после фиксации транзакции. Если процесс будет перезапущен
+        до ее завершения - задачу продолжит команда run_import_jobs.
+    """
+    import_file = form.cleaned_data['import_file']
+    job = ImportJob(
+        model=model_admin.model._meta.label_lower,
+        resource=int(form.cleaned_data.get('resource') or 0),
+        input_format=int(form.cleaned_data['input_format']),
+        file_name=import_file.name,
+        chunk_size=settings.IMPORT_CHUNK_SIZE,
+        user=user,
+    )
+    job.file.save(import_file.name, import_file)
+    jobs.defer(run_import_job, job.pk)
+    return job
+
+
+def resume_import(job):
+    """
+        Повторный запуск завершившейся ошибкой задачи импорта (с первой несохраненной порции)
+
+        Returns:
+            True, если задача поставлена в очередь
+    """
+    resumed = ImportJob.objects.filter(pk=job.pk, status=ImportJob.STATUS_FAILED).update(
+        status=ImportJob.STATUS_PENDING, finished_at=None, updated_at=timezone.now()
+    )
+    if resumed:
+        jobs.defer(run_import_job, job.pk)
+    return bool(resumed)
+
+
+def run_pending_imports():
+    """
+        Выполнение всех задач импорта, ожидающих в очереди
+
+        Returns:
+            Количество выполненных задач
+    """
+    done = 0
+    for job_id in ImportJob.objects.filter(status=ImportJob.STATUS_PENDING).order_by('id').values_list('id', flat=True):
+        if run_import_job(job_id):
+            done += 1
+    return done
+
+
+class ChunkedImportForm(ImportForm):
+    """
+        Форма импорта с возможностью импорта в фоне порциями
+    """
+    background = forms.BooleanField(
+        required=False, label='Импортировать в фоне по частям (для больших файлов, без предварительного просмотра)'
+    )
+
+
+class ChunkedImportMixin:
+    """
+        Фоновый импорт порциями для ImportMixin: если в форме импорта отмечен импорт в фоне, файл ставится
+        в очередь задач импорта вместо предварительного просмотра, пользователь переходит на страницу хода импорта
+    """
+    import_form_class = ChunkedImportForm
+
+    def import_action(self, request, *args, **kwargs):
+        if request.method == 'POST' and request.POST.get('background'):
+            if not self.has_import_permission(request):
+                raise PermissionDenied
+            form = self.create_import_form(request)
+            if form.is_valid():
+                job = enqueue_import(self, form, user=request.user)
+                return redirect(reverse('import_job', args=(job.pk,)))
+        return super().import_action(request, *args, **kwargs)
@@ -0,0 +1,167 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+# замеры запросов к серверу: количество SQL-запросов, суммарное время SQL, повторяющиеся запросы (признак N+1)
+# и полное время обработки запроса
+#
+# замеры последних INSTRUMENTATION_BUFFER_SIZE запросов хранятся в памяти процесса (страница /admin/instrumentation
+# для супер-администратора) и, если INSTRUMENTATION_LOG, пишутся в лог app.instrumentation строками JSON
+
+logger = logging.getLogger('app.instrumentation')
+
+# сколько повторяющихся запросов (с наибольшим числом повторов) сохранять в замере
+MAX_DUPLICATES = 5
+
+# замеры последних запросов к серверу
+_records = deque()
+_records_lock = threading.Lock()
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+\b')
+PLACEHOLDERS_RE = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+
+
+def fingerprint(sql):
+    """
+        Отпечаток SQL-запроса: текст запроса без значений (запросы, отличающиеся только параметрами, совпадают)
+    """
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = PLACEHOLDERS_RE.sub('(...)', sql)
+    return ' '.join(sql.split())
+
+
+class QueryRecorder:
+    """
+        Обработчик connection.execute_wrapper: считает запросы, их время и отпечатки
+
+        Attributes:
+            count: Количество запросов
+            seconds: Суммарное время запросов в секундах
+            fingerprints: Количество запросов по отпечаткам
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        """
+            Повторяющиеся запросы: (отпечаток, количество повторов), от наиболее частых
+        """
+        return [(sql, count) for sql, count in self.fingerprints.most_common(MAX_DUPLICATES) if count > 1]
+
+
+def add_record(record):
+    """
+        Добавление замера в буфер (самые старые замеры вытесняются)
+    """
+    with _records_lock:
+        _records.append(record)
+        while len(_records) > settings.INSTRUMENTATION_BUFFER_SIZE:
+            _records.popleft()
+
+
+def get_records():
+    """
+        Замеры последних запросов (от новых к старым)
+    """
+    with _records_lock:
+        return list(reversed(_records))
+
+
+def clear():
+    """
+        Очистка буфера замеров
+    """
+    with _records_lock:
+        _records.clear()
+
+
+def summary(records):
+    """
+        Сводка замеров по представлениям (от самых медленных в среднем)
+    """
+    views = {}
+    for record in records:
+        views.setdefault(record['view'], []).append(record)
+    rows = []
+    for view, items in views.items():
+        rows.append({
+            'view': view,
+            'requests': len(items),
+            'avg_queries': round(sum(r['queries'] for r in items) / len(items), 1),
+            'max_queries': max(r['queries'] for r in items),
+            'avg_sql_ms': round(sum(r['sql_ms'] for r in items) / len(items), 1),
+            'avg_wall_ms': round(sum(r['wall_ms'] for r in items) / len(items), 1),
+            'max_wall_ms': max(r['wall_ms'] for r in items),
+            'max_duplicates': max((count for r in items for sql, count in r['duplicates']), default=0),
+        })
+    return sorted(rows, key=lambda row: row['avg_wall_ms'], reverse=True)
+
+
+class InstrumentationMiddleware:
+    """
+        Замер запросов к серверу (включается переменной INSTRUMENTATION)
+
+        Запросы к статике, загруженным файлам и к странице замеров не замеряются.
+    """
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.skip_prefixes = tuple(p for p in (settings.STATIC_URL, settings.MEDIA_URL) if p and p != '/')
+
+    def __call__(self, request):
+        if request.path.startswith(self.skip_prefixes):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            response = self.get_response(request)
+        wall = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = (match.view_name or match._func_path) if match else None
+        if view == 'instrumentation':
+            return response
+
+        record = {
+            'time': timezone.now().isoformat(timespec='seconds'),
+            'method': request.method,
+            'path': request.path,
+            'view': view or '-',
+            'status': response.status_code,
+            'queries': recorder.count,
+            'sql_ms': round(recorder.seconds * 1000, 1),
+            'wall_ms': round(wall * 1000, 1),
+            'duplicates': recorder.duplicates(),
+        }
+        add_record(record)
+        if settings.INSTRUMENTATION_LOG:
+            logger.info(json.dumps(record, ensure_ascii=False))
+        return response
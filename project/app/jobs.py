@@ -0,0 +1,188 @@
+import os
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from app.backends import atomic_write
+from app.models import ReportJob
+from app.reports import DisciplinesSummary, TeacherFosSummary, write_disciplines_report, write_fos_report
+
+# пул фоновых обработчиков задач (создается при первой постановке задачи в очередь)
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def build_disciplines_report(job, path):
+    """
+        Формирование отчета дисциплин заданного периода обучения
+    """
+    summary = DisciplinesSummary(years=job.params.get('years'))
+    write_disciplines_report(path, summary, job.params.get('base_url', ''))
+
+
+def build_fos_report(job, path):
+    """
+        Формирование отчета ФОСов преподавателя
+    """
+    teacher = User.objects.get(pk=job.params['teacher'])
+    write_fos_report(path, teacher, TeacherFosSummary(teacher.id))
+
+
+# обработчики задач по видам отчетов
+BUILDERS = {
+    ReportJob.KIND_DISCIPLINES: build_disciplines_report,
+    ReportJob.KIND_FOS: build_fos_report,
+}
+
+
+def get_executor():
+    """
+        Получение пула фоновых обработчиков
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.REPORT_JOB_WORKERS, thread_name_prefix='report-job')
+        return _executor
+
+
+def enqueue(kind, params, user=None):
+    """
+        Постановка задачи формирования отчета в очередь
+
+        Задача сохраняется в БД и передается пулу обработчиков после фиксации транзакции.
+        Если процесс будет перезапущен до ее выполнения - задачу подберет команда run_report_jobs.
+        Заодно удаляются устаревшие задачи (см. cleanup).
+    """
+    cleanup()
+    job = ReportJob.objects.create(kind=kind, params=params, user=user)
+    transaction.on_commit(lambda: submit(job.pk))
+    return job
+
+
+def submit(job_id):
+    """
+        Передача задачи на выполнение (в пул или синхронно, если REPORT_JOBS_SYNC)
+    """
+    if settings.REPORT_JOBS_SYNC:
+        run_job(job_id)
+    else:
+        get_executor().submit(_run_in_worker, job_id)
+
+
+def defer(func, *args):
+    """
+        Выполнение функции в пуле фоновых обработчиков после фиксации транзакции
+        (синхронно, если REPORT_JOBS_SYNC)
+    """
+    def run():
+        if settings.REPORT_JOBS_SYNC:
+            func(*args)
+        else:
+            get_executor().submit(_call_in_worker, func, *args)
+    transaction.on_commit(run)
+
+
+def _call_in_worker(func, *args):
+    # ошибки фоновых функций выводим в консоль, чтобы они не терялись внутри пула
+    close_old_connections()
+    try:
+        func(*args)
+    except Exception:
+        print(traceback.format_exc())
+    finally:
+        close_old_connections()
+
+
+def _run_in_worker(job_id):
+    # обработчик работает в отдельном потоке со своим подключением к БД
+    close_old_connections()
+    try:
+        run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def run_job(job_id):
+    """
+        Выполнение задачи формирования отчета
+
+        Returns:
+            True, если задача была выполнена этим вызовом
+    """
+    # захватываем задачу атомарно, чтобы ее не выполнили два обработчика одновременно
+    claimed = ReportJob.objects.filter(pk=job_id, status=ReportJob.STATUS_PENDING).update(
+        status=ReportJob.STATUS_RUNNING, updated_at=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    job = ReportJob.objects.get(pk=job_id)
+    name = os.path.join(job.file.field.upload_to, uuid.uuid4().hex + '.xlsx')
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    tmp_path = path + '.part'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # отчет пишется сразу на диск, файл становится доступен только после полной записи
+        BUILDERS[job.kind](job, tmp_path)
+        os.replace(tmp_path, path)
+        job.file.name = name
+        job.status = ReportJob.STATUS_DONE
+    except Exception:
+        print(traceback.format_exc())
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        job.status = ReportJob.STATUS_FAILED
+        job.error = traceback.format_exc()
+    job.finished_at = timezone.now()
+    job.save(update_fields=['file', 'status', 'error', 'finished_at', 'updated_at'])
+    return True
+
+
+def run_pending():
+    """
+        Выполнение всех задач, ожидающих в очереди
+
+        Returns:
+            Количество выполненных задач
+    """
+    done = 0
+    for job_id in ReportJob.objects.filter(status=ReportJob.STATUS_PENDING).order_by('id').values_list('id', flat=True):
+        if run_job(job_id):
+            done += 1
+    return done
+
+
+def delete_files(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def cleanup():
+    """
+        Удаление завершенных задач старше REPORT_JOB_KEEP_DAYS дней вместе с файлами отчетов
+        (файлы удаляются после фиксации транзакции)
+
+        Returns:
+            Количество удаленных задач
+    """
+    finished = ReportJob.objects.filter(
+        status__in=(ReportJob.STATUS_DONE, ReportJob.STATUS_FAILED),
+        finished_at__lt=timezone.now() - timedelta(days=settings.REPORT_JOB_KEEP_DAYS),
+    )
+    with atomic_write():
+        jobs = list(finished.values_list('id', 'file'))
+        if not jobs:
+            return 0
+        ReportJob.objects.filter(pk__in=[job_id for job_id, name in jobs]).delete()
+        names = [name for job_id, name in jobs if name]
+        transaction.on_commit(lambda: delete_files(names))
+    return len(jobs)
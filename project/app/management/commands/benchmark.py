@@ -0,0 +1,283 @@
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+import django
+import tablib
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from app import cache, merging
+from app.instrumentation import QueryRecorder
+from app.models import Fos
+from app.reports import DisciplinesSummary, TeacherFosSummary, write_disciplines_report, write_fos_report
+from app.streaming import spool
+from app.synthetic import SyntheticDepartment
+
+
+def measure(action, repeat):
+    """
+        Замер действия: прогревочный запуск, затем repeat запусков
+
+        Returns:
+            Медиана и минимум времени в мс, количество SQL-запросов последнего запуска
+    """
+    action()
+    times = []
+    recorder = None
+    for _ in range(repeat):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            started = time.perf_counter()
+            action()
+            times.append(time.perf_counter() - started)
+    return {
+        'median_ms': round(statistics.median(times) * 1000, 2),
+        'min_ms': round(min(times) * 1000, 2),
+        'queries': recorder.count,
+    }
+
+
+@contextmanager
+def throwaway_database():
+    """
+        Временная БД (как у тестов: рядом с настроенной, с примененными миграциями) и временный MEDIA_ROOT:
+        замеры не меняют рабочие данные, статистику ФОСов, поисковый индекс и файлы документов
+
+        Для PostgreSQL пользователю БД нужно право CREATEDB.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix='benchmark-')
+    settings_dict = connection.settings_dict
+    test_name = settings_dict['TEST'].get('NAME')
+    if connection.vendor == 'sqlite':
+        settings_dict['TEST']['NAME'] = os.path.join(tmp_dir, 'benchmark.sqlite3')
+    else:
+        settings_dict['TEST']['NAME'] = settings_dict['NAME'] + '_benchmark'
+    old_name = settings_dict['NAME']
+    try:
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # общий кэш справочников относится к рабочей БД
+            with override_settings(MEDIA_ROOT=os.path.join(tmp_dir, 'media'), REFERENCE_CACHE_ALIAS=''):
+                cache.clear()
+                yield
+        finally:
+            cache.clear()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+    finally:
+        settings_dict['TEST']['NAME'] = test_name
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """
+        Сравнение результатов с базовыми
+
+        Замедление считается регрессией, если медиана выросла больше чем в (1 + tolerance) раз и больше чем
+        на min_delta_ms мс; рост количества SQL-запросов - регрессия всегда.
+
+        Returns:
+            Список строк сравнения: (сценарий, базовое значение, текущее значение, регрессия)
+    """
+    rows = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        slower = (current['median_ms'] > base['median_ms'] * (1 + tolerance)
+                  and current['median_ms'] - base['median_ms'] > min_delta_ms)
+        rows.append((name, base, current, slower or current['queries'] > base['queries']))
+    return rows
+
+
+class Command(BaseCommand):
+
+    help = 'Замер производительности списков админки, отчетов, объединения документов и импорта ' \
+           'на синтетической кафедре'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--disciplines', type=int, default=100, help='Количество дисциплин (10 - 10000)')
+        parser.add_argument('--teachers', type=int, help='Количество преподавателей (по-умолчанию - дисциплин / 5)')
+        parser.add_argument('--groups', type=int, help='Количество учебных групп (по-умолчанию - дисциплин / 10)')
+        parser.add_argument('--foses-per-discipline', type=int, default=3, help='Среднее количество ФОСов дисциплины')
+        parser.add_argument('--documents-per-fos', type=int, default=2, help='Количество документов ФОСа')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора кафедры')
+        parser.add_argument('--repeat', type=int, default=5, help='Количество замеров каждого сценария')
+        parser.add_argument('--only', nargs='+', help='Выполнить только сценарии с указанными префиксами имен')
+        parser.add_argument('--output', help='Записать результаты в файл JSON')
+        parser.add_argument('--baseline', help='Сравнить результаты с базовыми (файл JSON, записанный --output)')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Допустимое замедление относительно базовых результатов (0.25 - на 25%%)')
+        parser.add_argument('--min-delta-ms', type=float, default=5,
+                            help='Замедление меньше этого значения в мс не считается регрессией')
+        parser.add_argument('--current-database', action='store_true',
+                            help='Замерять на настроенной БД, а не на временной (кафедра создается в ней и '
+                                 'удаляется после замеров)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Не удалять синтетическую кафедру после замеров (с --current-database)')
+        parser.add_argument('--json', action='store_true', help='Вывести результаты в формате JSON')
+
+    def handle(self, *args, **options):
+        if options['keep'] and not options['current_database']:
+            raise CommandError('--keep используется только с --current-database')
+        if options['current_database']:
+            report = self.run_benchmark(options)
+        else:
+            with throwaway_database():
+                report = self.run_benchmark(options)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+        comparison = []
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            if baseline.get('scale') != report['scale']:
+                self.stderr.write('Размер кафедры отличается от базового замера: ' + json.dumps(baseline.get('scale')))
+            comparison = compare(report['results'], baseline['results'], options['tolerance'], options['min_delta_ms'])
+            report['regressions'] = [name for name, base, current, regression in comparison if regression]
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False))
+        else:
+            self.print_report(report, comparison)
+
+        if report.get('regressions'):
+            raise CommandError('Регрессии производительности: ' + ', '.join(report['regressions']))
+
+    def run_benchmark(self, options):
+        """
+            Создание синтетической кафедры и замер сценариев
+
+            Returns:
+                Отчет о замерах
+        """
+        prefix = 'bench' + uuid.uuid4().hex[:6]
+        department = SyntheticDepartment(
+            options['disciplines'], teachers=options['teachers'], groups=options['groups'],
+            foses_per_discipline=options['foses_per_discipline'], documents_per_fos=options['documents_per_fos'],
+            prefix=prefix, seed=options['seed'],
+        )
+        started = time.perf_counter()
+        scale = department.generate()
+        generation_s = round(time.perf_counter() - started, 2)
+        try:
+            results = self.run_scenarios(department, options)
+        finally:
+            # временная БД удаляется целиком
+            if options['current_database'] and not options['keep']:
+                department.delete()
+
+        return {
+            'scale': scale,
+            'generation_s': generation_s,
+            'repeat': options['repeat'],
+            'vendor': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'results': results,
+        }
+
+    def run_scenarios(self, department, options):
+        """
+            Замер всех сценариев (или выбранных --only)
+        """
+        admin = User.objects.create_superuser(department.prefix + '_admin', password=uuid.uuid4().hex)
+        client = Client()
+        client.force_login(admin)
+
+        def get(url):
+            def action():
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError(url + ': HTTP ' + str(response.status_code))
+                # отдача файла считается частью сценария
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                    response.close()
+            return action
+
+        disciplines = department.discipline_queryset()
+        teacher = department.users().filter(discipline__in=disciplines).annotate(
+            total=Count('discipline')
+        ).order_by('-total').first()
+        fos = Fos.objects.filter(discipline__in=disciplines).annotate(
+            total=Count('document')
+        ).order_by('-total', 'id').first()
+
+        def report_disciplines():
+            write_disciplines_report(spool(), DisciplinesSummary(), 'http://localhost/')
+
+        def report_fos():
+            write_fos_report(spool(), teacher, TeacherFosSummary(teacher.id))
+
+        merge = get(reverse('merge_documents', args=(fos.id,)))
+
+        def merge_documents():
+            # замеряется объединение, а не отдача ранее объединенного файла
+            merging.invalidate(fos.id)
+            merge()
+
+        from app.admin import DisciplineImportResource, UserResource
+        discipline_rows = tablib.Dataset(headers=['name', 'type', 'qualification', 'groups', 'users'])
+        for d in disciplines.select_related('type', 'qualification').prefetch_related('users', 'groups'):
+            discipline_rows.append([d.name, d.type.name, d.qualification.name if d.qualification else '',
+                                    '|'.join(g.name for g in d.groups.all()),
+                                    '|'.join(u.username for u in d.users.all())])
+        user_rows = tablib.Dataset(*department.users().exclude(pk=admin.pk).values_list(
+            'username', 'first_name', 'last_name'
+        ), headers=['username', 'first_name', 'last_name'])
+
+        def import_disciplines():
+            DisciplineImportResource().import_data(discipline_rows, dry_run=True)
+
+        def import_users():
+            UserResource().import_data(user_rows, dry_run=True)
+
+        scenarios = {
+            'changelist:fos': get(reverse('admin:app_fos_changelist')),
+            'changelist:discipline': get(reverse('admin:app_discipline_changelist')),
+            'changelist:qualification': get(reverse('admin:app_qualification_changelist')),
+            'changelist:group': get(reverse('admin:app_group_changelist')),
+            'report:disciplines': report_disciplines,
+            'report:fos': report_fos,
+            'merge_documents': merge_documents,
+            'import:disciplines': import_disciplines,
+            'import:users': import_users,
+        }
+
+        results = {}
+        for name, action in scenarios.items():
+            if options['only'] and not any(name.startswith(p) for p in options['only']):
+                continue
+            if options['verbosity'] > 1:
+                self.stderr.write(name + '...')
+            results[name] = measure(action, options['repeat'])
+        return results
+
+    def print_report(self, report, comparison):
+        self.stdout.write('Кафедра: {teachers} преподавателей, {groups} групп, {disciplines} дисциплин, '
+                          '{foses} ФОСов, {documents} документов'.format(**report['scale']))
+        self.stdout.write('Создание кафедры: {} с, БД: {}'.format(report['generation_s'], report['vendor']))
+        for name, r in report['results'].items():
+            self.stdout.write('{}: медиана {} мс, минимум {} мс, SQL-запросов {}'.format(
+                name, r['median_ms'], r['min_ms'], r['queries']
+            ))
+        for name, base, current, regression in comparison:
+            line = '{}: {} мс -> {} мс, SQL-запросов {} -> {}'.format(
+                name, base['median_ms'], current['median_ms'], base['queries'], current['queries']
+            )
+            self.stdout.write(self.style.ERROR(line) if regression else self.style.SUCCESS(line))
@@ -0,0 +1,171 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from app import blobs
+from app.models import Discipline, DisciplineType, Document, Fos, FosType
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Command(BaseCommand):
+
+    # замер выполняется на рабочей БД (ее пропускная способность и замеряется): данные замера добавляются в нее
+    # и удаляются после замера, а файлы документов записываются во временный каталог
+    help = ('Замер пропускной способности БД: одновременное чтение списков админки и загрузка документов '
+            '(временные записи замера добавляются в рабочую БД и удаляются после замера)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help='Количество потоков, читающих списки админки')
+        parser.add_argument('--writers', type=int, default=2, help='Количество потоков, загружающих документы')
+        parser.add_argument('--duration', type=float, default=10, help='Длительность замера в секундах')
+        parser.add_argument('--file-size', type=int, default=64, help='Размер загружаемого файла в Кб')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в формате JSON')
+
+    def handle(self, *args, **options):
+        # файлы документов замера не попадают в рабочий MEDIA_ROOT
+        media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                report = self.measure(options)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False))
+            return
+
+        self.stdout.write('БД: {vendor}, потоков чтения: {readers}, загрузки: {writers}, время: {duration} с'.format(
+            **report
+        ))
+        for kind, title in (('read', 'Чтение списков'), ('upload', 'Загрузка документов')):
+            line = '{}: {count} операций ({per_second}/с), p50 {p50_ms} мс, p95 {p95_ms} мс, ошибок: {errors}'.format(
+                title, **report[kind]
+            )
+            self.stdout.write(self.style.ERROR(line) if report[kind]['errors'] else self.style.SUCCESS(line))
+            if report[kind]['first_error']:
+                self.stdout.write('  ' + report[kind]['first_error'])
+
+    def measure(self, options):
+        """
+            Замер на временных записях рабочей БД
+
+            Returns:
+                Результаты замера
+        """
+        marker = 'benchmark-' + uuid.uuid4().hex[:8]
+        user = User.objects.create_superuser(marker, password=uuid.uuid4().hex)
+        dis_type = DisciplineType.objects.create(name=marker)
+        fos_type = FosType.objects.create(name=marker)
+        discipline = Discipline.objects.create(name=marker, type=dis_type)
+        fos = Fos.objects.create(name=marker, type=fos_type, discipline=discipline)
+
+        stop = threading.Event()
+        results = {'read': [], 'upload': []}
+        errors = {'read': [], 'upload': []}
+        lock = threading.Lock()
+        content = os.urandom(options['file_size'] * 1024)
+        urls = [reverse('admin:app_discipline_changelist'), reverse('admin:app_fos_changelist')]
+
+        def run(kind, action):
+            # каждый поток работает со своим соединением с БД
+            times = []
+            failed = []
+            try:
+                state = action()
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    try:
+                        state()
+                        times.append(time.perf_counter() - start)
+                    except Exception as e:
+                        failed.append(type(e).__name__ + ': ' + str(e))
+            finally:
+                connection.close()
+                with lock:
+                    results[kind].extend(times)
+                    errors[kind].extend(failed)
+
+        def reader():
+            client = Client()
+            client.force_login(user)
+            counter = iter(range(10 ** 9))
+
+            def read():
+                response = client.get(urls[next(counter) % len(urls)])
+                if response.status_code != 200:
+                    raise RuntimeError('HTTP ' + str(response.status_code))
+            return read
+
+        def writer():
+            def upload():
+                # все потоки загружают одинаковое содержимое - файл хранится один раз; файл, записанный
+                # до ошибки сохранения документа, удаляется вместе с остальными файлами замера
+                Document(name=marker, fos=fos).path.save(marker + '.txt', ContentFile(content))
+            return upload
+
+        threads = [threading.Thread(target=run, args=('read', reader)) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=run, args=('upload', writer)) for _ in range(options['writers'])]
+        started = time.perf_counter()
+        try:
+            # первый запрос к админке создает тему оформления, выполняем его до запуска потоков
+            warmup = Client()
+            warmup.force_login(user)
+            warmup.get(urls[0])
+
+            started = time.perf_counter()
+            for t in threads:
+                t.start()
+            time.sleep(options['duration'])
+        finally:
+            stop.set()
+            for t in threads:
+                if t.is_alive():
+                    t.join()
+            elapsed = time.perf_counter() - started
+
+            # удаляем данные замера; файлы документов без ссылок удаляются через учет ссылок (см. app.blobs)
+            names = set(Document.objects.filter(fos=fos).values_list('path', flat=True))
+            for document in Document.objects.filter(fos=fos):
+                document.delete()
+            blobs.collect(names=names)
+            fos.delete()
+            discipline.delete()
+            dis_type.delete()
+            fos_type.delete()
+            user.delete()
+
+        report = {
+            'vendor': connection.vendor,
+            'readers': options['readers'],
+            'writers': options['writers'],
+            'duration': round(elapsed, 3),
+        }
+        for kind in ('read', 'upload'):
+            times = results[kind]
+            report[kind] = {
+                'count': len(times),
+                'per_second': round(len(times) / elapsed, 2),
+                'p50_ms': round(percentile(times, 50) * 1000, 2),
+                'p95_ms': round(percentile(times, 95) * 1000, 2),
+                'errors': len(errors[kind]),
+                'first_error': errors[kind][0] if errors[kind] else None,
+            }
+
+        return report
@@ -0,0 +1,81 @@
+import json
+import multiprocessing
+import resource
+
+import tablib
+from django.core.management.base import BaseCommand
+from import_export.formats import base_formats
+
+from app.streaming import spool, write_rows
+
+HEADERS = ['Дисциплина', 'Форма контроля знаний', 'Вид обучения', 'Преподаватель', 'Учебные группы',
+           'Оценочные средства']
+
+
+def make_rows(count):
+    # синтетические строки, по объему похожие на выгрузку дисциплин
+    for i in range(count):
+        yield [
+            'Дисциплина ' + str(i), 'Экзамен', 'Бакалавриат', 'Иван Иванов, Петр Петров',
+            'ИС-' + str(i % 40) + ', ПИ-' + str(i % 30), ', '.join('ФОС ' + str(j) for j in range(i % 7)),
+        ]
+
+
+def peak_rss():
+    # пиковый размер резидентной памяти процесса в Кб (Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def export_in_memory(rows):
+    dataset = tablib.Dataset(*make_rows(rows), headers=HEADERS)
+    return len(base_formats.XLSX().export_data(dataset))
+
+
+def export_streaming(rows):
+    output = spool()
+    write_rows(output, HEADERS, make_rows(rows))
+    output.seek(0, 2)
+    return output.tell()
+
+
+MODES = {
+    'in-memory': export_in_memory,
+    'streaming': export_streaming,
+}
+
+
+def measure(mode, rows, queue):
+    before = peak_rss()
+    size = MODES[mode](rows)
+    queue.put({'mode': mode, 'rows': rows, 'size': size, 'rss_kb': peak_rss() - before})
+
+
+class Command(BaseCommand):
+
+    help = 'Замер пикового расхода памяти (RSS) выгрузки в xlsx: в памяти (tablib) и построчной'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 50000],
+                            help='Количество строк выгрузки (можно указать несколько)')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в формате JSON')
+
+    def handle(self, *args, **options):
+        results = []
+        context = multiprocessing.get_context('fork')
+        for rows in options['rows']:
+            for mode in MODES:
+                # каждый замер - в отдельном процессе, т.к. пиковый RSS процесса не уменьшается
+                queue = context.Queue()
+                process = context.Process(target=measure, args=(mode, rows, queue))
+                process.start()
+                result = queue.get()
+                process.join()
+                result['rss_kb_per_10k_rows'] = round(result['rss_kb'] * 10000 / rows)
+                results.append(result)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+            return
+        for r in results:
+            self.stdout.write('{mode}: {rows} строк, файл {size} байт, прирост RSS {rss_kb} Кб '
+                              '({rss_kb_per_10k_rows} Кб на 10 тыс. строк)'.format(**r))
@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app import blobs, previews, uploads
+from app.models import document_storage
+
+
+class Command(BaseCommand):
+
+    help = ('Удалить файлы документов, на которые не ссылается ни один документ, их миниатюры '
+            'и устаревшие загрузки по частям')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=settings.DOCUMENT_BLOB_GRACE_HOURS,
+                            help='Удалять файлы, последняя ссылка на которые удалена раньше указанного кол-ва часов')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Предварительно пересчитать количество ссылок по таблице документов')
+        parser.add_argument('--orphans', action='store_true',
+                            help='Удалить также файлы каталога документов, о которых нет записей '
+                                 '(копии, оставшиеся после перехода на хранилище по содержимому, и сбои загрузки)')
+        parser.add_argument('--dry-run', action='store_true', help='Только вывести файлы, не удаляя их')
+
+    def handle(self, *args, **options):
+        grace = timedelta(hours=options['grace_hours'])
+        if options['rebuild']:
+            self.stdout.write('Исправлено записей о файлах: ' + str(blobs.rebuild()))
+
+        collected = blobs.collect(grace, dry_run=options['dry_run'])
+        size = sum(blob.size for blob in collected)
+        if options['verbosity'] > 1:
+            for blob in collected:
+                self.stdout.write(blob.name)
+
+        orphans = blobs.orphan_files(grace) if options['orphans'] else []
+        for name in orphans:
+            size += document_storage.size(name)
+            if options['verbosity'] > 1:
+                self.stdout.write(name)
+            if not options['dry_run']:
+                document_storage.delete(name)
+
+        if not options['dry_run']:
+            sessions = uploads.collect_sessions(timedelta(hours=settings.UPLOAD_SESSION_HOURS))
+            self.stdout.write('Удалено устаревших загрузок по частям: ' + str(sessions))
+            self.stdout.write('Удалено миниатюр удаленных файлов: ' + str(previews.collect()))
+
+        self.stdout.write(self.style.SUCCESS('{} файлов без ссылок: {}, файлов без записей: {}, {:.1f} Мб'.format(
+            'Найдено' if options['dry_run'] else 'Удалено', len(collected), len(orphans), size / 1024 / 1024
+        )))
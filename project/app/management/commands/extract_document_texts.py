@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from app.models import Document
+from app.processing import process_document
+
+
+class Command(BaseCommand):
+
+    help = 'Извлечь текст из файлов документов для поиска (файлы без изменений пропускаются)'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write('Извлечение текста документов...')
+        extracted = 0
+        for document_id in Document.objects.order_by('id').values_list('id', flat=True).iterator():
+            if process_document(document_id, preview=False):
+                extracted += 1
+        self.stdout.write(
+            self.style.SUCCESS('Успешно! Обработано документов: ' + str(extracted))
+        )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app import stats
+
+
+class Command(BaseCommand):
+
+    help = 'Пересчитать статистику ФОСов по таблице ФОСов или сверить ее с ФОСами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Только сверить статистику с ФОСами (без изменений), при расхождениях - ошибка')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            diff = stats.verify()
+            for key, stored, live in diff:
+                self.stdout.write(
+                    'Дисциплина {}, тип {}, период "{}": в статистике {}, по ФОСам {}'.format(*key, stored, live)
+                )
+            if diff:
+                raise CommandError('Расхождений статистики с ФОСами: ' + str(len(diff)))
+            self.stdout.write(self.style.SUCCESS('Статистика ФОСов совпадает с ФОСами'))
+            return
+
+        count = stats.rebuild()
+        self.stdout.write(self.style.SUCCESS('Статистика ФОСов пересчитана, строк: ' + str(count)))
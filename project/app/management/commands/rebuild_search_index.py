@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from app import search
+
+
+class Command(BaseCommand):
+
+    help = 'Перестроить поисковый индекс ФОСов, дисциплин и документов'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write('Перестроение поискового индекса...')
+        count = search.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS('Успешно! Записей в индексе: ' + str(count))
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from app.models import Document
+from app.processing import process_document
+
+
+class Command(BaseCommand):
+
+    help = 'Построить миниатюры и посчитать страницы файлов документов (файлы с готовыми миниатюрами пропускаются)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Построить миниатюры заново (например, после изменения DOCUMENT_PREVIEW_WIDTH)')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Построение миниатюр документов...')
+        rendered = 0
+        # одинаковые файлы разных документов при --force отрисовываются один раз
+        seen = set()
+        documents = Document.objects.exclude(path='').exclude(path__isnull=True).order_by('id')
+        for document_id, path in documents.values_list('id', 'path').iterator():
+            if path in seen:
+                continue
+            seen.add(path)
+            if process_document(document_id, text=False, force=options['force']):
+                rendered += 1
+        self.stdout.write(
+            self.style.SUCCESS('Успешно! Обработано документов: ' + str(rendered))
+        )
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.imports import run_pending_imports
+from app.models import ImportJob
+
+
+class Command(BaseCommand):
+
+    help = 'Выполнить (продолжить) задачи импорта, ожидающие в очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Не завершаться, а периодически проверять очередь')
+        parser.add_argument('--interval', type=float, default=5, help='Интервал проверки очереди в секундах')
+        parser.add_argument('--requeue-running', action='store_true',
+                            help='Вернуть в очередь задачи, прерванные перезапуском сервера '
+                                 '(они продолжатся с первой несохраненной порции)')
+
+    def handle(self, *args, **options):
+        if options['requeue_running']:
+            count = ImportJob.objects.filter(status=ImportJob.STATUS_RUNNING).update(status=ImportJob.STATUS_PENDING)
+            self.stdout.write('Возвращено в очередь задач: ' + str(count))
+
+        while True:
+            done = run_pending_imports()
+            if done:
+                self.stdout.write(self.style.SUCCESS('Выполнено задач: ' + str(done)))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.jobs import cleanup, run_pending
+from app.models import ReportJob
+
+
+class Command(BaseCommand):
+
+    help = 'Выполнить задачи формирования отчетов, ожидающие в очереди, и удалить устаревшие отчеты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Не завершаться, а периодически проверять очередь')
+        parser.add_argument('--interval', type=float, default=5, help='Интервал проверки очереди в секундах')
+        parser.add_argument('--requeue-running', action='store_true',
+                            help='Вернуть в очередь задачи, прерванные перезапуском сервера')
+
+    def handle(self, *args, **options):
+        if options['requeue_running']:
+            count = ReportJob.objects.filter(status=ReportJob.STATUS_RUNNING).update(status=ReportJob.STATUS_PENDING)
+            self.stdout.write('Возвращено в очередь задач: ' + str(count))
+
+        while True:
+            done = run_pending()
+            if done:
+                self.stdout.write(self.style.SUCCESS('Выполнено задач: ' + str(done)))
+            deleted = cleanup()
+            if deleted:
+                self.stdout.write('Удалено устаревших отчетов: ' + str(deleted))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -1,60 +1,93 @@
-from django.core.management.base import BaseCommand
-from app.models import FosType, DisciplineType, Qualification
+import time
+import uuid
+
 from django.contrib.auth.models import Group, Permission
+from django.core.management.base import BaseCommand, CommandError
+
+from app import cache
+from app.backends import atomic_write
+from app.models import FosType, DisciplineType, Qualification
+from app.synthetic import (
+    DEFAULT_DISCIPLINE_TYPES, DEFAULT_FOS_TYPES, DEFAULT_QUALIFICATIONS, SyntheticDepartment
+)
+
+# права группы "Преподаватель"
+TEACHER_PERMISSIONS = (
+    'add_fos', 'change_fos', 'delete_fos', 'view_fos',
+    'add_document', 'change_document', 'delete_document', 'view_document',
+    'change_discipline', 'view_discipline', 'view_qualification',
+)
 
 
 class Command(BaseCommand):
 
     help = 'Заполнить базу данных тестовыми значениями'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=0,
+                            help='Дополнительно создать N дисциплин с преподавателями, группами, ФОСами и документами')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Количество дисциплин, создаваемых в одной транзакции')
+        parser.add_argument('--foses-per-discipline', type=int, default=3, help='Среднее количество ФОСов дисциплины')
+        parser.add_argument('--documents-per-fos', type=int, default=1, help='Количество документов ФОСа')
+        parser.add_argument('--seed', type=int, default=0, help='Начальное значение генератора данных')
+
+    def handle(self, *args, **options):
         self.stdout.write('Заполнение базы данных значениями по-умолчанию...')
 
-        # если типов ФОСов еще не было в БД - создаем список по-умолчанию
-        if FosType.objects.all().count() == 0:
-            for fos_type in (
-                'Вопросы к зачету / экзамену',
-                'Задание для опроса',
-                'Тестовое задание',
-                'Расчетные задачи',
-                'ФОС',
-                'Билеты для экзамена',
-                'Контрольная работа',
-                'Самостоятельная работа',
-                "Смешанное задание"
-            ):
-                FosType(name=fos_type).save()
-
-        # если типов дисциплин еще не было в БД - создаем список по-умолчанию
-        if DisciplineType.objects.all().count() == 0:
-            for dis_type in (
-                'Зачет',
-                'Экзамен',
-            ):
-                DisciplineType(name=dis_type).save()
-
-        # если видов обучения (квалификаций) еще не было в БД - создаем список по-умолчанию
-        if Qualification.objects.all().count() == 0:
-            for qualification in (
-                'Бакалавриат',
-                'Магистратура',
-            ):
-                Qualification(name=qualification).save()
-
-        # если группы преподаватель не существует - создаем такую и выдаем соответствующие права
-        if Group.objects.filter(name='Преподаватель').count() == 0:
-            teacher = Group(name='Преподаватель')
-            teacher.save()
-            for permission in (
-                'add_fos', 'change_fos', 'delete_fos', 'view_fos',
-                'add_document', 'change_document', 'delete_document', 'view_document',
-                'change_discipline', 'view_discipline', 'view_qualification'
-            ):
-                teacher.permissions.add(
-                    Permission.objects.get(codename=permission)
-                )
-            teacher.save()
+        with atomic_write():
+            # справочники заполняются значениями по-умолчанию, только если они пусты
+            # (повторный запуск не восстанавливает удаленные администратором значения)
+            for model, names in ((FosType, DEFAULT_FOS_TYPES), (DisciplineType, DEFAULT_DISCIPLINE_TYPES),
+                                 (Qualification, DEFAULT_QUALIFICATIONS)):
+                if not model.objects.exists():
+                    model.objects.bulk_create([model(name=name) for name in names])
+            # bulk_create не отправляет сигналы сохранения - кэш справочников сбрасывается явно
+            cache.invalidate(cache.FOS_TYPES, cache.DISCIPLINE_TYPES, cache.QUALIFICATIONS)
+
+            # группа "Преподаватель" и ее права (недостающие права выдаются и существующей группе)
+            teacher, _ = Group.objects.get_or_create(name='Преподаватель')
+            permissions = list(Permission.objects.filter(
+                codename__in=TEACHER_PERMISSIONS, content_type__app_label='app'
+            ).values_list('id', 'codename'))
+            missing = set(TEACHER_PERMISSIONS) - {codename for _, codename in permissions}
+            if missing:
+                raise CommandError('Нет прав ' + ', '.join(sorted(missing)) + ' (выполните миграции)')
+            Group.permissions.through.objects.bulk_create([
+                Group.permissions.through(group_id=teacher.id, permission_id=permission_id)
+                for permission_id, _ in permissions
+            ], ignore_conflicts=True)
+
+        if options['scale'] > 0:
+            self.generate(options)
 
         self.stdout.write(
             self.style.SUCCESS('Успешно!')
         )
+
+    def generate(self, options):
+        """
+            Создание options['scale'] дисциплин частями по options['batch_size'], каждая часть - синтетическая
+            кафедра в отдельной транзакции (статистика ФОСов и поисковый индекс обновляются только для созданных
+            записей части).
+        """
+        # префикс запуска: повторный запуск добавляет новые записи, а не конфликтует с созданными ранее
+        run = uuid.uuid4().hex[:6]
+        total = options['scale']
+        batch_size = max(1, options['batch_size'])
+        created = {}
+        started = time.perf_counter()
+        for number, offset in enumerate(range(0, total, batch_size)):
+            department = SyntheticDepartment(
+                min(batch_size, total - offset), foses_per_discipline=options['foses_per_discipline'],
+                documents_per_fos=options['documents_per_fos'], prefix='seed{}-{}'.format(run, number),
+                seed=options['seed'] + number,
+            )
+            for name, count in department.generate().items():
+                created[name] = created.get(name, 0) + count
+            self.stdout.write('Создано дисциплин: {} из {} ({:.1f} с)'.format(
+                offset + department.disciplines, total, time.perf_counter() - started
+            ))
+
+        self.stdout.write('Создано: {teachers} преподавателей, {groups} групп, {disciplines} дисциплин, '
+                          '{foses} ФОСов, {documents} документов'.format(**created))
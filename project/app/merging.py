@@ -0,0 +1,189 @@
+import glob
+import hashlib
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from docx import Document
+from docxcompose.composer import Composer
+
+from app.storage import name_sha256
+
+# каталог объединенных документов (относительно MEDIA_ROOT)
+MERGED_DIR = 'documents-merged'
+
+# хэши файлов документов: путь => (размер, время изменения, хэш)
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+
+class InvalidDocumentError(Exception):
+    """
+        Первый документ ФОСа не является валидным MS Word файлом
+    """
+    pass
+
+
+def file_hash(path):
+    """
+        Хэш содержимого файла (пересчитывается только при изменении размера или времени изменения файла)
+    """
+    stat = os.stat(path)
+    with _hashes_lock:
+        cached = _hashes.get(path)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    with _hashes_lock:
+        _hashes[path] = (stat.st_size, stat.st_mtime_ns, sha.hexdigest())
+    return sha.hexdigest()
+
+
+def document_hash(document):
+    """
+        Хэш содержимого файла документа (для файла в хранилище по содержимому - из имени файла, без чтения)
+    """
+    return name_sha256(document.path.name) or file_hash(document.path.path)
+
+
+def cache_key(documents):
+    """
+        Ключ кэша объединенного документа: упорядоченные ID документов, хэши их файлов и даты изменения
+    """
+    sha = hashlib.sha256()
+    for doc in documents:
+        sha.update('{}:{}:{}\n'.format(doc.id, document_hash(doc), doc.updated_at.isoformat()).encode())
+    return sha.hexdigest()
+
+
+def get_cache_dir():
+    return os.path.join(settings.MEDIA_ROOT, MERGED_DIR)
+
+
+def get_cached_path(fos_id, key):
+    return os.path.join(get_cache_dir(), 'fos_{}_{}.docx'.format(fos_id, key))
+
+
+def parse(document):
+    """
+        Разбор файла документа
+
+        Returns:
+            Объект python-docx или None, если файл не является валидным MS Word файлом
+    """
+    try:
+        return Document(document.path.path)
+    except Exception:
+        return None
+
+
+def parse_all(documents):
+    """
+        Разбор файлов документов в ограниченном пуле потоков (MERGE_PARSE_WORKERS)
+
+        Распаковка и разбор XML (zlib, lxml) выполняются без удержания GIL, поэтому файлы разбираются параллельно.
+        Результаты возвращаются в исходном порядке по мере готовности.
+    """
+    workers = min(settings.MERGE_PARSE_WORKERS, len(documents))
+    if workers <= 1:
+        for document in documents:
+            yield parse(document)
+        return
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='merge-parse') as executor:
+        yield from executor.map(parse, documents)
+
+
+def compose(documents, path):
+    """
+        Объединение документов в один файл
+
+        Невалидные MS Word файлы (кроме первого) пропускаются.
+    """
+    parsed = parse_all(documents)
+    master = next(parsed)
+    if master is None:
+        parsed.close()
+        raise InvalidDocumentError('Загруженный документ не является валидным MS Word файлом')
+
+    # добавляем в слияние первый документ, затем остальные в исходном порядке
+    composer = Composer(master)
+    for document in parsed:
+        # если какой-либо документ не является валидным MS Word файлом - пропускаем такой документ
+        if document is not None:
+            composer.append(document)
+
+    # сохраняем во временный файл и подменяем им итоговый, чтобы параллельный запрос не получил недописанный файл
+    tmp_path = path + '.' + uuid.uuid4().hex + '.part'
+    try:
+        composer.save(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def get_merged_document(fos_id, documents):
+    """
+        Получение пути к объединенному документу ФОСа
+
+        Если документы ФОСа не менялись с прошлого объединения - отдается ранее сформированный файл.
+
+        Args:
+            fos_id: ID ФОСа
+            documents: Документы ФОСа (с загруженными файлами) в порядке объединения
+    """
+    path = get_cached_path(fos_id, cache_key(documents))
+    if os.path.exists(path):
+        # отмечаем использование файла (по времени изменения определяются давно не используемые файлы)
+        os.utime(path)
+        return path
+
+    os.makedirs(get_cache_dir(), exist_ok=True)
+    compose(documents, path)
+    evict(keep=path)
+    return path
+
+
+def invalidate(fos_id):
+    """
+        Удаление объединенных документов ФОСа из кэша
+    """
+    for path in glob.glob(os.path.join(get_cache_dir(), 'fos_{}_*.docx'.format(fos_id))):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def evict(keep=None):
+    """
+        Удаление давно не использованных объединенных документов, если размер кэша превышает
+        MERGED_DOCUMENTS_CACHE_SIZE (в Мб)
+    """
+    limit = settings.MERGED_DOCUMENTS_CACHE_SIZE * 1024 * 1024
+    files = []
+    total = 0
+    for path in glob.glob(os.path.join(get_cache_dir(), 'fos_*.docx')):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    for mtime, size, path in sorted(files):
+        if total <= limit:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
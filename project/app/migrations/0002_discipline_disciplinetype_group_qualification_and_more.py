@@ -0,0 +1,125 @@
+# Generated by Django 4.2 on 2026-10-18 20:04
+
+import app.models
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Discipline',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Наименование')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Дисциплина',
+                'verbose_name_plural': 'Дисциплины',
+            },
+        ),
+        migrations.CreateModel(
+            name='DisciplineType',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Наименование')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Тип дисциплины',
+                'verbose_name_plural': 'Типы дисциплин',
+            },
+        ),
+        migrations.CreateModel(
+            name='Group',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Наименование')),
+                ('course', models.IntegerField(default=1, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(10)], verbose_name='Курс')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'учебную группу',
+                'verbose_name_plural': 'Учебные группы',
+            },
+        ),
+        migrations.CreateModel(
+            name='Qualification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Наименование')),
+            ],
+            options={
+                'verbose_name': 'вид обучения',
+                'verbose_name_plural': 'Виды обучения',
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='fostype',
+            options={'verbose_name': 'Тип оценочного средства', 'verbose_name_plural': 'Типы оценочного средства'},
+        ),
+        migrations.CreateModel(
+            name='Fos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Наименование')),
+                ('description', models.TextField(blank=True, null=True, verbose_name='Описание')),
+                ('years', models.CharField(blank=True, choices=[('2026', '2026 - 2027'), ('2025', '2025 - 2026'), ('2024', '2024 - 2025'), ('2023', '2023 - 2024'), ('2022', '2022 - 2023'), ('2021', '2021 - 2022'), ('2020', '2020 - 2021'), ('2019', '2019 - 2020'), ('2018', '2018 - 2019'), ('2017', '2017 - 2018'), ('2016', '2016 - 2017'), ('2015', '2015 - 2016'), ('2014', '2014 - 2015'), ('2013', '2013 - 2014'), ('2012', '2012 - 2013'), ('2011', '2011 - 2012'), ('2010', '2010 - 2011'), ('2009', '2009 - 2010'), ('2008', '2008 - 2009'), ('2007', '2007 - 2008'), ('2006', '2006 - 2007'), ('2005', '2005 - 2006'), ('2004', '2004 - 2005'), ('2003', '2003 - 2004'), ('2002', '2002 - 2003'), ('2001', '2001 - 2002'), ('2000', '2000 - 2001')], max_length=20, null=True, verbose_name='Период обучения')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+                ('discipline', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='app.discipline', verbose_name='Дисциплина')),
+                ('type', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='app.fostype', verbose_name='Тип')),
+            ],
+            options={
+                'verbose_name': 'оценочное средство',
+                'verbose_name_plural': 'Оценочные средства',
+            },
+        ),
+        migrations.CreateModel(
+            name='Document',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Наименование')),
+                ('path', models.FileField(blank=True, help_text='Допустимые расширения: pdf, doc, docx, xlsx, xls, zip', null=True, upload_to='documents/', validators=[django.core.validators.FileExtensionValidator(['pdf', 'doc', 'docx', 'xlsx', 'xls', 'zip']), app.models.validate_file_size], verbose_name='Документ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+                ('fos', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.fos', verbose_name='Оценочное средство')),
+            ],
+            options={
+                'verbose_name': 'Документ',
+                'verbose_name_plural': 'Документы',
+            },
+        ),
+        migrations.AddField(
+            model_name='discipline',
+            name='groups',
+            field=models.ManyToManyField(blank=True, to='app.group', verbose_name='Учебные группы'),
+        ),
+        migrations.AddField(
+            model_name='discipline',
+            name='qualification',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='app.qualification', verbose_name='Вид обучения'),
+        ),
+        migrations.AddField(
+            model_name='discipline',
+            name='type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='app.disciplinetype', verbose_name='Форма контроля знаний'),
+        ),
+        migrations.AddField(
+            model_name='discipline',
+            name='users',
+            field=models.ManyToManyField(blank=True, to=settings.AUTH_USER_MODEL, verbose_name='Преподаватели'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['fos', 'id'], name='document_fos_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fos',
+            index=models.Index(fields=['discipline', 'type', 'years'], name='fos_discipline_type_years_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fos',
+            index=models.Index(fields=['years', 'discipline', 'type'], name='fos_years_discipline_type_idx'),
+        ),
+    ]
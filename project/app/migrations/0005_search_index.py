@@ -0,0 +1,91 @@
+# Generated by Django 4.2 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+SQLITE_FTS = [
+    # внешний (external content) полнотекстовый индекс над колонкой terms и триггеры его синхронизации
+    "CREATE VIRTUAL TABLE app_searchentry_fts USING fts5("
+    "terms, content='app_searchentry', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER app_searchentry_ai AFTER INSERT ON app_searchentry BEGIN "
+    "INSERT INTO app_searchentry_fts(rowid, terms) VALUES (new.id, new.terms); END",
+    "CREATE TRIGGER app_searchentry_ad AFTER DELETE ON app_searchentry BEGIN "
+    "INSERT INTO app_searchentry_fts(app_searchentry_fts, rowid, terms) VALUES ('delete', old.id, old.terms); END",
+    "CREATE TRIGGER app_searchentry_au AFTER UPDATE ON app_searchentry BEGIN "
+    "INSERT INTO app_searchentry_fts(app_searchentry_fts, rowid, terms) VALUES ('delete', old.id, old.terms); "
+    "INSERT INTO app_searchentry_fts(rowid, terms) VALUES (new.id, new.terms); END",
+]
+
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS app_searchentry_ai",
+    "DROP TRIGGER IF EXISTS app_searchentry_ad",
+    "DROP TRIGGER IF EXISTS app_searchentry_au",
+    "DROP TABLE IF EXISTS app_searchentry_fts",
+]
+
+POSTGRESQL_FTS = [
+    "CREATE INDEX app_searchentry_content_fts ON app_searchentry USING GIN (to_tsvector('russian', content))",
+]
+
+POSTGRESQL_FTS_DROP = [
+    "DROP INDEX IF EXISTS app_searchentry_content_fts",
+]
+
+
+def sqlite_has_fts5(schema_editor):
+    # FTS5 может быть не собран в SQLite - тогда поиск работает по колонке terms без полнотекстового индекса
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+            cursor.execute("DROP TABLE temp.fts5_probe")
+            return True
+        except Exception:
+            return False
+
+
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = []
+    if vendor == 'sqlite' and sqlite_has_fts5(schema_editor):
+        statements = SQLITE_FTS
+    elif vendor == 'postgresql':
+        statements = POSTGRESQL_FTS
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = SQLITE_FTS_DROP if vendor == 'sqlite' else POSTGRESQL_FTS_DROP if vendor == 'postgresql' else []
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('discipline', 'Дисциплина'), ('fos', 'ФОС'), ('document', 'Документ')], max_length=20, verbose_name='Вид объекта')),
+                ('object_id', models.BigIntegerField(verbose_name='ID объекта')),
+                ('discipline_id', models.BigIntegerField(verbose_name='ID дисциплины')),
+                ('fos_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID ФОСа')),
+                ('content', models.TextField(blank=True, default='', verbose_name='Текст')),
+                ('terms', models.TextField(blank=True, default='', verbose_name='Основы слов')),
+            ],
+            options={
+                'verbose_name': 'Запись поискового индекса',
+                'verbose_name_plural': 'Поисковый индекс',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='search_entry_kind_object_uniq'),
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
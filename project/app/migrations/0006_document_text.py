@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-18 20:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, verbose_name='Хэш файла')),
+                ('content', models.TextField(blank=True, default='', verbose_name='Текст')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='text', to='app.document', verbose_name='Документ')),
+            ],
+            options={
+                'verbose_name': 'Текст документа',
+                'verbose_name_plural': 'Тексты документов',
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-18 20:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('app', '0006_document_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100, verbose_name='Модель')),
+                ('resource', models.PositiveSmallIntegerField(default=0, verbose_name='Ресурс импорта')),
+                ('input_format', models.PositiveSmallIntegerField(default=0, verbose_name='Формат файла')),
+                ('file', models.FileField(upload_to='imports/', verbose_name='Файл')),
+                ('file_name', models.CharField(blank=True, default='', max_length=255, verbose_name='Имя файла')),
+                ('chunk_size', models.PositiveIntegerField(default=500, verbose_name='Строк в порции')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершен'), ('failed', 'Ошибка')], db_index=True, default='pending', max_length=20, verbose_name='Состояние')),
+                ('total_rows', models.PositiveIntegerField(blank=True, null=True, verbose_name='Строк в файле')),
+                ('processed_rows', models.PositiveIntegerField(default=0, verbose_name='Обработано строк')),
+                ('new_rows', models.PositiveIntegerField(default=0, verbose_name='Добавлено')),
+                ('updated_rows', models.PositiveIntegerField(default=0, verbose_name='Обновлено')),
+                ('skipped_rows', models.PositiveIntegerField(default=0, verbose_name='Пропущено')),
+                ('chunks', models.JSONField(blank=True, default=list, verbose_name='Замеры порций')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата начала')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата завершения')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Задача импорта',
+                'verbose_name_plural': 'Задачи импорта',
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2 on 2026-10-18 20:39
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_stats(apps, schema_editor):
+    FosStat = apps.get_model('app', 'FosStat')
+    Fos = apps.get_model('app', 'Fos')
+    rows = Fos.objects.values('discipline_id', 'type_id', 'years', 'discipline__qualification_id').annotate(
+        total=Count('id')
+    ).order_by()
+    stats = {}
+    for row in rows:
+        # ФОСы без периода (NULL и пустая строка) попадают в одну строку статистики
+        key = (row['discipline_id'], row['type_id'], row['years'] or '')
+        if key not in stats:
+            stats[key] = FosStat(discipline_id=key[0], fos_type_id=key[1], years=key[2],
+                                 qualification_id=row['discipline__qualification_id'], count=0)
+        stats[key].count += row['total']
+    FosStat.objects.bulk_create(stats.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FosStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('years', models.CharField(blank=True, default='', max_length=20, verbose_name='Период обучения')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество ФОСов')),
+                ('discipline', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fos_stats', to='app.discipline', verbose_name='Дисциплина')),
+                ('fos_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.fostype', verbose_name='Тип ФОСа')),
+                ('qualification', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='app.qualification', verbose_name='Вид обучения')),
+            ],
+            options={
+                'verbose_name': 'Статистика ФОСов',
+                'verbose_name_plural': 'Статистика ФОСов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='fosstat',
+            index=models.Index(fields=['years', 'qualification'], name='fos_stat_years_qual_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='fosstat',
+            constraint=models.UniqueConstraint(fields=('discipline', 'fos_type', 'years'), name='fos_stat_key_uniq'),
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
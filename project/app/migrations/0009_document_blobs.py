@@ -0,0 +1,81 @@
+# Generated by Django 4.2 on 2026-10-18 20:55
+
+import hashlib
+import os
+
+import app.models
+import app.storage
+import django.core.validators
+from django.conf import settings
+from django.db import migrations, models
+
+
+def register_blobs(apps, schema_editor):
+    """
+        Записи о загруженных ранее файлах документов; документы с одинаковыми файлами ссылаются на один файл
+        (файлы-копии удаляет команда collect_document_blobs --orphans)
+    """
+    Blob = apps.get_model('app', 'Blob')
+    Document = apps.get_model('app', 'Document')
+    blobs = {}
+    by_content = {}
+    for document in Document.objects.exclude(path='').exclude(path__isnull=True).order_by('id').iterator():
+        name = document.path.name
+        full_path = os.path.join(settings.MEDIA_ROOT, name)
+        if name not in blobs and os.path.exists(full_path):
+            sha = hashlib.sha256()
+            with open(full_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha.update(chunk)
+            key = (sha.hexdigest(), os.path.splitext(name)[1].lower())
+            if key in by_content:
+                name = by_content[key]
+            else:
+                by_content[key] = name
+                blobs[name] = Blob(name=name, sha256=key[0], size=os.path.getsize(full_path))
+        elif name not in blobs:
+            blobs[name] = Blob(name=name, sha256='', size=0)
+        blobs[name].refcount += 1
+        Document.objects.filter(pk=document.pk).update(path=name, file_name=os.path.basename(document.path.name))
+    Blob.objects.bulk_create(blobs.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_fos_stat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Путь к файлу')),
+                ('sha256', models.CharField(db_index=True, max_length=64, verbose_name='Хэш содержимого')),
+                ('size', models.PositiveBigIntegerField(default=0, verbose_name='Размер')),
+                ('refcount', models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Файл документа',
+                'verbose_name_plural': 'Файлы документов',
+            },
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='file_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, verbose_name='Имя файла'),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='path',
+            field=app.storage.ContentAddressedFileField(blank=True, help_text='Допустимые расширения: pdf, doc, docx, xlsx, xls, zip', null=True, original_name_field='file_name', storage=app.storage.ContentAddressedStorage(), upload_to='documents/', validators=[django.core.validators.FileExtensionValidator(['pdf', 'doc', 'docx', 'xlsx', 'xls', 'zip']), app.models.validate_file_size], verbose_name='Документ'),
+        ),
+        migrations.AddIndex(
+            model_name='blob',
+            index=models.Index(fields=['refcount', 'updated_at'], name='blob_refcount_updated_idx'),
+        ),
+        migrations.RunPython(register_blobs, migrations.RunPython.noop),
+    ]
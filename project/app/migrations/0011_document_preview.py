@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-18 21:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_upload_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentPreview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='Хэш содержимого')),
+                ('page_count', models.PositiveIntegerField(blank=True, null=True, verbose_name='Количество страниц')),
+                ('unit', models.CharField(blank=True, choices=[('pages', 'Страницы'), ('sheets', 'Листы')], default='', max_length=10, verbose_name='Единица счета')),
+                ('image', models.CharField(blank=True, default='', max_length=255, verbose_name='Миниатюра')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Миниатюра документа',
+                'verbose_name_plural': 'Миниатюры документов',
+            },
+        ),
+    ]
@@ -5,7 +5,13 @@ from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django_cleanup import cleanup
-import datetime
+
+from app.backends import atomic_write
+from app.storage import ContentAddressedFileField, ContentAddressedStorage
+from app.utils import ru_plural
+
+# хранилище файлов документов по содержимому
+document_storage = ContentAddressedStorage()
 
 
 # валидация размера файла
@@ -135,6 +141,16 @@ class Discipline(models.Model):
         verbose_name_plural = 'Дисциплины'
 
 
+class YearsChoices:
+    """
+        Варианты выбора периода обучения (с 2000 года по текущий)
+    """
+
+    def __iter__(self):
+        from app.cache import years_choices
+        return iter(years_choices())
+
+
 class Fos(models.Model):
     """
         Модель "ФОС (фонд оценочных средств)"
@@ -148,9 +164,9 @@ class Fos(models.Model):
             updated_at: дата изменения
     """
 
-    YEARS_CHOICES = [
-        (str(y), str(y) + " - " + str(y + 1)) for y in reversed(range(2000, datetime.date.today().year + 1))
-    ]
+    # периоды обучения вычисляются при каждом обращении (см. app.cache.years_choices),
+    # чтобы новый учебный год появлялся без перезапуска сервера
+    YEARS_CHOICES = YearsChoices()
 
     name = models.CharField(max_length=255, verbose_name='Наименование')
     description = models.TextField(verbose_name='Описание', blank=True, null=True)
@@ -166,24 +182,36 @@ class Fos(models.Model):
     class Meta:
         verbose_name = 'оценочное средство'
         verbose_name_plural = 'Оценочные средства'
+        indexes = [
+            # ФОСы дисциплины по типам и периодам (отчет преподавателя, счетчики по типам)
+            models.Index(fields=['discipline', 'type', 'years'], name='fos_discipline_type_years_idx'),
+            # отчет кафедры и фильтр списка ФОСов по периоду обучения
+            models.Index(fields=['years', 'discipline', 'type'], name='fos_years_discipline_type_idx'),
+        ]
 
 
-@cleanup.select
 class Document(models.Model):
     """
         Модель "Загружаемый документ"
 
+        Файлы документов хранятся по содержимому (одинаковые файлы - один раз, см. app/storage.py) и удаляются
+        командой collect_document_blobs, когда на них не остается ссылок.
+
         Attributes:
             name: Название
             path: Путь до документа на сервере
+            file_name: Исходное имя загруженного файла
             fos: ФОС к которому относится данный документ
             created_at: Дата создания
             updated_at: дата изменения
         """
     name = models.CharField(max_length=255, verbose_name='Наименование')
-    path = models.FileField(upload_to='documents/', blank=True, null=True, verbose_name='Документ', validators=[
-        FileExtensionValidator(settings.ALLOWED_FILE_UPLOAD_EXTENSIONS), validate_file_size
-    ], help_text='Допустимые расширения: ' + ', '.join(settings.ALLOWED_FILE_UPLOAD_EXTENSIONS))
+    path = ContentAddressedFileField(
+        upload_to='documents/', blank=True, null=True, verbose_name='Документ', storage=document_storage, validators=[
+            FileExtensionValidator(settings.ALLOWED_FILE_UPLOAD_EXTENSIONS), validate_file_size
+        ], help_text='Допустимые расширения: ' + ', '.join(settings.ALLOWED_FILE_UPLOAD_EXTENSIONS)
+    )
+    file_name = models.CharField(max_length=255, blank=True, default='', editable=False, verbose_name='Имя файла')
     fos = models.ForeignKey(Fos, on_delete=models.CASCADE, verbose_name='Оценочное средство')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
@@ -191,6 +219,382 @@ class Document(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # запись файла в хранилище, сохранение документа и учет ссылки на файл (app.signals) - в одной транзакции:
+        # сборка файлов без ссылок не удалит файл, на который ссылается сохраняемый документ (см. app.blobs.reserve)
+        with atomic_write():
+            super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Документ'
-        verbose_name_plural = 'Документы'
\ No newline at end of file
+        verbose_name_plural = 'Документы'
+        indexes = [
+            # документы ФОСа в порядке добавления (колонка "документы", объединение документов)
+            models.Index(fields=['fos', 'id'], name='document_fos_id_idx'),
+        ]
+
+
+class Blob(models.Model):
+    """
+        Модель "Файл документа" (файл в хранилище документов по содержимому)
+
+        Attributes:
+            name: Путь к файлу в хранилище
+            sha256: Хэш SHA-256 содержимого
+            size: Размер в байтах
+            refcount: Количество документов, ссылающихся на файл
+            created_at: Дата создания
+            updated_at: Дата изменения (в т.ч. количества ссылок)
+    """
+    name = models.CharField(max_length=255, unique=True, verbose_name='Путь к файлу')
+    sha256 = models.CharField(max_length=64, db_index=True, verbose_name='Хэш содержимого')
+    size = models.PositiveBigIntegerField(default=0, verbose_name='Размер')
+    refcount = models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Файл документа'
+        verbose_name_plural = 'Файлы документов'
+        indexes = [
+            # файлы без ссылок для удаления (см. collect_document_blobs)
+            models.Index(fields=['refcount', 'updated_at'], name='blob_refcount_updated_idx'),
+        ]
+
+
+class UploadSession(models.Model):
+    """
+        Модель "Загрузка файла по частям" (большой файл документа загружается частями, см. app.uploads)
+
+        Части записываются сразу на свое место во временный файл загрузки, поэтому прерванная загрузка продолжается
+        с первого не полученного байта, а загруженный файл не собирается из частей повторным копированием.
+
+        Attributes:
+            token: Случайный идентификатор загрузки
+            user: Пользователь, начавший загрузку
+            file_name: Исходное имя файла
+            size: Размер файла в байтах (объявленный при начале загрузки)
+            received: Количество полученных байт (с начала файла)
+            sha256: Хэш SHA-256 содержимого (заполняется по завершении загрузки)
+            created_at: Дата создания
+            updated_at: Дата изменения (получения последней части)
+    """
+    token = models.CharField(max_length=32, unique=True, verbose_name='Идентификатор')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Пользователь')
+    file_name = models.CharField(max_length=255, verbose_name='Имя файла')
+    size = models.PositiveBigIntegerField(verbose_name='Размер')
+    received = models.PositiveBigIntegerField(default=0, verbose_name='Получено байт')
+    sha256 = models.CharField(max_length=64, blank=True, default='', verbose_name='Хэш содержимого')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+    def __str__(self):
+        return self.file_name
+
+    @property
+    def complete(self):
+        return bool(self.sha256)
+
+    class Meta:
+        verbose_name = 'Загрузка файла'
+        verbose_name_plural = 'Загрузки файлов'
+
+
+@cleanup.select
+class ReportJob(models.Model):
+    """
+        Модель "Задача формирования отчета" (выполняется в фоне, см. app.jobs)
+
+        Attributes:
+            kind: Вид отчета
+            params: Параметры формирования отчета
+            status: Состояние задачи
+            file: Сформированный файл отчета
+            error: Текст ошибки (если задача завершилась неудачно)
+            user: Пользователь, поставивший задачу
+            created_at: Дата создания
+            updated_at: дата изменения
+            finished_at: Дата завершения
+    """
+
+    KIND_FOS = 'fos'
+    KIND_DISCIPLINES = 'disciplines'
+    KIND_CHOICES = [
+        (KIND_FOS, 'ФОСы преподавателя'),
+        (KIND_DISCIPLINES, 'Оценочные средства кафедры'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Формируется'),
+        (STATUS_DONE, 'Готов'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Отчет')
+    params = models.JSONField(default=dict, blank=True, verbose_name='Параметры')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True,
+                              verbose_name='Состояние')
+    file = models.FileField(upload_to='reports/', blank=True, null=True, verbose_name='Файл отчета')
+    error = models.TextField(blank=True, default='', verbose_name='Ошибка')
+    user = models.ForeignKey(User, blank=True, null=True, on_delete=models.SET_NULL, verbose_name='Пользователь')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+    finished_at = models.DateTimeField(blank=True, null=True, verbose_name='Дата завершения')
+
+    def __str__(self):
+        return self.get_kind_display() + ' №' + str(self.pk)
+
+    @property
+    def filename(self):
+        """
+            Имя файла, под которым отчет отдается на скачивание
+        """
+        return 'export_total.xlsx' if self.kind == self.KIND_DISCIPLINES else 'export.xlsx'
+
+    class Meta:
+        verbose_name = 'Задача формирования отчета'
+        verbose_name_plural = 'Задачи формирования отчетов'
+
+
+class SearchEntry(models.Model):
+    """
+        Модель "Запись поискового индекса" (поддерживается сигналами моделей, см. app.search)
+
+        Attributes:
+            kind: Вид проиндексированного объекта
+            object_id: ID объекта
+            discipline_id: ID дисциплины, к которой относится объект
+            fos_id: ID ФОСа, к которому относится объект (для ФОСов и документов)
+            content: Индексируемый текст
+            terms: Основы слов индексируемого текста (для полнотекстового индекса SQLite)
+    """
+
+    KIND_DISCIPLINE = 'discipline'
+    KIND_FOS = 'fos'
+    KIND_DOCUMENT = 'document'
+    KIND_CHOICES = [
+        (KIND_DISCIPLINE, 'Дисциплина'),
+        (KIND_FOS, 'ФОС'),
+        (KIND_DOCUMENT, 'Документ'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Вид объекта')
+    object_id = models.BigIntegerField(verbose_name='ID объекта')
+    discipline_id = models.BigIntegerField(verbose_name='ID дисциплины')
+    fos_id = models.BigIntegerField(blank=True, null=True, verbose_name='ID ФОСа')
+    content = models.TextField(blank=True, default='', verbose_name='Текст')
+    terms = models.TextField(blank=True, default='', verbose_name='Основы слов')
+
+    def __str__(self):
+        return self.get_kind_display() + ' №' + str(self.object_id)
+
+    class Meta:
+        verbose_name = 'Запись поискового индекса'
+        verbose_name_plural = 'Поисковый индекс'
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='search_entry_kind_object_uniq'),
+        ]
+
+
+class DocumentText(models.Model):
+    """
+        Модель "Текст документа" (извлекается из загруженного файла в фоне, см. app.extraction)
+
+        Attributes:
+            document: Документ
+            sha256: Хэш файла, из которого извлечен текст
+            content: Извлеченный текст
+            created_at: Дата создания
+            updated_at: дата изменения
+    """
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, related_name='text', verbose_name='Документ')
+    sha256 = models.CharField(max_length=64, verbose_name='Хэш файла')
+    content = models.TextField(blank=True, default='', verbose_name='Текст')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+    def __str__(self):
+        return str(self.document)
+
+    class Meta:
+        verbose_name = 'Текст документа'
+        verbose_name_plural = 'Тексты документов'
+
+
+class DocumentPreview(models.Model):
+    """
+        Модель "Миниатюра документа" (строится по файлу документа в фоне, см. app.previews)
+
+        Одна запись на содержимое файла: документы с одинаковыми файлами используют одну миниатюру.
+
+        Attributes:
+            sha256: Хэш содержимого файла
+            page_count: Количество страниц (для таблиц - листов); пусто, если формат не поддерживается
+            unit: Что считается в page_count: страницы или листы
+            image: Путь к миниатюре первой страницы в MEDIA_ROOT; пусто, если миниатюры нет
+            created_at: Дата создания
+            updated_at: дата изменения
+    """
+    UNIT_PAGES = 'pages'
+    UNIT_SHEETS = 'sheets'
+    UNIT_CHOICES = [
+        (UNIT_PAGES, 'Страницы'),
+        (UNIT_SHEETS, 'Листы'),
+    ]
+
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name='Хэш содержимого')
+    page_count = models.PositiveIntegerField(blank=True, null=True, verbose_name='Количество страниц')
+    unit = models.CharField(max_length=10, choices=UNIT_CHOICES, blank=True, default='', verbose_name='Единица счета')
+    image = models.CharField(max_length=255, blank=True, default='', verbose_name='Миниатюра')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+
+    def __str__(self):
+        return self.sha256
+
+    def pages_text(self):
+        """
+            Количество страниц (листов) с подписью: "3 стр.", "2 листа"
+        """
+        if self.page_count is None:
+            return ''
+        if self.unit == self.UNIT_SHEETS:
+            return str(self.page_count) + ' ' + ru_plural(self.page_count, ['лист', 'листа', 'листов'])
+        return str(self.page_count) + ' стр.'
+
+    class Meta:
+        verbose_name = 'Миниатюра документа'
+        verbose_name_plural = 'Миниатюры документов'
+
+
+@cleanup.select
+class ImportJob(models.Model):
+    """
+        Модель "Задача импорта" (файл импортируется в фоне порциями строк, см. app.imports)
+
+        Каждая порция сохраняется в своей транзакции вместе с отметкой о ходе импорта (processed_rows),
+        поэтому прерванный импорт продолжается с первой несохраненной порции.
+
+        Attributes:
+            model: Импортируемая модель ("app_label.model_name")
+            resource: Номер ресурса импорта в списке ресурсов админки модели
+            input_format: Номер формата файла в списке форматов импорта админки модели
+            file: Импортируемый файл
+            file_name: Исходное имя файла
+            chunk_size: Количество строк в порции
+            status: Состояние задачи
+            total_rows: Количество строк в файле
+            processed_rows: Количество строк в сохраненных порциях
+            new_rows: Количество добавленных записей
+            updated_rows: Количество обновленных записей
+            skipped_rows: Количество пропущенных строк
+            chunks: Замеры сохраненных порций (номер, строк, время в секундах, строк в секунду)
+            error: Текст ошибки (если задача завершилась неудачно)
+            user: Пользователь, поставивший задачу
+            created_at: Дата создания
+            updated_at: дата изменения
+            started_at: Дата начала (последнего запуска)
+            finished_at: Дата завершения
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Завершен'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    model = models.CharField(max_length=100, verbose_name='Модель')
+    resource = models.PositiveSmallIntegerField(default=0, verbose_name='Ресурс импорта')
+    input_format = models.PositiveSmallIntegerField(default=0, verbose_name='Формат файла')
+    file = models.FileField(upload_to='imports/', verbose_name='Файл')
+    file_name = models.CharField(max_length=255, blank=True, default='', verbose_name='Имя файла')
+    chunk_size = models.PositiveIntegerField(default=500, verbose_name='Строк в порции')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True,
+                              verbose_name='Состояние')
+    total_rows = models.PositiveIntegerField(blank=True, null=True, verbose_name='Строк в файле')
+    processed_rows = models.PositiveIntegerField(default=0, verbose_name='Обработано строк')
+    new_rows = models.PositiveIntegerField(default=0, verbose_name='Добавлено')
+    updated_rows = models.PositiveIntegerField(default=0, verbose_name='Обновлено')
+    skipped_rows = models.PositiveIntegerField(default=0, verbose_name='Пропущено')
+    chunks = models.JSONField(default=list, blank=True, verbose_name='Замеры порций')
+    error = models.TextField(blank=True, default='', verbose_name='Ошибка')
+    user = models.ForeignKey(User, blank=True, null=True, on_delete=models.SET_NULL, verbose_name='Пользователь')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата изменения')
+    started_at = models.DateTimeField(blank=True, null=True, verbose_name='Дата начала')
+    finished_at = models.DateTimeField(blank=True, null=True, verbose_name='Дата завершения')
+
+    def __str__(self):
+        return 'Импорт №' + str(self.pk) + (' (' + self.file_name + ')' if self.file_name else '')
+
+    @property
+    def percent(self):
+        """
+            Доля обработанных строк в процентах
+        """
+        if not self.total_rows:
+            return 100 if self.status == self.STATUS_DONE else 0
+        return int(self.processed_rows * 100 / self.total_rows)
+
+    @property
+    def rows_per_second(self):
+        """
+            Средняя скорость импорта (строк в секунду) по сохраненным порциям
+        """
+        seconds = sum(chunk['seconds'] for chunk in self.chunks)
+        if not seconds:
+            return None
+        return round(sum(chunk['rows'] for chunk in self.chunks) / seconds, 1)
+
+    class Meta:
+        verbose_name = 'Задача импорта'
+        verbose_name_plural = 'Задачи импорта'
+
+
+class FosStat(models.Model):
+    """
+        Модель "Статистика ФОСов": количество ФОСов дисциплины по типу и периоду обучения
+        (поддерживается сигналами сохранения и удаления ФОСов, см. app.stats)
+
+        Attributes:
+            discipline: Дисциплина
+            fos_type: Тип ФОСа
+            years: Период обучения (пустая строка - период не указан)
+            qualification: Вид обучения дисциплины
+            count: Количество ФОСов
+    """
+    discipline = models.ForeignKey(Discipline, on_delete=models.CASCADE, related_name='fos_stats',
+                                   verbose_name='Дисциплина')
+    fos_type = models.ForeignKey(FosType, on_delete=models.CASCADE, verbose_name='Тип ФОСа')
+    years = models.CharField(max_length=20, blank=True, default='', verbose_name='Период обучения')
+    qualification = models.ForeignKey(Qualification, blank=True, null=True, on_delete=models.CASCADE,
+                                      verbose_name='Вид обучения')
+    count = models.PositiveIntegerField(default=0, verbose_name='Количество ФОСов')
+
+    def __str__(self):
+        return str(self.discipline_id) + '/' + str(self.fos_type_id) + '/' + self.years + ': ' + str(self.count)
+
+    class Meta:
+        verbose_name = 'Статистика ФОСов'
+        verbose_name_plural = 'Статистика ФОСов'
+        constraints = [
+            # вид обучения определяется дисциплиной, поэтому в ключ уникальности не входит
+            models.UniqueConstraint(fields=['discipline', 'fos_type', 'years'], name='fos_stat_key_uniq'),
+        ]
+        indexes = [
+            # отчет кафедры: счетчики по периоду обучения и виду обучения
+            models.Index(fields=['years', 'qualification'], name='fos_stat_years_qual_idx'),
+        ]
@@ -0,0 +1,37 @@
+from app.models import Discipline, Document, Fos
+
+
+def get_owned_discipline_ids(request):
+    """
+        Множество ID дисциплин, закрепленных за пользователем запроса
+
+        Загружается одним запросом и запоминается в объекте request, поэтому все проверки прав
+        в пределах одного запроса (формы, вложенные формы, кнопки) не обращаются к БД повторно.
+    """
+    ids = getattr(request, '_owned_discipline_ids', None)
+    if ids is None:
+        ids = frozenset(
+            Discipline.users.through.objects.filter(user_id=request.user.id).values_list('discipline_id', flat=True)
+        )
+        request._owned_discipline_ids = ids
+    return ids
+
+
+def get_discipline_id(obj):
+    """
+        ID дисциплины, к которой относится объект (дисциплина, ФОС или документ)
+    """
+    if isinstance(obj, Discipline):
+        return obj.id
+    if isinstance(obj, Fos):
+        return obj.discipline_id
+    if isinstance(obj, Document):
+        return obj.fos.discipline_id
+    return None
+
+
+def owns_discipline(request, obj):
+    """
+        Принадлежит ли дисциплина объекта (дисциплины, ФОСа или документа) пользователю запроса
+    """
+    return get_discipline_id(obj) in get_owned_discipline_ids(request)
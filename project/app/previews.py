@@ -0,0 +1,200 @@
+import os
+import posixpath
+import textwrap
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from PIL import Image, ImageDraw, ImageFont
+
+from app.backends import atomic_write
+from app.models import Blob, DocumentPreview
+from app.storage import name_sha256
+
+# миниатюры первой страницы и количество страниц файлов документов (колонка "документы" списка ФОСов и формы
+# документов): чтобы узнать, что в документе, не нужно скачивать его файл
+#
+# миниатюра строится в фоне после сохранения документа (см. app.processing) по прочитанному файлу (app.extraction)
+# и хранится в MEDIA_ROOT под именем из хэша содержимого файла: одинаковые файлы разных документов имеют одну
+# миниатюру, а измененный файл получает новую. Средств отрисовки страниц офисных документов в проекте нет, поэтому
+# миниатюра - схематичная страница А4 с началом текста документа (для таблиц - с сеткой ячеек первого листа)
+
+# каталог миниатюр в MEDIA_ROOT
+PREVIEWS_DIR = 'previews'
+
+# пропорции страницы А4 и поля страницы (доля ширины)
+PAGE_RATIO = 297 / 210
+PAGE_MARGIN = 0.08
+
+# межстрочный интервал (доля размера шрифта)
+LINE_SPACING = 1.25
+
+TEXT_COLOR = (60, 60, 60)
+GRID_COLOR = (200, 200, 200)
+BORDER_COLOR = (170, 170, 170)
+
+
+def preview_name(sha256):
+    """
+        Имя файла миниатюры в MEDIA_ROOT по хэшу содержимого файла документа
+    """
+    return posixpath.join(PREVIEWS_DIR, sha256[:2], sha256 + '.png')
+
+
+@lru_cache(maxsize=8)
+def get_font(size):
+    """
+        Шрифт миниатюр (DOCUMENT_PREVIEW_FONT; встроенный шрифт Pillow не содержит кириллицы и используется,
+        только если шрифт не найден)
+    """
+    try:
+        return ImageFont.truetype(settings.DOCUMENT_PREVIEW_FONT, size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def get_line_height(font):
+    return max(1, round(font.getbbox('Ag')[3] * LINE_SPACING))
+
+
+def draw_text(draw, lines, font, box):
+    """
+        Текст с переносом по словам, пока он помещается на страницу
+    """
+    left, top, right, bottom = box
+    line_height = get_line_height(font)
+    # ширина строки в символах по средней ширине буквы шрифта
+    columns = max(1, int((right - left) / max(1, draw.textlength('абвгдежзик', font=font) / 10)))
+    y = top
+    for line in lines:
+        for part in textwrap.wrap(line.strip(), columns) or ['']:
+            if y + line_height > bottom:
+                return
+            draw.text((left, y), part, fill=TEXT_COLOR, font=font)
+            y += line_height
+
+
+def draw_sheet(draw, rows, font, box):
+    """
+        Первые строки листа таблицы в сетке ячеек
+    """
+    left, top, right, bottom = box
+    line_height = get_line_height(font)
+    width = max((len(row) for row in rows), default=0)
+    if not width:
+        return
+    column_width = (right - left) / width
+    y = top
+    for row in rows:
+        if y + line_height > bottom:
+            break
+        for i, value in enumerate(row):
+            x = left + i * column_width
+            text = value
+            while text and draw.textlength(text, font=font) > column_width - 4:
+                text = text[:-1]
+            draw.text((x + 2, y + 1), text, fill=TEXT_COLOR, font=font)
+        y += line_height
+        draw.line((left, y, right, y), fill=GRID_COLOR)
+    for i in range(width + 1):
+        x = left + i * column_width
+        draw.line((x, top, x, y), fill=GRID_COLOR)
+    draw.line((left, top, right, top), fill=GRID_COLOR)
+
+
+def render_page(lines=None, rows=None):
+    """
+        Миниатюра первой страницы: текст (lines) или лист таблицы (rows)
+    """
+    width = settings.DOCUMENT_PREVIEW_WIDTH
+    height = round(width * PAGE_RATIO)
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, width - 1, height - 1), outline=BORDER_COLOR)
+    margin = round(width * PAGE_MARGIN)
+    box = (margin, margin, width - margin, height - margin)
+    font = get_font(max(6, width // 30))
+    if rows is not None:
+        draw_sheet(draw, rows, font, box)
+    else:
+        draw_text(draw, lines, font, box)
+    return image
+
+
+def save_image(image, name):
+    """
+        Запись миниатюры (через временный файл: одновременная отрисовка того же файла не оставит испорченную копию)
+    """
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.' + uuid.uuid4().hex + '.tmp'
+    image.save(tmp_path, 'PNG', optimize=True)
+    os.replace(tmp_path, path)
+
+
+def has_preview(sha256):
+    """
+        Есть ли миниатюра файла с таким содержимым (или файл не поддерживается и миниатюры у него нет)
+    """
+    preview = DocumentPreview.objects.filter(sha256=sha256).first()
+    return preview is not None and (not preview.image or default_storage.exists(preview.image))
+
+
+def save_preview(sha256, parsed):
+    """
+        Построение миниатюры первой страницы и сохранение количества страниц прочитанного файла документа
+        (parsed - None, если формат не поддерживается или файл поврежден)
+    """
+    values = {'page_count': None, 'unit': '', 'image': ''}
+    if parsed is not None:
+        name = preview_name(sha256)
+        save_image(render_page(parsed.lines, parsed.rows), name)
+        values = {'page_count': parsed.page_count, 'unit': parsed.unit, 'image': name}
+    try:
+        with atomic_write():
+            DocumentPreview.objects.update_or_create(sha256=sha256, defaults=values)
+    except IntegrityError:
+        # запись одновременно создал параллельный обработчик того же файла
+        DocumentPreview.objects.filter(sha256=sha256).update(**values)
+
+
+def for_documents(documents):
+    """
+        Миниатюры документов: ID документа => миниатюра (запрос к БД на весь список документов)
+
+        Хэш файла берется из имени файла в хранилище по содержимому, а для загруженных до него файлов - из записей
+        о файлах (файлы не читаются).
+    """
+    documents = [doc for doc in documents if doc.path]
+    hashes = {doc.id: name_sha256(doc.path.name) for doc in documents}
+    legacy = {doc.path.name for doc in documents if hashes[doc.id] is None}
+    if legacy:
+        names = dict(Blob.objects.filter(name__in=legacy).exclude(sha256='').values_list('name', 'sha256'))
+        for doc in documents:
+            if hashes[doc.id] is None:
+                hashes[doc.id] = names.get(doc.path.name)
+    previews = DocumentPreview.objects.in_bulk([sha for sha in hashes.values() if sha], field_name='sha256')
+    return {doc_id: previews[sha] for doc_id, sha in hashes.items() if sha in previews}
+
+
+def delete_images(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+def collect():
+    """
+        Удаление миниатюр файлов, записей о которых не осталось (см. app.blobs.collect)
+
+        Returns:
+            Количество удаленных миниатюр
+    """
+    previews = list(DocumentPreview.objects.filter(~Exists(Blob.objects.filter(sha256=OuterRef('sha256')))))
+    names = [preview.image for preview in previews if preview.image]
+    with transaction.atomic():
+        DocumentPreview.objects.filter(pk__in=[preview.pk for preview in previews]).delete()
+        transaction.on_commit(lambda: delete_images(names))
+    return len(previews)
@@ -0,0 +1,46 @@
+import os
+
+from app import extraction, previews
+from app.merging import document_hash
+from app.models import Document
+
+# обработка файла документа после сохранения (в фоне, см. app.signals): файл читается один раз (app.extraction),
+# из прочитанного сохраняются текст для поиска и миниатюра с количеством страниц (app.previews)
+
+
+def process_document(document_id, text=True, preview=True, force=False):
+    """
+        Извлечение текста и построение миниатюры файла документа
+
+        Если текст документа уже извлечен из файла с таким содержимым, а миниатюра такого файла уже есть -
+        файл не читается.
+
+        Args:
+            text: Извлечь текст для поиска
+            preview: Построить миниатюру и посчитать страницы
+            force: Построить миниатюру заново, даже если она уже есть
+
+        Returns:
+            True, если файл документа был прочитан
+    """
+    document = Document.objects.filter(pk=document_id).first()
+    if document is None:
+        return False
+
+    if not document.path or not os.path.exists(document.path.path):
+        if text:
+            extraction.remove_text(document)
+        return False
+
+    sha256 = document_hash(document)
+    text = text and not extraction.has_text(document_id, sha256)
+    preview = preview and (force or not previews.has_preview(sha256))
+    if not text and not preview:
+        return False
+
+    parsed = extraction.read_file(document.path.path)
+    if text:
+        extraction.save_text(document, sha256, parsed)
+    if preview:
+        previews.save_preview(sha256, parsed)
+    return True
@@ -0,0 +1,451 @@
+import copy
+from urllib.parse import urljoin
+
+import xlsxwriter
+from django.db.models import Prefetch, Sum
+
+from app import cache
+from app.streaming import open_workbook
+from app.models import Discipline, Fos, FosStat
+
+
+class DisciplinesSummary:
+    """
+        Сводная матрица "вид обучения -> дисциплина -> количество ФОСов каждого типа"
+        для отчета по дисциплинам кафедры.
+
+        Вся матрица строится фиксированным числом запросов (независимо от количества дисциплин и типов ФОСов):
+        справочники, список дисциплин и одна выборка количества ФОСов из статистики ФОСов (см. app.stats).
+
+        Attributes:
+            years: Период обучения (None - за все периоды)
+            types: Типы ФОСов (колонки отчета)
+            qualifications: Виды обучения, у каждого из которых заполнен список дисциплин (атрибут disciplines),
+                а у каждой дисциплины - словарь количества ФОСов по типам (атрибут count_foses)
+            total_by_types: Количество ФОСов каждого типа по всем дисциплинам
+            total: Общее количество ФОСов
+            total_dis: Общее количество дисциплин в отчете
+            max_width: Длина самого длинного названия дисциплины
+    """
+
+    def __init__(self, years=None):
+        self.years = years
+        self.types = cache.fos_types()
+        # виды обучения копируются: к ним добавляется список дисциплин отчета
+        self.qualifications = [copy.copy(q) for q in cache.qualifications()]
+        self.total_by_types = {t.id: 0 for t in self.types}
+        self.total = 0
+        self.total_dis = 0
+        self.max_width = 0
+        self._build()
+
+    def _build(self):
+        """
+            Заполнение матрицы данными из БД
+        """
+        disciplines = Discipline.objects.filter(qualification__isnull=False)
+        # количество ФОСов берем из статистики ФОСов (см. app.stats)
+        stats = FosStat.objects.filter(qualification__isnull=False)
+        if self.years is not None:
+            # в отчет за период попадают только дисциплины, у которых есть ФОСы этого периода
+            stats = stats.filter(years=self.years)
+            disciplines = disciplines.filter(pk__in=stats.values('discipline_id'))
+
+        # одним запросом получаем количество ФОСов в разрезе (дисциплина, тип)
+        counts = {}
+        for row in stats.values('discipline_id', 'fos_type_id').annotate(total=Sum('count')).order_by():
+            counts[(row['discipline_id'], row['fos_type_id'])] = row['total']
+
+        by_qualification = {q.id: [] for q in self.qualifications}
+        for d in disciplines.only('id', 'name', 'qualification_id').order_by('id'):
+            d.count_foses = {}
+            for t in self.types:
+                d.count_foses[t.id] = counts.get((d.id, t.id), 0)
+                self.total_by_types[t.id] += d.count_foses[t.id]
+            by_qualification[d.qualification_id].append(d)
+            if len(d.name) > self.max_width:
+                self.max_width = len(d.name)
+            self.total_dis += 1
+
+        for q in self.qualifications:
+            q.disciplines = by_qualification[q.id]
+
+        self.total = sum(self.total_by_types.values())
+
+
+class TeacherFosSummary:
+    """
+        Данные отчета по ФОСам преподавателя.
+
+        Дисциплины преподавателя, их ФОСы и типы ФОСов загружаются один раз (prefetch_related/select_related),
+        все разделы отчета (колонки дисциплин, объединение пустых ячеек, итоги по типам, диаграммы)
+        читают данные из этой структуры без дополнительных запросов.
+
+        Attributes:
+            disciplines: Дисциплины преподавателя, у каждой в атрибуте foses - список ее ФОСов
+            count_fos: Количество ФОСов в каждой дисциплине (в порядке disciplines)
+            max_count: Наибольшее количество ФОСов среди дисциплин
+            fos_types: Типы ФОСов преподавателя (id => тип) с количеством ФОСов в атрибуте total
+            all_total: Общее количество ФОСов
+    """
+
+    def __init__(self, teacher_id):
+        self.disciplines = list(
+            Discipline.objects.filter(users__id=teacher_id).order_by('id').prefetch_related(
+                Prefetch('fos_set', queryset=Fos.objects.select_related('type').order_by('id'), to_attr='foses')
+            )
+        )
+        self.count_fos = [len(d.foses) for d in self.disciplines]
+        self.max_count = max(self.count_fos, default=0)
+
+        # типы ФОСов без повторений в порядке их появления и количество ФОСов каждого типа
+        self.fos_types = {}
+        self.all_total = 0
+        for d in self.disciplines:
+            for f in d.foses:
+                if f.type_id not in self.fos_types:
+                    f.type.total = 0
+                    self.fos_types[f.type_id] = f.type
+                self.fos_types[f.type_id].total += 1
+                self.all_total += 1
+
+
+def write_disciplines_report(output, summary, base_url):
+    """
+        Запись отчета дисциплин заданного периода обучения в excel файл
+
+        Args:
+            output: Путь к файлу или файловый объект, в который записывается отчет
+            summary: Данные отчета (DisciplinesSummary)
+            base_url: Адрес сайта для формирования ссылок на дисциплины
+    """
+    data = summary.qualifications
+    types = summary.types
+    total_by_types = summary.total_by_types
+    total_dis = summary.total_dis
+    max_width = summary.max_width
+    total = summary.total
+
+    # создаем объект для работы с записью в excel файл
+    # (в режиме постоянного расхода памяти: строки пишутся строго сверху вниз и сразу сбрасываются на диск)
+    workbook = open_workbook(output)
+
+    # инициализируем лист
+    worksheet = workbook.add_worksheet()
+
+    # добавляем заголовок
+    header_format = workbook.add_format({
+        'bg_color': '#F7F7F7', 'bold': True, 'font_size': 14, 'color': 'black', 'align': 'center', 'valign': 'vcenter', 'border': 1
+    })
+    if summary.years is not None:
+        title = 'Оценочные средства кафедры ИС и ПИ ('+dict(cache.years_choices())[summary.years]+')'
+    else:
+        title = 'Оценочные средства кафедры ИС и ПИ'
+    worksheet.merge_range(
+        first_row=1, first_col=2, last_col = 1 + len(types), last_row=2,
+        data=title, cell_format=header_format
+    )
+
+    default_format = workbook.add_format({
+        'border': 1, 'align': 'center', 'valign': 'vcenter'
+    })
+
+    # шапка таблицы - одна высокая строка (объединение ячеек по двум строкам недоступно при построчной записи)
+    worksheet.set_row(3, 30)
+    worksheet.merge_range(
+        first_row=3, first_col=0, last_col=1, last_row=3,
+        data='Дисциплины', cell_format=default_format
+    )
+
+    worksheet.set_column(0, 0, max_width + 10)
+    q_format = workbook.add_format({
+        'border': 1, 'align': 'center', 'valign': 'vcenter',  'text_wrap': True, 'bold': True
+    })
+    disc_format = workbook.add_format({
+        'border': 1, 'align': 'center', 'valign': 'vcenter',  'text_wrap': True, 'color': 'blue', 'underline': 1,
+    })
+    t_format = workbook.add_format({
+        'border': 1, 'align': 'center', 'valign': 'vcenter', 'text_wrap': True
+    })
+
+    col = 2
+    for t in types:
+        worksheet.write(3, col, t.name, t_format)
+        worksheet.set_column(col, col, 17)
+        col += 1
+
+    row = 4
+    for q in data:
+        worksheet.merge_range(
+            first_row=row, first_col=0, last_col=1, last_row=row,
+            data=q.name, cell_format=q_format
+        )
+        worksheet.merge_range(
+            first_row=row, first_col=2, last_col=len(types)+1, last_row=row,
+            data='', cell_format=q_format
+        )
+        row += 1
+        for d in q.disciplines:
+            worksheet.merge_range(
+                first_row=row, first_col=0, last_col=1, last_row=row,
+                data=d.name, cell_format=disc_format
+            )
+            worksheet.write_url(row, 0, urljoin(base_url, d.get_admin_url()), string=d.name, cell_format=disc_format)
+            col = 2
+            for cf in d.count_foses.values():
+                worksheet.write(row, col, cf, t_format)
+                col += 1
+            row += 1
+
+    worksheet.write(row, 0, 'Всего', t_format)
+    worksheet.write(row, 1, total, t_format)
+
+    col = 2
+    for tbt in total_by_types.values():
+        worksheet.write(row, col, tbt, t_format)
+        col += 1
+
+    # создаем гистограмму
+    chart = workbook.add_chart({'type': 'column'})
+
+    # наименования - первый столбец (типы ФОСов)
+    # значения - второй столбец (кол-во)
+    # [sheetname, first_row, first_col, last_row, last_col]
+    chart.add_series({
+        "categories": ['Sheet1', 3, 2, 3, len(types)+1],
+        "values": ['Sheet1', row, 2, row, len(types)+1],
+        'data_labels': {'value': True},
+    })
+
+    # добавляем заголовки и убираем легенду
+    chart.set_title({"name": "Оценочные средства кафедры"})
+    chart.set_x_axis({"name": "Оценочные средства"})
+    chart.set_y_axis({"name": "Кол-во"})
+    chart.set_legend({'none': True})
+
+    # вставляем гистограмму на лист
+    worksheet.insert_chart(
+        'A' + str(10 + total_dis + 2),
+        chart, {'x_scale': 2, 'y_scale': 1}
+    )
+
+    data_labels = []
+    empty_indexes = []
+    i = 0
+    for tbt in total_by_types.values():
+        if tbt == 0:
+            data_labels.append({'delete': True})
+            empty_indexes.append(i)
+        else:
+            data_labels.append(None)
+        i += 1
+
+    # создаем и добавляем на лист круговую диаграмму
+    chart_pie = workbook.add_chart({'type': 'pie'})
+    chart_pie.add_series({
+        "categories": ['Sheet1', 3, 2, 3, len(types)+1],
+        "values": ['Sheet1', row, 2, row, len(types)+1],
+        'data_labels': {'percentage': True, 'custom': data_labels},
+    })
+    chart_pie.set_title({"name": "Оценочные средства кафедры"})
+    chart_pie.set_legend({'delete_series': empty_indexes})
+
+    worksheet.insert_chart(
+        'A' + str(10 + total_dis + 19),
+        chart_pie, {'x_scale': 2, 'y_scale': 1}
+    )
+
+    # сохраняем excel документ
+    workbook.close()
+
+
+def write_fos_report(output, teacher, summary):
+    """
+        Запись отчета ФОСов преподавателя в excel файл
+
+        Args:
+            output: Путь к файлу или файловый объект, в который записывается отчет
+            teacher: Преподаватель
+            summary: Данные отчета (TeacherFosSummary)
+    """
+    disciplines = summary.disciplines
+
+    # создаем объект для работы с записью в excel файл
+    # (отчет заполняется по колонкам-дисциплинам, поэтому построчная запись с постоянным расходом памяти
+    # к нему неприменима; объем отчета ограничен ФОСами одного преподавателя)
+    workbook = xlsxwriter.Workbook(output)
+
+    # инициализируем лист
+    worksheet = workbook.add_worksheet()
+
+    # добавляем заголовок
+    worksheet.merge_range('A2:H2', 'Фонд оценочных средств', workbook.add_format({
+        'bold': True, 'font_size': 14, 'align': 'left', 'valign': 'vcenter'
+    }))
+
+    # создаем стиль для заголовочной строки таблицы
+    header = workbook.add_format({
+        'bg_color': '#F7F7F7', 'bold': True, 'color': 'black', 'align': 'center', 'valign': 'vcenter', 'border': 1
+    })
+
+    # добавляем заголовочные строки таблицы
+    worksheet.merge_range('A4:A5', 'Преподаватель', header)
+    # формируем заголовок "дисциплины" (3 строка и объединяем столько колонок - сколько дисциплин)
+    if len(disciplines) == 1:
+        worksheet.write(3, 1, 'Дисциплины', header)
+    else:
+        worksheet.merge_range(
+            first_row=3, first_col=1, last_row=3, last_col=len(disciplines),
+            data='Дисциплины', cell_format=header
+        )
+    worksheet.set_column(0, 0, 25)
+    worksheet.set_column(1, len(disciplines), 15)
+
+    style_default = workbook.add_format({'border': 1})
+    style = workbook.add_format({
+        'align': 'center', 'valign': 'vcenter', 'border': 1, 'text_wrap': True
+    })
+    col = 1
+    count_fos = summary.count_fos
+    # перебираем все дисциплины
+    for d in disciplines:
+        # записываем название дисциплины в 4 строку в соответствующую колонку
+        worksheet.write(4, col, d.name, header)
+        # ширина такой ячейки - кол-во букв в дисциплине + 10
+        worksheet.set_column(col, col, len(d.name) + 10)
+
+        row = 5
+        names = []
+        # перебираем все ФОСы дисциплины
+        for f in d.foses:
+            fos = f.name + " (" + f.type.name + ")"
+            names.append(fos)
+            # начиная с 5 строки и соответствующей колонки записываем ФОС
+            worksheet.write(row, col, fos, style_default)
+            # переходим на след строку
+            row += 1
+        if len(names) > 0:
+            # выставляем ширину колонки по максимально большому названию из ФОСов
+            worksheet.set_column(col, col, len(max(names, key=len)))
+        else:
+            # если ФОСов в пределах дисциплины нет - пишем прочерк
+            worksheet.write(row, col, '-', style)
+        # переходим на следующую колонку
+        col = col + 1
+
+    # записываем имя преподавателя в 6 строку
+    if teacher.first_name or teacher.last_name:
+        username = teacher.first_name + " " + teacher.last_name
+    else:
+        username = teacher.username
+
+    # делаем эту ячейку по ширине равной самому большому кол-ву строк ФОСов в дисциплинах
+    if (5 + max(count_fos)) == 6:
+        worksheet.write('A6:A6', username, style)
+    else:
+        worksheet.merge_range('A6:A' + str(5 + max(count_fos)), username, style)
+
+    # далее необходимо найти пустые ячейки в каждой колонке (где ФОСов нет)
+    # объединить их и поставить прочерк
+    col = 1
+    for d in disciplines:
+        last_row = 0
+        # в пределах каждой колонки (дисциплины) ищем последнюю заполненную строчку
+        if len(d.foses) < max(count_fos):
+            # запоминаем индекс следующей пустой строки
+            last_row = 5 + len(d.foses)
+        if last_row != 0:
+            # в случае если есть пустые строки
+            fr = last_row
+            lw = max(count_fos) + 4
+
+            if fr == lw:
+                # если такая ячейка одна - ставим прочерк в ней
+                worksheet.write(fr, col, '-', style)
+            else:
+                # если их несколько - объединяем все и ставим прочерк по центру
+                worksheet.merge_range(
+                    first_row=last_row, first_col=col, last_row=max(count_fos) + 4, last_col=col,
+                    data='-', cell_format=style
+                )
+        col = col + 1
+
+    # формируем стили для подписи "оценочные средства" справа от таблицы
+    fos_text_style = workbook.add_format({'align': 'center', 'valign': 'vcenter', 'border': 1})
+    # разворачиваем текст
+    fos_text_style.set_rotation(90)
+    # добавляем перенос слов
+    fos_text_style.set_text_wrap(True)
+    # объединяем ячейки колонки {кол-во дисциплин+1} ОТ 5 строки + кол-во строк ФОСов
+    # и пишем туда текст
+    worksheet.merge_range(
+        first_row=5, first_col=len(disciplines) + 1, last_row=max(count_fos) + 4, last_col=len(disciplines) + 1,
+        data='Оценочные средства', cell_format=fos_text_style
+    )
+
+    # далее формируем итоговую таблицу (где первый столбец - тип ФОСа, второй - их общее количество)
+    # добавляем заголовок
+    row = 7 + max(count_fos)
+    worksheet.merge_range(
+        first_row=row, first_col=0, last_row=row + 2, last_col=1,
+        data='Общее количество оценочных средств', cell_format=style
+    )
+
+    # словарь, где элементы это типы ФОСов без повторений (с посчитанным кол-вом каждого типа), и общее кол-во
+    fos_types = summary.fos_types
+    all_total = summary.all_total
+
+    # перебираем все типы ФОСов
+    row = 10 + max(count_fos)
+    for ft in fos_types:
+        # в первую колонку пишем название
+        worksheet.write(row, 0, fos_types[ft].name, style)
+        # во вторую - кол-во
+        worksheet.write(row, 1, fos_types[ft].total, style)
+        row += 1
+
+    # добавляем строку где выводится общее кол-во всех ФОСОв
+    total_format = workbook.add_format({
+        'align': 'center', 'valign': 'vcenter', 'border': 1, 'bold': True
+    })
+    worksheet.write(row, 0, 'Всего оценочных средств', total_format)
+    # worksheet.write_formula(row, 1, '=SUM(B16:B'+str(row)+')', total_format)
+    worksheet.write(row, 1, all_total, total_format)
+
+    # создаем гистограмму
+    chart = workbook.add_chart({'type': 'column'})
+
+    # наименования - первый столбец (типы ФОСов)
+    # значения - второй столбец (кол-во)
+    chart.add_series({
+        "categories": '=Sheet1!$A$' + str(11 + max(count_fos)) + ':$A$' + str(row),
+        "values": '=Sheet1!$B$' + str(11 + max(count_fos)) + ':$B$' + str(row)
+    })
+
+    # добавляем заголовки и убираем легенду
+    chart.set_title({"name": "Общее количество ОС"})
+    chart.set_x_axis({"name": "Оценочные средства"})
+    chart.set_y_axis({"name": "Кол-во"})
+    chart.set_legend({'none': True})
+
+    # вставляем гистограмму на лист
+    worksheet.insert_chart(
+        'A' + str(14 + max(count_fos) + len(fos_types)),
+        chart, {'x_scale': 2, 'y_scale': 1}
+    )
+
+    # создаем и добавляем на лист круговую диаграмму
+    chart_pie = workbook.add_chart({'type': 'pie'})
+    chart_pie.add_series({
+        "categories": '=Sheet1!$A$' + str(11 + max(count_fos)) + ':$A$' + str(row),
+        "values": '=Sheet1!$B$' + str(11 + max(count_fos)) + ':$B$' + str(row),
+        'data_labels': {'value': True},
+    })
+    chart_pie.set_title({"name": "Общее количество ОС"})
+    worksheet.insert_chart(
+        'A' + str(14 + max(count_fos) + len(fos_types) + 15),
+        chart_pie, {'x_scale': 2, 'y_scale': 1}
+    )
+
+    # сохраняем excel документ
+    workbook.close()
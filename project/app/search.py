@@ -0,0 +1,193 @@
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from app.models import Discipline, Document, DocumentText, Fos, SearchEntry
+from app.stemming import WORD_RE, stem, stem_text
+
+# полнотекстовый индекс SQLite (FTS5) над таблицей записей поискового индекса, см. миграцию 0005
+FTS_TABLE = 'app_searchentry_fts'
+
+# есть ли в БД полнотекстовый индекс SQLite (FTS5 может быть не собран в SQLite)
+_fts_available = {}
+
+# сколько записей индекса вставлять одним запросом при перестроении индекса
+REBUILD_BATCH_SIZE = 1000
+
+
+def has_fts():
+    if connection.alias not in _fts_available:
+        _fts_available[connection.alias] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_available[connection.alias]
+
+
+def _save_entry(kind, object_id, discipline_id, content, fos_id=None):
+    SearchEntry.objects.update_or_create(kind=kind, object_id=object_id, defaults={
+        'discipline_id': discipline_id,
+        'fos_id': fos_id,
+        'content': content,
+        'terms': stem_text(content),
+    })
+
+
+def index_discipline(discipline):
+    """
+        Добавление (обновление) дисциплины в поисковом индексе
+    """
+    _save_entry(SearchEntry.KIND_DISCIPLINE, discipline.id, discipline.id, discipline.name)
+
+
+def index_disciplines(disciplines):
+    """
+        Добавление (обновление) дисциплин в поисковом индексе массово (после массового импорта)
+    """
+    ids = [d.id for d in disciplines]
+    SearchEntry.objects.filter(kind=SearchEntry.KIND_DISCIPLINE, object_id__in=ids).delete()
+    SearchEntry.objects.bulk_create([
+        SearchEntry(kind=SearchEntry.KIND_DISCIPLINE, object_id=d.id, discipline_id=d.id, content=d.name,
+                    terms=stem_text(d.name))
+        for d in disciplines
+    ], batch_size=1000)
+
+
+def index_foses(foses):
+    """
+        Добавление (обновление) ФОСов в поисковом индексе массово (после массового создания)
+    """
+    ids = [f.id for f in foses]
+    SearchEntry.objects.filter(kind=SearchEntry.KIND_FOS, object_id__in=ids).delete()
+    entries = []
+    for f in foses:
+        content = f.name + '\n' + (f.description or '')
+        entries.append(SearchEntry(kind=SearchEntry.KIND_FOS, object_id=f.id, discipline_id=f.discipline_id,
+                                   fos_id=f.id, content=content, terms=stem_text(content)))
+    SearchEntry.objects.bulk_create(entries, batch_size=REBUILD_BATCH_SIZE)
+
+
+def index_documents(documents):
+    """
+        Добавление (обновление) документов в поисковом индексе массово (после массового создания);
+        ФОСы документов должны быть загружены
+    """
+    ids = [d.id for d in documents]
+    texts = dict(DocumentText.objects.filter(document_id__in=ids).values_list('document_id', 'content'))
+    SearchEntry.objects.filter(kind=SearchEntry.KIND_DOCUMENT, object_id__in=ids).delete()
+    entries = []
+    for d in documents:
+        content = d.name + '\n' + texts.get(d.id, '')
+        entries.append(SearchEntry(kind=SearchEntry.KIND_DOCUMENT, object_id=d.id, discipline_id=d.fos.discipline_id,
+                                   fos_id=d.fos_id, content=content, terms=stem_text(content)))
+    SearchEntry.objects.bulk_create(entries, batch_size=REBUILD_BATCH_SIZE)
+
+
+def index_fos(fos):
+    """
+        Добавление (обновление) ФОСа в поисковом индексе
+    """
+    _save_entry(SearchEntry.KIND_FOS, fos.id, fos.discipline_id, fos.name + '\n' + (fos.description or ''), fos.id)
+    # документы ФОСа следуют за ним при переносе в другую дисциплину
+    SearchEntry.objects.filter(kind=SearchEntry.KIND_DOCUMENT, fos_id=fos.id).exclude(
+        discipline_id=fos.discipline_id
+    ).update(discipline_id=fos.discipline_id)
+
+
+def index_document(document):
+    """
+        Добавление (обновление) документа в поисковом индексе (название и извлеченный из файла текст)
+    """
+    discipline_id = Fos.objects.values_list('discipline_id', flat=True).get(pk=document.fos_id)
+    text = DocumentText.objects.filter(document_id=document.id).values_list('content', flat=True).first()
+    _save_entry(SearchEntry.KIND_DOCUMENT, document.id, discipline_id, document.name + '\n' + (text or ''),
+                document.fos_id)
+
+
+def remove(kind, object_id):
+    """
+        Удаление объекта из поискового индекса
+    """
+    SearchEntry.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def rebuild():
+    """
+        Полное перестроение поискового индекса
+
+        Returns:
+            Количество записей в индексе
+    """
+    SearchEntry.objects.all().delete()
+    entries = []
+    total = 0
+
+    def add(entry):
+        nonlocal total
+        # записи индекса вставляются частями, чтобы не держать в памяти индекс большой БД целиком
+        entries.append(entry)
+        total += 1
+        if len(entries) >= REBUILD_BATCH_SIZE:
+            SearchEntry.objects.bulk_create(entries)
+            entries.clear()
+
+    for d in Discipline.objects.only('id', 'name').iterator():
+        add(SearchEntry(kind=SearchEntry.KIND_DISCIPLINE, object_id=d.id, discipline_id=d.id,
+                        content=d.name, terms=stem_text(d.name)))
+    for f in Fos.objects.only('id', 'name', 'description', 'discipline_id').iterator():
+        content = f.name + '\n' + (f.description or '')
+        add(SearchEntry(kind=SearchEntry.KIND_FOS, object_id=f.id, discipline_id=f.discipline_id,
+                        fos_id=f.id, content=content, terms=stem_text(content)))
+    for doc in Document.objects.values('id', 'name', 'fos_id', 'fos__discipline_id', 'text__content').iterator():
+        content = doc['name'] + '\n' + (doc['text__content'] or '')
+        add(SearchEntry(kind=SearchEntry.KIND_DOCUMENT, object_id=doc['id'],
+                        discipline_id=doc['fos__discipline_id'], fos_id=doc['fos_id'],
+                        content=content, terms=stem_text(content)))
+    SearchEntry.objects.bulk_create(entries)
+    return total
+
+
+def match(search_term, kinds):
+    """
+        Записи поискового индекса заданных видов, содержащие все слова поисковой строки
+        (с учетом словоформ русского языка)
+    """
+    words = WORD_RE.findall(search_term)
+    entries = SearchEntry.objects.filter(kind__in=kinds)
+    if not words:
+        return entries.none()
+
+    if connection.vendor == 'postgresql':
+        return entries.filter(id__in=RawSQL(
+            "SELECT id FROM app_searchentry WHERE to_tsvector('russian', content) @@ plainto_tsquery('russian', %s)",
+            [' '.join(words)]
+        ))
+
+    stems = [stem(w) for w in words]
+    if connection.vendor == 'sqlite' and has_fts():
+        # каждая основа ищется как префикс, слова объединяются по "И"
+        query = ' '.join('"' + s + '"*' for s in stems)
+        return entries.filter(id__in=RawSQL(
+            'SELECT rowid FROM ' + FTS_TABLE + ' WHERE ' + FTS_TABLE + ' MATCH %s', [query]
+        ))
+
+    condition = Q()
+    for s in stems:
+        condition &= Q(terms__contains=s)
+    return entries.filter(condition)
+
+
+def search_disciplines(queryset, search_term):
+    """
+        Дисциплины, в названии которых, в названиях их ФОСов или документов встречается поисковая строка
+    """
+    matched = match(search_term, [SearchEntry.KIND_DISCIPLINE, SearchEntry.KIND_FOS, SearchEntry.KIND_DOCUMENT])
+    return queryset.filter(pk__in=matched.values('discipline_id'))
+
+
+def search_foses(queryset, search_term):
+    """
+        ФОСы, в названии или описании которых, в названиях или тексте их документов
+        (или в названии их дисциплины) встречается поисковая строка
+    """
+    return queryset.filter(
+        Q(pk__in=match(search_term, [SearchEntry.KIND_FOS, SearchEntry.KIND_DOCUMENT]).values('fos_id')) |
+        Q(discipline_id__in=match(search_term, [SearchEntry.KIND_DISCIPLINE]).values('object_id'))
+    )
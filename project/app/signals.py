@@ -0,0 +1,160 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from app import blobs, cache, jobs, merging, processing, search, stats
+from app.models import Discipline, DisciplineType, Document, Fos, FosType, Qualification, SearchEntry
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def invalidate_merged_documents(sender, instance, **kwargs):
+    """
+        Сброс кэша объединенных документов ФОСа при изменении или удалении документа
+    """
+    merging.invalidate(instance.fos_id)
+
+
+@receiver(post_save, sender=Discipline)
+def index_discipline(sender, instance, **kwargs):
+    """
+        Обновление дисциплины в поисковом индексе
+    """
+    search.index_discipline(instance)
+
+
+@receiver(post_save, sender=Fos)
+def index_fos(sender, instance, **kwargs):
+    """
+        Обновление ФОСа в поисковом индексе
+    """
+    search.index_fos(instance)
+
+
+@receiver(post_save, sender=Document)
+def index_document(sender, instance, **kwargs):
+    """
+        Обновление документа в поисковом индексе, извлечение текста из его файла и построение миниатюры (в фоне)
+    """
+    search.index_document(instance)
+    jobs.defer(processing.process_document, instance.id)
+
+
+@receiver(post_delete, sender=Discipline)
+@receiver(post_delete, sender=Fos)
+@receiver(post_delete, sender=Document)
+def remove_from_search_index(sender, instance, **kwargs):
+    """
+        Удаление объекта из поискового индекса
+    """
+    kinds = {Discipline: SearchEntry.KIND_DISCIPLINE, Fos: SearchEntry.KIND_FOS, Document: SearchEntry.KIND_DOCUMENT}
+    search.remove(kinds[sender], instance.id)
+
+
+@receiver(pre_save, sender=Fos)
+def remember_fos_stat_key(sender, instance, **kwargs):
+    """
+        Запоминание ключа статистики ФОСа до изменения (дисциплина, тип и период могут поменяться)
+    """
+    instance._fos_stat_key = None
+    if not instance._state.adding:
+        old = Fos.objects.filter(pk=instance.pk).values_list('discipline_id', 'type_id', 'years').first()
+        if old:
+            instance._fos_stat_key = stats.fos_key(*old)
+
+
+@receiver(post_save, sender=Fos)
+def update_fos_stat(sender, instance, **kwargs):
+    """
+        Обновление статистики ФОСов при добавлении или изменении ФОСа
+    """
+    key = stats.fos_key(instance.discipline_id, instance.type_id, instance.years)
+    old_key = getattr(instance, '_fos_stat_key', None)
+    if old_key == key:
+        return
+    if old_key:
+        stats.decrement(old_key)
+    stats.increment(key)
+
+
+@receiver(post_delete, sender=Fos)
+def remove_fos_stat(sender, instance, **kwargs):
+    """
+        Обновление статистики ФОСов при удалении ФОСа
+    """
+    stats.decrement(stats.fos_key(instance.discipline_id, instance.type_id, instance.years))
+
+
+@receiver(post_save, sender=Discipline)
+def update_fos_stat_qualification(sender, instance, created, **kwargs):
+    """
+        Перенос статистики ФОСов дисциплины на ее текущий вид обучения
+    """
+    if not created:
+        stats.sync_qualifications([instance.pk])
+
+
+@receiver(post_save, sender=FosType)
+@receiver(post_delete, sender=FosType)
+@receiver(post_save, sender=DisciplineType)
+@receiver(post_delete, sender=DisciplineType)
+@receiver(post_save, sender=Qualification)
+@receiver(post_delete, sender=Qualification)
+def invalidate_reference_cache(sender, instance, **kwargs):
+    """
+        Сброс кэша справочника при изменении или удалении его записи
+    """
+    names = {FosType: cache.FOS_TYPES, DisciplineType: cache.DISCIPLINE_TYPES, Qualification: cache.QUALIFICATIONS}
+    cache.invalidate(names[sender])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Discipline)
+@receiver(m2m_changed, sender=Discipline.users.through)
+def invalidate_teachers_cache(sender, **kwargs):
+    """
+        Сброс справочника преподавателей при изменении пользователя или преподавателей дисциплины
+        (в том числе при удалении дисциплины вместе с ее связями с преподавателями)
+    """
+    # вход пользователя (обновление даты последнего входа) и подготовка изменения связей справочник не меняют
+    if kwargs.get('update_fields') == frozenset(['last_login']):
+        return
+    if kwargs.get('action', 'post_').startswith('post_'):
+        cache.invalidate(cache.TEACHERS)
+
+
+@receiver(pre_save, sender=Document)
+def remember_document_file(sender, instance, **kwargs):
+    """
+        Запоминание файла документа до изменения (количество ссылок на файлы обновляется после сохранения)
+    """
+    instance._blob_name = None
+    if not instance._state.adding:
+        instance._blob_name = Document.objects.filter(pk=instance.pk).values_list('path', flat=True).first() or None
+    if not instance.path:
+        instance.file_name = ''
+
+
+@receiver(post_save, sender=Document)
+def update_blob_refcount(sender, instance, **kwargs):
+    """
+        Обновление количества ссылок на файлы документов при добавлении или изменении документа
+    """
+    name = instance.path.name or None
+    old_name = getattr(instance, '_blob_name', None)
+    if name == old_name:
+        return
+    if name:
+        blobs.acquire(name)
+    if old_name:
+        blobs.release(old_name)
+
+
+@receiver(post_delete, sender=Document)
+def release_blob(sender, instance, **kwargs):
+    """
+        Уменьшение количества ссылок на файл удаленного документа
+    """
+    if instance.path:
+        blobs.release(instance.path.name)
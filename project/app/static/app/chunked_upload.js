@@ -0,0 +1,149 @@
+// загрузка файлов документов по частям (поле app.uploads.ChunkedFileInput)
+//
+// выбранный файл загружается частями до отправки формы: расширение и размер проверяются до начала загрузки,
+// после обрыва соединения загрузка продолжается с первого не полученного сервером байта (в т.ч. после
+// перезагрузки страницы - идентификатор загрузки хранится в sessionStorage). С формой отправляется только
+// идентификатор завершенной загрузки.
+(function () {
+    'use strict';
+
+    // пауза перед повтором после ошибки сети (мс) и количество повторов подряд
+    var RETRY_DELAY = 2000;
+    var MAX_RETRIES = 10;
+
+    function csrfToken(input) {
+        var field = input.form && input.form.querySelector('input[name=csrfmiddlewaretoken]');
+        if (field) {
+            return field.value;
+        }
+        var match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        return match ? decodeURIComponent(match[1]) : '';
+    }
+
+    function storageKey(file) {
+        return 'chunked-upload:' + file.name + ':' + file.size + ':' + file.lastModified;
+    }
+
+    function sleep(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    function request(input, url, method, body) {
+        return fetch(url, {
+            method: method,
+            body: body,
+            credentials: 'same-origin',
+            headers: {'X-CSRFToken': csrfToken(input), 'X-Requested-With': 'XMLHttpRequest'}
+        }).then(function (response) {
+            return response.json().catch(function () { return {}; }).then(function (data) {
+                data.status = response.status;
+                return data;
+            });
+        });
+    }
+
+    function setStatus(input, text, isError) {
+        var status = input.parentNode.querySelector('.chunked-upload-status');
+        if (!status) {
+            status = document.createElement('div');
+            status.className = 'chunked-upload-status help';
+            input.parentNode.insertBefore(status, input.nextSibling);
+        }
+        status.textContent = text;
+        status.style.color = isError ? '#ba2121' : '';
+    }
+
+    // начало загрузки или продолжение ранее начатой загрузки того же файла
+    async function startOrResume(input, file) {
+        var token = sessionStorage.getItem(storageKey(file));
+        if (token) {
+            var state = await request(input, input.dataset.uploadUrl + '/' + token, 'GET');
+            if (state.status === 200) {
+                return state;
+            }
+        }
+        var body = new FormData();
+        body.append('file_name', file.name);
+        body.append('size', file.size);
+        state = await request(input, input.dataset.uploadUrl, 'POST', body);
+        if (state.status !== 201) {
+            throw new Error(state.error || 'Не удалось начать загрузку');
+        }
+        sessionStorage.setItem(storageKey(file), state.token);
+        return state;
+    }
+
+    async function upload(input, hidden, file) {
+        var state = await startOrResume(input, file);
+        var retries = 0;
+        while (!state.complete) {
+            var end = Math.min(state.offset + state.chunk_size, state.size);
+            var body = new FormData();
+            body.append('chunk', file.slice(state.offset, end), file.name);
+            setStatus(input, 'Загрузка: ' + Math.floor(state.offset * 100 / state.size) + '%');
+            var result;
+            try {
+                result = await request(input, state.url + '?offset=' + state.offset, 'POST', body);
+            } catch (e) {
+                // обрыв соединения: состояние загрузки запрашивается заново после паузы
+                if (++retries > MAX_RETRIES) {
+                    throw new Error('Нет связи с сервером, выберите файл еще раз, чтобы продолжить загрузку');
+                }
+                setStatus(input, 'Нет связи с сервером, повтор...', true);
+                await sleep(RETRY_DELAY);
+                result = await request(input, state.url, 'GET').catch(function () { return state; });
+            }
+            if (result.status === 200 || result.status === 409) {
+                // 409 - часть не продолжает полученные данные: загрузка продолжается с offset из ответа
+                state = result;
+                retries = 0;
+            } else if (result.status !== undefined) {
+                throw new Error(result.error || 'Ошибка загрузки');
+            }
+        }
+        sessionStorage.removeItem(storageKey(file));
+        hidden.value = state.token;
+        // файл уже на сервере - с формой он не отправляется
+        input.value = '';
+        setStatus(input, 'Загружен файл ' + state.file_name);
+    }
+
+    document.addEventListener('change', function (event) {
+        var input = event.target;
+        if (!input.dataset || !input.dataset.uploadUrl || !input.files || !input.files.length || !window.fetch) {
+            return;
+        }
+        var file = input.files[0];
+        var hidden = input.parentNode.querySelector('input[name="' + input.dataset.uploadField + '"]') ||
+            (input.form && input.form.querySelector('input[name="' + input.dataset.uploadField + '"]'));
+        var extension = file.name.split('.').pop().toLowerCase();
+        hidden.value = '';
+        if (input.dataset.extensions.split(',').indexOf(extension) === -1) {
+            setStatus(input, 'Допустимые расширения: ' + input.dataset.extensions.split(',').join(', '), true);
+            input.value = '';
+            return;
+        }
+        if (file.size > Number(input.dataset.maxSize)) {
+            setStatus(input, 'Максимальный размер загружаемых файлов: ' +
+                Math.round(Number(input.dataset.maxSize) / 1024 / 1024) + ' Мб', true);
+            input.value = '';
+            return;
+        }
+
+        input.dataset.uploading = '1';
+        upload(input, hidden, file).catch(function (e) {
+            input.value = '';
+            setStatus(input, e.message, true);
+        }).then(function () {
+            delete input.dataset.uploading;
+        });
+    });
+
+    // форма не отправляется, пока не завершены загрузки
+    document.addEventListener('submit', function (event) {
+        if (event.target.querySelector('input[data-uploading]')) {
+            event.preventDefault();
+            alert('Дождитесь завершения загрузки файлов');
+        }
+    }, true);
+})();
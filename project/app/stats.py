@@ -0,0 +1,135 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from app.models import Discipline, Fos, FosStat
+
+# статистика ФОСов: количество ФОСов в разрезе (дисциплина, тип ФОСа, период обучения) с видом обучения дисциплины
+#
+# таблица поддерживается сигналами сохранения и удаления ФОСов (см. app.signals): каждое изменение ФОСа
+# увеличивает или уменьшает одну строку статистики, поэтому отчеты и счетчики списков читают готовые значения
+# вместо подсчета по таблице ФОСов. Таблицу можно пересчитать и сверить с ФОСами командой rebuild_fos_stats.
+
+
+def fos_key(discipline_id, type_id, years):
+    """
+        Ключ строки статистики ФОСа
+    """
+    return {'discipline_id': discipline_id, 'fos_type_id': type_id, 'years': years or ''}
+
+
+def increment(key):
+    """
+        Увеличение количества ФОСов в строке статистики (строка создается, если ее нет)
+    """
+    if FosStat.objects.filter(**key).update(count=F('count') + 1):
+        return
+    qualification_id = Discipline.objects.filter(pk=key['discipline_id']).values_list(
+        'qualification_id', flat=True
+    ).first()
+    try:
+        with transaction.atomic():
+            FosStat.objects.create(qualification_id=qualification_id, count=1, **key)
+    except IntegrityError:
+        # строку одновременно создал параллельный запрос
+        FosStat.objects.filter(**key).update(count=F('count') + 1)
+
+
+def decrement(key):
+    """
+        Уменьшение количества ФОСов в строке статистики (пустая строка удаляется)
+    """
+    FosStat.objects.filter(count__gt=0, **key).update(count=F('count') - 1)
+    FosStat.objects.filter(count=0, **key).delete()
+
+
+def sync_qualifications(discipline_ids):
+    """
+        Перенос статистики дисциплин на их текущий вид обучения (одним запросом)
+    """
+    FosStat.objects.filter(discipline_id__in=discipline_ids).update(qualification_id=Subquery(
+        Discipline.objects.filter(pk=OuterRef('discipline_id')).values('qualification_id')[:1]
+    ))
+
+
+def fos_count_subquery():
+    """
+        Подзапрос количества ФОСов дисциплины (для annotate выборки дисциплин)
+    """
+    return Coalesce(Subquery(
+        FosStat.objects.filter(discipline_id=OuterRef('pk')).order_by().values('discipline_id').annotate(
+            total=Sum('count')
+        ).values('total')
+    ), 0)
+
+
+def live_counts(discipline_ids=None):
+    """
+        Статистика, посчитанная по таблице ФОСов: ключ (дисциплина, тип, период) => (вид обучения, количество)
+
+        Args:
+            discipline_ids: Посчитать только для этих дисциплин
+    """
+    foses = Fos.objects.all()
+    if discipline_ids is not None:
+        foses = foses.filter(discipline_id__in=discipline_ids)
+    rows = foses.values('discipline_id', 'type_id', 'years', 'discipline__qualification_id').annotate(
+        total=Count('id')
+    ).order_by()
+    counts = {}
+    for row in rows:
+        key = (row['discipline_id'], row['type_id'], row['years'] or '')
+        qualification_id, total = counts.get(key, (row['discipline__qualification_id'], 0))
+        # ФОСы без периода (NULL и пустая строка) попадают в одну строку статистики
+        counts[key] = (qualification_id, total + row['total'])
+    return counts
+
+
+def stored_counts():
+    """
+        Статистика из таблицы статистики: ключ (дисциплина, тип, период) => (вид обучения, количество)
+    """
+    return {
+        (s.discipline_id, s.fos_type_id, s.years): (s.qualification_id, s.count)
+        for s in FosStat.objects.all()
+    }
+
+
+@transaction.atomic
+def rebuild(discipline_ids=None):
+    """
+        Пересчет таблицы статистики по таблице ФОСов
+
+        Args:
+            discipline_ids: Пересчитать только статистику этих дисциплин (например, созданных массово)
+
+        Returns:
+            Количество строк статистики
+    """
+    stored = FosStat.objects.all()
+    if discipline_ids is not None:
+        stored = stored.filter(discipline_id__in=discipline_ids)
+    stored.delete()
+    stats = [
+        FosStat(discipline_id=key[0], fos_type_id=key[1], years=key[2], qualification_id=qualification_id,
+                count=total)
+        for key, (qualification_id, total) in live_counts(discipline_ids).items()
+    ]
+    FosStat.objects.bulk_create(stats, batch_size=500)
+    return len(stats)
+
+
+def verify():
+    """
+        Сверка таблицы статистики с таблицей ФОСов
+
+        Returns:
+            Список расхождений: (ключ, значение в статистике, значение по ФОСам); значение - (вид обучения, количество)
+    """
+    stored = stored_counts()
+    live = live_counts()
+    return [
+        (key, stored.get(key), live.get(key))
+        for key in sorted(set(stored) | set(live))
+        if stored.get(key) != live.get(key)
+    ]
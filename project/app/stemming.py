@@ -0,0 +1,113 @@
+import functools
+import re
+
+# стеммер для русского языка (алгоритм Snowball, упрощенная реализация)
+# используется поисковым индексом на SQLite, где нет встроенной морфологии русского языка
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND_1 = ('в', 'вши', 'вшись')
+PERFECTIVE_GERUND_2 = ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись')
+ADJECTIVE = (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому',
+    'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею'
+)
+PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')
+PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+REFLEXIVE = ('ся', 'сь')
+VERB_1 = ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно')
+VERB_2 = (
+    'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло',
+    'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'
+)
+NOUN = (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям',
+    'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я'
+)
+SUPERLATIVE = ('ейш', 'ейше')
+DERIVATIONAL = ('ост', 'ость')
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _region(word, start=0):
+    """
+        Начало области после первой согласной, следующей за гласной (R1/R2 алгоритма Snowball)
+    """
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _strip(word, region, endings, preceded_endings=()):
+    """
+        Удаление самого длинного окончания, лежащего в области region
+
+        Окончания из preceded_endings удаляются, только если перед ними стоит "а" или "я".
+    """
+    best = None
+    for ending in endings + preceded_endings:
+        if word.endswith(ending) and len(word) - len(ending) >= region:
+            if best is None or len(ending) > len(best):
+                best = ending
+    if best is None:
+        return None
+    if best in preceded_endings and best not in endings:
+        pos = len(word) - len(best) - 1
+        if pos < region or word[pos] not in 'ая':
+            return None
+    return word[:-len(best)]
+
+
+# основы слов запоминаются: в текстах ФОСов и документов одни и те же слова повторяются многократно
+@functools.lru_cache(maxsize=100000)
+def stem(word):
+    """
+        Основа русского слова
+
+        Слова на других языках и числа возвращаются без изменений (в нижнем регистре).
+    """
+    word = word.lower().replace('ё', 'е')
+    rv = next((i + 1 for i, ch in enumerate(word) if ch in VOWELS), len(word))
+    if rv >= len(word):
+        return word
+    r2 = _region(word, _region(word))
+
+    # шаг 1: деепричастия, либо возвратные окончания и окончания прилагательных, глаголов, существительных
+    stripped = _strip(word, rv, PERFECTIVE_GERUND_2, PERFECTIVE_GERUND_1)
+    if stripped is not None:
+        word = stripped
+    else:
+        word = _strip(word, rv, REFLEXIVE) or word
+        stripped = _strip(word, rv, ADJECTIVE)
+        if stripped is not None:
+            word = _strip(stripped, rv, PARTICIPLE_2, PARTICIPLE_1) or stripped
+        else:
+            stripped = _strip(word, rv, VERB_2, VERB_1)
+            if stripped is None:
+                stripped = _strip(word, rv, NOUN)
+            if stripped is not None:
+                word = stripped
+
+    # шаг 2: окончание "и"
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # шаг 3: словообразовательные суффиксы
+    word = _strip(word, r2, DERIVATIONAL) or word
+
+    # шаг 4: превосходная степень, удвоенная "н", мягкий знак
+    word = _strip(word, rv, SUPERLATIVE) or word
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        word = word[:-1]
+    elif word.endswith('ь') and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
+
+
+def stem_text(text):
+    """
+        Текст, приведенный к последовательности основ слов через пробел
+    """
+    return ' '.join(stem(w) for w in WORD_RE.findall(text or ''))
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.db.models.fields.files import FieldFile
+from django.utils.deconstruct import deconstructible
+
+from app.backends import atomic_write
+
+# хранилище файлов документов по содержимому: файл сохраняется под именем из хэша SHA-256 его содержимого
+# (documents/ab/cd/<хэш>.<расширение>), поэтому одинаковые файлы, прикрепленные к разным документам, хранятся
+# на диске один раз. Количество документов, ссылающихся на файл, и удаление файлов без ссылок - см. app/blobs.py
+#
+# хэш загруженного файла считается при его получении (app/uploads.py); файл без хэша (например, созданный кодом)
+# записывается во временный файл с одновременным подсчетом хэша - содержимое в обоих случаях читается один раз
+
+# каталог временных файлов (внутри каталога документов)
+TMP_DIR = '.tmp'
+
+BLOB_NAME_RE = re.compile(r'(?:^|/)[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(?:\.\w+)?$')
+
+
+def blob_name(directory, sha256, ext):
+    """
+        Имя файла в хранилище по хэшу содержимого
+    """
+    return posixpath.join(directory, sha256[:2], sha256[2:4], sha256 + ext)
+
+
+def name_sha256(name):
+    """
+        Хэш содержимого из имени файла хранилища (None - имя не из хэша, например, файл загружен до перехода
+        на хранилище по содержимому)
+    """
+    match = BLOB_NAME_RE.search(name or '')
+    return match.group(1) if match else None
+
+
+class HashingContent:
+    """
+        Обертка содержимого файла, считающая хэш SHA-256 при чтении частей
+    """
+
+    def __init__(self, content):
+        self.content = content
+        self.sha256 = hashlib.sha256()
+
+    def chunks(self, chunk_size=None):
+        for chunk in self.content.chunks(chunk_size):
+            self.sha256.update(chunk if isinstance(chunk, bytes) else chunk.encode())
+            yield chunk
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+        Файловое хранилище документов по содержимому
+    """
+
+    def _save(self, name, content):
+        directory = posixpath.dirname(name)
+        ext = os.path.splitext(name)[1].lower()
+
+        sha256 = getattr(content, 'sha256', None)
+        if sha256 is not None and self.reserve(blob_name(directory, sha256, ext)):
+            # такой файл уже есть в хранилище - загруженный файл не записывается, а его временный файл (например,
+            # загрузки по частям) удаляется, как если бы он был перемещен на место
+            if hasattr(content, 'temporary_file_path'):
+                try:
+                    os.remove(content.temporary_file_path())
+                except FileNotFoundError:
+                    pass
+            return blob_name(directory, sha256, ext)
+
+        if sha256 is None:
+            content = HashingContent(content)
+        # файл записывается (или перемещается, если загружен во временный файл) под временным именем
+        tmp_name = super()._save(posixpath.join(directory, TMP_DIR, uuid.uuid4().hex + ext), content)
+        if sha256 is None:
+            sha256 = content.sha256.hexdigest()
+
+        name = blob_name(directory, sha256, ext)
+        if self.reserve(name):
+            self.delete(tmp_name)
+        else:
+            full_path = self.path(name)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            # замена атомарна: одновременная загрузка того же файла оставит одну копию. Файл без записи о нем
+            # заменяется новым (с новой датой изменения), поэтому его не удалит ни сборка файлов без ссылок,
+            # ни поиск файлов без записей
+            os.replace(self.path(tmp_name), full_path)
+        return name
+
+    def reserve(self, name):
+        """
+            Можно ли сослаться на сохраненный файл, не записывая его: файл есть, и его запись о файле заблокирована
+            до конца транзакции (файл не удалит сборка файлов без ссылок, см. app.blobs.reserve)
+        """
+        # app.blobs зависит от моделей, которые используют это хранилище
+        from app import blobs
+        return blobs.reserve(name) and self.exists(name)
+
+
+class OriginalNameFieldFile(FieldFile):
+    """
+        Файл поля, запоминающий исходное имя сохраняемого файла в поле модели
+    """
+
+    def save(self, name, content, save=True):
+        setattr(self.instance, self.field.original_name_field, os.path.basename(name))
+        # запись файла и сохранение ссылки на него - в одной транзакции (см. ContentAddressedStorage.reserve)
+        with atomic_write():
+            super().save(name, content, save)
+
+
+class ContentAddressedFileField(models.FileField):
+    """
+        Поле файла в хранилище по содержимому: имя файла в хранилище - хэш содержимого, поэтому исходное имя
+        загруженного файла сохраняется в поле original_name_field
+    """
+    attr_class = OriginalNameFieldFile
+
+    def __init__(self, *args, original_name_field='file_name', **kwargs):
+        self.original_name_field = original_name_field
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['original_name_field'] = self.original_name_field
+        return name, path, args, kwargs
@@ -0,0 +1,130 @@
+import tempfile
+
+import xlsxwriter
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse
+from import_export.formats import base_formats
+from import_export.signals import post_export
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# сколько строк выгрузки загружать из БД за один запрос
+EXPORT_CHUNK_SIZE = 1000
+
+
+def open_workbook(output):
+    """
+        Excel файл в режиме постоянного расхода памяти
+
+        Строки листа сбрасываются во временный файл по мере записи, поэтому объем памяти не зависит от количества
+        строк. Строки должны записываться строго по порядку: запись в уже пройденную строку игнорируется.
+    """
+    return xlsxwriter.Workbook(output, {'constant_memory': True})
+
+
+def spool():
+    """
+        Временный файл выгрузки: хранится в памяти, пока не превысит EXPORT_SPOOL_SIZE Мб, дальше - на диске
+    """
+    return tempfile.SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_SIZE * 1024 * 1024)
+
+
+def write_rows(output, headers, rows):
+    """
+        Запись таблицы (строка заголовков и строки данных) в excel файл
+
+        Args:
+            output: Путь к файлу или файловый объект
+            headers: Заголовки колонок
+            rows: Итератор строк (значения строки - в порядке колонок)
+    """
+    workbook = open_workbook(output)
+    worksheet = workbook.add_worksheet()
+    worksheet.write_row(0, 0, headers, workbook.add_format({'bold': True}))
+    for row, values in enumerate(rows, start=1):
+        worksheet.write_row(row, 0, values)
+    workbook.close()
+
+
+def file_response(file, filename, content_type=XLSX_CONTENT_TYPE):
+    """
+        Отдача временного файла на скачивание по частям (файл закрывается после отдачи)
+    """
+    file.seek(0)
+    return FileResponse(file, as_attachment=True, filename=filename, content_type=content_type)
+
+
+class StreamingXLSX(base_formats.XLSX):
+    """
+        Формат выгрузки xlsx, записываемый построчно (см. StreamingExportMixin)
+    """
+    pass
+
+
+class StreamingExportMixin:
+    """
+        Выгрузка в xlsx без сборки всей таблицы в памяти (для ImportExportModelAdmin)
+
+        Вместо построения tablib.Dataset и файла в памяти строки записываются по мере чтения из БД в excel файл
+        в режиме постоянного расхода памяти, файл - во временный файл, который отдается по частям.
+
+        Attributes:
+            export_prefetch_related: Связи, загружаемые вместе с каждой порцией строк выгрузки
+    """
+    export_prefetch_related = []
+
+    def get_export_formats(self):
+        return [StreamingXLSX if f is base_formats.XLSX else f for f in super().get_export_formats()]
+
+    def streaming_export(self, request, queryset, file_format, export_form=None):
+        """
+            Формирование выгрузки и ответа с файлом
+        """
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+        resource = self.choose_export_resource_class(export_form)(**self.get_export_resource_kwargs(request))
+        queryset = queryset.prefetch_related(*self.export_prefetch_related)
+
+        output = spool()
+        write_rows(
+            output, resource.get_export_headers(),
+            (resource.export_resource(obj) for obj in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE))
+        )
+        post_export.send(sender=None, model=self.model)
+        return file_response(output, self.get_export_filename(request, queryset, file_format),
+                             file_format.get_content_type())
+
+    def get_requested_format(self, request):
+        """
+            Выбранный формат выгрузки (None, если не выбран)
+        """
+        index = request.POST.get('file_format')
+        formats = self.get_export_formats()
+        if not index or not index.isdigit() or int(index) >= len(formats):
+            return None
+        return formats[int(index)]()
+
+    def export_action(self, request, *args, **kwargs):
+        if request.method == 'POST' and isinstance(self.get_requested_format(request), StreamingXLSX):
+            form = self.get_export_form_class()(
+                self.get_export_formats(), request.POST, resources=self.get_export_resource_classes()
+            )
+            if form.is_valid():
+                return self.streaming_export(request, self.get_export_queryset(request),
+                                             self.get_requested_format(request), export_form=form)
+        return super().export_action(request, *args, **kwargs)
+
+    def get_actions(self, request):
+        # действие "выгрузить выбранные" регистрируется ExportActionMixin как функция класса, подменяем его
+        actions = super().get_actions(request)
+        if 'export_admin_action' in actions:
+            func, name, description = actions['export_admin_action']
+            actions['export_admin_action'] = (StreamingExportMixin.export_admin_action, name, description)
+        return actions
+
+    def export_admin_action(self, request, queryset):
+        file_format = self.get_requested_format(request)
+        if isinstance(file_format, StreamingXLSX):
+            return self.streaming_export(request, queryset, file_format)
+        return super().export_admin_action(request, queryset)
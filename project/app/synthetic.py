@@ -0,0 +1,190 @@
+import io
+import random
+from collections import Counter
+
+import docx
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from faker import Faker
+
+from app import blobs, cache, search, stats
+from app.backends import atomic_write
+from app.models import Discipline, DisciplineType, Document, Fos, FosType, Group, Qualification
+
+# синтетическая кафедра для замеров производительности (см. команду benchmark) и наполнения тестовых БД
+# (seed --scale): преподаватели, учебные группы, дисциплины, ФОСы и документы с небольшими docx файлами
+#
+# записи создаются через bulk_create (сигналы моделей не отправляются), поэтому ссылки на файлы документов
+# учитываются явно, а после создания пересчитываются статистика ФОСов и поисковый индекс. Все записи кафедры
+# помечаются префиксом и удаляются методом delete.
+
+# сколько разных docx файлов генерировать (файлы документов повторяют их по кругу)
+DOCX_VARIANTS = 8
+
+# справочники по-умолчанию (создаются, если справочник пуст; их же заполняет команда seed)
+DEFAULT_FOS_TYPES = (
+    'Вопросы к зачету / экзамену',
+    'Задание для опроса',
+    'Тестовое задание',
+    'Расчетные задачи',
+    'ФОС',
+    'Билеты для экзамена',
+    'Контрольная работа',
+    'Самостоятельная работа',
+    'Смешанное задание',
+)
+DEFAULT_DISCIPLINE_TYPES = (
+    'Зачет',
+    'Экзамен',
+)
+DEFAULT_QUALIFICATIONS = (
+    'Бакалавриат',
+    'Магистратура',
+)
+
+
+def make_docx(paragraphs):
+    """
+        Содержимое docx файла с заданными абзацами
+    """
+    output = io.BytesIO()
+    document = docx.Document()
+    for text in paragraphs:
+        document.add_paragraph(text)
+    document.save(output)
+    return output.getvalue()
+
+
+def reference(model, names):
+    """
+        Записи справочника (если справочник пуст - создаются записи по-умолчанию)
+    """
+    objects = list(model.objects.order_by('id'))
+    if not objects:
+        objects = [model.objects.create(name=name) for name in names]
+    return objects
+
+
+class SyntheticDepartment:
+    """
+        Синтетическая кафедра
+
+        Attributes:
+            prefix: Префикс имен пользователей, групп и дисциплин кафедры
+            disciplines: Количество дисциплин
+            teachers: Количество преподавателей
+            groups: Количество учебных групп
+            foses_per_discipline: Среднее количество ФОСов дисциплины
+            documents_per_fos: Количество документов ФОСа
+            years: Период обучения ФОСов
+            seed: Начальное значение генератора случайных чисел (одинаковое значение - одинаковая кафедра)
+    """
+
+    def __init__(self, disciplines, teachers=None, groups=None, foses_per_discipline=3, documents_per_fos=1,
+                 years='2023', prefix='bench', seed=0):
+        self.prefix = prefix
+        self.disciplines = disciplines
+        self.teachers = teachers or max(1, disciplines // 5)
+        self.groups = groups or max(1, disciplines // 10)
+        self.foses_per_discipline = foses_per_discipline
+        self.documents_per_fos = documents_per_fos
+        self.years = years
+        self.seed = seed
+
+    def users(self):
+        return User.objects.filter(username__startswith=self.prefix + '_')
+
+    def discipline_queryset(self):
+        return Discipline.objects.filter(name__startswith=self.prefix + ' ')
+
+    def generate(self):
+        """
+            Создание записей кафедры
+
+            Записи создаются массово (без сигналов сохранения), поэтому статистика ФОСов и поисковый индекс
+            пересчитываются только для созданных записей, а справочник преподавателей сбрасывается.
+
+            Returns:
+                Словарь с количеством созданных записей каждого вида
+        """
+        fake = Faker('ru_RU')
+        fake.seed_instance(self.seed)
+        rng = random.Random(self.seed)
+
+        fos_types = reference(FosType, DEFAULT_FOS_TYPES)
+        discipline_types = reference(DisciplineType, DEFAULT_DISCIPLINE_TYPES)
+        qualifications = reference(Qualification, DEFAULT_QUALIFICATIONS)
+
+        with atomic_write():
+            users = User.objects.bulk_create([
+                User(username='{}_{}'.format(self.prefix, i), first_name=fake.first_name(),
+                     last_name=fake.last_name(), is_staff=True)
+                for i in range(self.teachers)
+            ], batch_size=500)
+            groups = Group.objects.bulk_create([
+                Group(name='{}-{}'.format(self.prefix.upper(), i), course=i % 4 + 1) for i in range(self.groups)
+            ], batch_size=500)
+            disciplines = Discipline.objects.bulk_create([
+                Discipline(name='{} {} {}'.format(self.prefix, i, fake.catch_phrase()),
+                           type=rng.choice(discipline_types), qualification=qualifications[i % len(qualifications)])
+                for i in range(self.disciplines)
+            ], batch_size=500)
+
+            # ID созданных записей нужны для связей (SQLite и PostgreSQL возвращают их из bulk_create)
+            Discipline.users.through.objects.bulk_create([
+                Discipline.users.through(discipline_id=d.id, user_id=u.id)
+                for d in disciplines for u in rng.sample(users, min(len(users), rng.randint(1, 2)))
+            ], batch_size=1000)
+            Discipline.groups.through.objects.bulk_create([
+                Discipline.groups.through(discipline_id=d.id, group_id=g.id)
+                for d in disciplines for g in rng.sample(groups, min(len(groups), rng.randint(1, 3)))
+            ], batch_size=1000)
+
+            foses = Fos.objects.bulk_create([
+                Fos(name=fake.sentence(nb_words=4), description=fake.paragraph(), type=rng.choice(fos_types),
+                    discipline=d, years=self.years)
+                for d in disciplines for _ in range(rng.randint(1, 2 * self.foses_per_discipline - 1))
+            ], batch_size=500)
+
+            documents = []
+            if self.documents_per_fos:
+                # файлы хранятся по содержимому: на диске по одному файлу на вариант
+                storage = Document.path.field.storage
+                names = [
+                    storage.save('documents/' + self.prefix + '.docx', ContentFile(make_docx(fake.paragraphs(nb=5))))
+                    for _ in range(DOCX_VARIANTS)
+                ]
+                for i, (fos, n) in enumerate((f, n) for f in foses for n in range(self.documents_per_fos)):
+                    documents.append(Document(name='{} {}'.format(fake.word(), n + 1), path=names[i % len(names)],
+                                              file_name='{}_{}.docx'.format(self.prefix, i), fos=fos))
+                Document.objects.bulk_create(documents, batch_size=500)
+                for name, count in Counter(d.path.name for d in documents).items():
+                    blobs.acquire(name, count)
+
+            stats.rebuild([d.id for d in disciplines])
+            search.index_disciplines(disciplines)
+            search.index_foses(foses)
+            search.index_documents(documents)
+            cache.invalidate(cache.TEACHERS)
+
+        return {
+            'teachers': len(users), 'groups': len(groups), 'disciplines': len(disciplines),
+            'foses': len(foses), 'documents': len(documents),
+        }
+
+    def delete(self):
+        """
+            Удаление записей кафедры (вместе с файлами документов)
+        """
+        disciplines = self.discipline_queryset()
+        documents = Document.objects.filter(fos__discipline__in=disciplines)
+        with atomic_write():
+            names = set(documents.values_list('path', flat=True))
+            documents.delete()
+            Fos.objects.filter(discipline__in=disciplines).delete()
+            disciplines.delete()
+            Group.objects.filter(name__startswith=self.prefix.upper() + '-').delete()
+            self.users().delete()
+            # файлы кафедры, на которые не осталось ссылок, удаляются после фиксации транзакции
+            blobs.collect(names=names)
+            cache.invalidate(cache.TEACHERS)
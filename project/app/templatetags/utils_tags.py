@@ -1,7 +1,6 @@
 from django import template
-from django.contrib.auth.models import User
 
-from app.models import Fos
+from app import cache
 
 register = template.Library()
 
@@ -24,9 +23,9 @@ def ru_plural(value, variants):
 
 @register.simple_tag
 def get_users():
-    return User.objects.all()
+    return cache.teachers()
 
 
 @register.simple_tag
 def get_years():
-    return Fos.YEARS_CHOICES
+    return cache.years_choices()
@@ -1,3 +1,1630 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import unittest
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import docx
+import openpyxl
+import tablib
+from PIL import Image
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import Group as UserGroup, Permission, User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from pypdf import PdfWriter
+
+from app import blobs, cache, extraction, instrumentation, merging, previews, processing, search, stats, uploads
+from app.backends.sqlite3.base import DatabaseWrapper as SqliteDatabaseWrapper
+from app.models import (
+    Blob, Discipline, DisciplineType, Document, DocumentPreview, DocumentText, Fos, FosStat, FosType, Group, ImportJob,
+    Qualification, ReportJob, SearchEntry, UploadSession, document_storage
+)
+from app.reports import DisciplinesSummary, TeacherFosSummary, write_disciplines_report
+from app.streaming import StreamingXLSX
+
+
+class CatalogueMixin:
+    """
+        Наполнение БД тестовым каталогом дисциплин и ФОСов
+    """
+
+    @classmethod
+    def create_catalogue(cls, disciplines_count, years='2022'):
+        dis_type = DisciplineType.objects.create(name='Экзамен')
+        qualifications = [Qualification.objects.create(name=name) for name in ('Бакалавриат', 'Магистратура')]
+        types = [FosType.objects.create(name='Тип ' + str(i)) for i in range(3)]
+        disciplines = []
+        for i in range(disciplines_count):
+            d = Discipline.objects.create(
+                name='Дисциплина ' + str(i), type=dis_type, qualification=qualifications[i % 2]
+            )
+            for j, t in enumerate(types[:i % 3 + 1]):
+                Fos.objects.create(name='ФОС ' + str(j), type=t, discipline=d, years=years)
+            disciplines.append(d)
+        return disciplines
+
+
+class MediaRootMixin:
+    """
+        Временный каталог MEDIA_ROOT (и статика без манифеста) на время выполнения тестов класса
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(
+            MEDIA_ROOT=cls.media_root, REPORT_JOBS_SYNC=True,
+            STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'
+        )
+        cls.media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+
+class DisciplinesSummaryTest(CatalogueMixin, TestCase):
+
+    def test_matrix_counts(self):
+        disciplines = self.create_catalogue(4)
+        Fos.objects.create(name='Другой период', type=FosType.objects.first(), discipline=disciplines[0], years='2021')
+
+        summary = DisciplinesSummary()
+        self.assertEqual(summary.total_dis, 4)
+        self.assertEqual(summary.total, 1 + 2 + 3 + 1 + 1)
+        self.assertEqual([len(q.disciplines) for q in summary.qualifications], [2, 2])
+        first = summary.qualifications[0].disciplines[0]
+        self.assertEqual(list(first.count_foses.values()), [2, 0, 0])
+
+        summary = DisciplinesSummary(years='2022')
+        self.assertEqual(summary.total, 1 + 2 + 3 + 1)
+        self.assertEqual(summary.total_dis, 4)
+
+    def test_query_budget(self):
+        self.create_catalogue(3)
+        with CaptureQueriesContext(connection) as small:
+            DisciplinesSummary(years='2022')
+        self.create_catalogue(30)
+        with self.assertNumQueries(len(small.captured_queries)):
+            DisciplinesSummary(years='2022')
+
+
+class ExportDisciplinesViewTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+
+    def export(self):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('export_disciplines'), {'years': 'all'})
+        job = ReportJob.objects.latest('id')
+        self.assertRedirects(response, reverse('report_job', args=(job.pk,)))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportJob.STATUS_DONE, job.error)
+        return len(queries.captured_queries)
+
+    def test_query_count_does_not_grow_with_catalogue(self):
+        self.create_catalogue(2)
+        small = self.export()
+        self.create_catalogue(40)
+        self.assertEqual(self.export(), small)
+
+
+class TeacherFosSummaryTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create_user('teacher', first_name='Иван', last_name='Иванов')
+
+    def assign(self, disciplines):
+        for d in disciplines:
+            d.users.add(self.teacher)
+
+    def test_summary(self):
+        self.assign(self.create_catalogue(4))
+        summary = TeacherFosSummary(self.teacher.id)
+        self.assertEqual(summary.count_fos, [1, 2, 3, 1])
+        self.assertEqual(summary.max_count, 3)
+        self.assertEqual(summary.all_total, 7)
+        self.assertEqual([t.total for t in summary.fos_types.values()], [4, 2, 1])
+
+    def test_export_query_count_does_not_grow_with_foses(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.assign(self.create_catalogue(2))
+
+        def export():
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('export_fos'), {'teacher': self.teacher.id})
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(ReportJob.objects.latest('id').status, ReportJob.STATUS_DONE)
+            return len(queries.captured_queries)
+
+        small = export()
+        self.assign(self.create_catalogue(20))
+        self.assertEqual(export(), small)
+
+
+class ReportJobTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create_user('teacher', is_staff=True)
+        for d in self.create_catalogue(3):
+            d.users.add(self.teacher)
+
+    def test_job_is_queued_and_downloadable(self):
+        self.client.force_login(self.teacher)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.post(reverse('export_fos'), {'teacher': self.teacher.id})
+        job = ReportJob.objects.get()
+        self.assertRedirects(response, reverse('report_job', args=(job.pk,)))
+        self.assertEqual(job.status, ReportJob.STATUS_PENDING)
+        self.assertContains(self.client.get(reverse('report_job', args=(job.pk,))), 'В очереди')
+        self.assertEqual(self.client.get(reverse('report_job_download', args=(job.pk,))).status_code, 404)
+
+        for callback in callbacks:
+            callback()
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportJob.STATUS_DONE)
+
+        response = self.client.get(reverse('report_job_download', args=(job.pk,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('export.xlsx', response['Content-Disposition'])
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'PK'))
+
+    def test_foreign_job_is_hidden(self):
+        job = ReportJob.objects.create(kind=ReportJob.KIND_FOS, params={'teacher': self.teacher.id})
+        self.client.force_login(User.objects.create_user('other', is_staff=True))
+        self.assertEqual(self.client.get(reverse('report_job', args=(job.pk,))).status_code, 404)
+
+    def test_export_requires_staff_and_post(self):
+        response = self.client.post(reverse('export_fos'), {'teacher': self.teacher.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('admin:login'), response['Location'])
+        self.client.force_login(self.teacher)
+        self.assertEqual(self.client.get(reverse('export_disciplines')).status_code, 405)
+        self.assertFalse(ReportJob.objects.exists())
+
+    def test_cleanup(self):
+        self.client.force_login(self.teacher)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('export_fos'), {'teacher': self.teacher.id})
+        old = ReportJob.objects.get()
+        path = old.file.path
+        self.assertTrue(os.path.exists(path))
+        ReportJob.objects.filter(pk=old.pk).update(
+            finished_at=timezone.now() - datetime.timedelta(days=settings.REPORT_JOB_KEEP_DAYS + 1)
+        )
+        pending = ReportJob.objects.create(kind=ReportJob.KIND_FOS, params={'teacher': self.teacher.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('run_report_jobs', stdout=io.StringIO())
+        self.assertFalse(ReportJob.objects.filter(pk=old.pk).exists())
+        self.assertFalse(os.path.exists(path))
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, ReportJob.STATUS_DONE)
+        self.assertTrue(os.path.exists(pending.file.path))
+
+
+class StreamingExportTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+
+    def read_xlsx(self, response):
+        self.assertTrue(response.streaming)
+        workbook = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        return [list(row) for row in workbook.active.iter_rows(values_only=True)]
+
+    def xlsx_format_index(self, model):
+        formats = admin.site._registry[model].get_export_formats()
+        return formats.index(StreamingXLSX)
+
+    def test_discipline_export(self):
+        teacher = User.objects.create_user('ivanov', first_name='Иван', last_name='Иванов')
+        for d in self.create_catalogue(30):
+            d.users.add(teacher)
+        index = self.xlsx_format_index(Discipline)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('admin:app_discipline_export'), {'file_format': index})
+        # количество запросов не зависит от количества дисциплин
+        self.assertLess(len(queries.captured_queries), 20)
+        rows = self.read_xlsx(response)
+        self.assertEqual(rows[0], ['Дисциплина', 'Форма контроля знаний', 'Вид обучения', 'Преподаватель',
+                                   'Учебные группы', 'Оценочные средства'])
+        self.assertEqual(len(rows), 31)
+        self.assertIn(['Дисциплина 2', 'Экзамен', 'Бакалавриат', 'Иван Иванов', None, 'ФОС 0, ФОС 1, ФОС 2'], rows)
+
+    def test_group_export_and_selected_action(self):
+        for i in range(5):
+            Group.objects.create(name='ИС-' + str(i), course=i % 4 + 1)
+        index = self.xlsx_format_index(Group)
+        rows = self.read_xlsx(self.client.post(reverse('admin:app_group_export'), {'file_format': index}))
+        self.assertEqual(rows[0], ['ID', 'Наименование', 'Курс'])
+        self.assertEqual(len(rows), 6)
+
+        disciplines = self.create_catalogue(3)
+        response = self.client.post(reverse('admin:app_discipline_changelist'), {
+            'action': 'export_admin_action', 'file_format': index,
+            '_selected_action': [disciplines[0].pk, disciplines[2].pk],
+        })
+        self.assertEqual(sorted(row[0] for row in self.read_xlsx(response)[1:]), ['Дисциплина 0', 'Дисциплина 2'])
+
+    def test_disciplines_report_is_written_in_row_order(self):
+        self.create_catalogue(4)
+        path = os.path.join(self.media_root, 'disciplines.xlsx')
+        write_disciplines_report(path, DisciplinesSummary(), 'http://localhost/')
+        rows = list(openpyxl.load_workbook(path).active.iter_rows(values_only=True))
+        self.assertEqual(rows[3][:5], ('Дисциплины', None, 'Тип 0', 'Тип 1', 'Тип 2'))
+        self.assertEqual(rows[4][0], 'Бакалавриат')
+        self.assertEqual(rows[5][:5], ('Дисциплина 0', None, 1, 0, 0))
+        self.assertEqual(rows[-1][:5], ('Всего', 7, 4, 2, 1))
+
+
+class BulkImportTest(CatalogueMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.dis_type = DisciplineType.objects.create(name='Экзамен')
+        self.qualification = Qualification.objects.create(name='Бакалавриат')
+        self.teachers = [User.objects.create_user('teacher' + str(i)) for i in range(3)]
+        self.groups = [Group.objects.create(name='ИС-' + str(i)) for i in range(3)]
+
+    def dataset(self, count, offset=0):
+        rows = []
+        for i in range(offset, offset + count):
+            rows.append(['Дисциплина ' + str(i), 'Экзамен', 'Бакалавриат', 'ИС-' + str(i % 3) + '|ИС-9',
+                         'teacher' + str(i % 3)])
+        return tablib.Dataset(*rows, headers=['name', 'type', 'qualification', 'groups', 'users'])
+
+    def import_queries(self, dataset):
+        from app.admin import DisciplineImportResource
+        with CaptureQueriesContext(connection) as queries:
+            result = DisciplineImportResource().import_data(dataset, use_transactions=True)
+        self.assertFalse(result.has_errors())
+        self.assertFalse(result.has_validation_errors())
+        return len(queries.captured_queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        small = self.import_queries(self.dataset(5))
+        # (строк меньше лимита параметров одного запроса SQLite, иначе bulk_create делит вставку на части)
+        self.assertEqual(self.import_queries(self.dataset(60, offset=5)), small)
+        self.assertEqual(Discipline.objects.count(), 65)
+        discipline = Discipline.objects.get(name='Дисциплина 7')
+        self.assertEqual(discipline.type, self.dis_type)
+        self.assertEqual([u.username for u in discipline.users.all()], ['teacher1'])
+        self.assertEqual([g.name for g in discipline.groups.all()], ['ИС-1'])
+        self.assertEqual(search.search_disciplines(Discipline.objects.all(), 'дисциплина').count(), 65)
+        self.assertEqual(len(cache.teachers()), 3)
+
+    def test_update_replaces_relations(self):
+        self.import_queries(self.dataset(3))
+        dataset = tablib.Dataset(['Дисциплина 1', 'Экзамен', '', 'ИС-0', 'teacher0|teacher2'],
+                                 headers=['name', 'type', 'qualification', 'groups', 'users'])
+        self.import_queries(dataset)
+        discipline = Discipline.objects.get(name='Дисциплина 1')
+        self.assertIsNone(discipline.qualification)
+        self.assertEqual(sorted(u.username for u in discipline.users.all()), ['teacher0', 'teacher2'])
+        self.assertEqual([g.name for g in discipline.groups.all()], ['ИС-0'])
+        self.assertEqual(Discipline.objects.count(), 3)
+
+    def test_repeated_key_updates_created_row(self):
+        dataset = self.dataset(3)
+        dataset.append(['Дисциплина 1', 'Экзамен', '', 'ИС-0', 'teacher0|teacher2'])
+        self.import_queries(dataset)
+        self.assertEqual(Discipline.objects.count(), 3)
+        discipline = Discipline.objects.get(name='Дисциплина 1')
+        self.assertIsNone(discipline.qualification)
+        self.assertEqual(sorted(u.username for u in discipline.users.all()), ['teacher0', 'teacher2'])
+        self.assertEqual([g.name for g in discipline.groups.all()], ['ИС-0'])
+
+    def test_missing_ids_of_created_rows(self):
+        from app.admin import DisciplineImportResource
+        from app.imports import MissingPrimaryKeysError
+        # (база данных без возврата ID из массовой вставки)
+        with mock.patch.object(Discipline.objects, 'bulk_create', side_effect=lambda objs, **kwargs: objs):
+            result = DisciplineImportResource().import_data(self.dataset(3), use_transactions=True)
+            self.assertTrue(result.has_errors())
+            self.assertIsInstance(result.base_errors[0].error, MissingPrimaryKeysError)
+            with self.assertRaises(MissingPrimaryKeysError):
+                DisciplineImportResource().import_data(self.dataset(3), use_transactions=True, raise_errors=True)
+        self.assertFalse(Discipline.users.through.objects.exists())
+
+        # импорт в админке показывает ошибку импорта
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        formats = admin.site._registry[Discipline].get_import_formats()
+        input_format = [i for i, f in enumerate(formats) if f().get_title() == 'csv'][0]
+        with mock.patch.object(Discipline.objects, 'bulk_create', side_effect=lambda objs, **kwargs: objs), \
+                self.settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+            response = self.client.post(reverse('admin:app_discipline_import'), {
+                'import_file': SimpleUploadedFile('disciplines.csv', self.dataset(3).export('csv').encode()),
+                'input_format': input_format,
+            })
+        self.assertContains(response, 'База данных не вернула ID созданных записей')
+        self.assertFalse(Discipline.objects.exists())
+
+    def test_dry_run_of_existing_rows(self):
+        from app.admin import DisciplineImportResource
+        self.import_queries(self.dataset(65))
+
+        def dry_run_queries(dataset):
+            with CaptureQueriesContext(connection) as queries:
+                result = DisciplineImportResource().import_data(dataset, dry_run=True)
+            return result, len(queries.captured_queries)
+
+        # сравнение "было/стало" не загружает справочники и связи каждой строки отдельно
+        result, small = dry_run_queries(self.dataset(5))
+        self.assertEqual(dry_run_queries(self.dataset(60, offset=5))[1], small)
+        self.assertTrue(any('teacher1' in value for value in result.rows[1].diff))
+
+    def test_unknown_type_is_reported(self):
+        from app.admin import DisciplineImportResource
+        dataset = tablib.Dataset(['Дисциплина', 'Курсовая', '', '', ''],
+                                 headers=['name', 'type', 'qualification', 'groups', 'users'])
+        result = DisciplineImportResource().import_data(dataset, use_transactions=True)
+        self.assertTrue(result.has_errors())
+        self.assertFalse(Discipline.objects.exists())
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_admin_import_preview_and_confirm(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        Discipline.objects.create(name='Дисциплина 1', type=self.dis_type).users.add(self.teachers[0])
+        content = self.dataset(3).export('csv').encode()
+        formats = admin.site._registry[Discipline].get_import_formats()
+        input_format = [i for i, f in enumerate(formats) if f().get_title() == 'csv'][0]
+        response = self.client.post(reverse('admin:app_discipline_import'), {
+            'import_file': SimpleUploadedFile('disciplines.csv', content), 'input_format': input_format,
+        })
+        self.assertEqual(response.status_code, 200)
+        # в сравнении "было/стало" показаны преподаватели до и после импорта (связи еще не сохранены)
+        self.assertContains(response, 'teacher2')
+        diff = response.context['result'].rows[1].diff
+        self.assertIn('<del', diff[3])
+        self.assertIn('ИС-1', diff[4])
+        self.assertFalse(Discipline.objects.filter(name='Дисциплина 2').exists())
+
+        form = response.context['confirm_form']
+        response = self.client.post(reverse('admin:app_discipline_process_import'), form.initial)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Discipline.objects.count(), 3)
+        self.assertEqual([u.username for u in Discipline.objects.get(name='Дисциплина 1').users.all()],
+                         ['teacher1'])
+
+    def test_user_import(self):
+        from app.admin import UserResource
+        teachers_group = UserGroup.objects.create(name='Преподаватели')
+        dataset = tablib.Dataset(['teacher0', 'Иван', 'Иванов'], ['new', 'Петр', 'Петров'],
+                                 headers=['username', 'first_name', 'last_name'])
+        with CaptureQueriesContext(connection) as queries:
+            result = UserResource().import_data(dataset, use_transactions=True)
+        self.assertFalse(result.has_errors())
+        # группа по-умолчанию, существующие пользователи, вставка, обновление и две вставки в группу
+        self.assertEqual(len([q for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]), 6)
+        for user in User.objects.filter(username__in=['teacher0', 'new']):
+            self.assertTrue(user.is_staff)
+            self.assertEqual(list(user.groups.all()), [teachers_group])
+        self.assertEqual(User.objects.get(username='teacher0').last_name, 'Иванов')
+
+
+@override_settings(IMPORT_CHUNK_SIZE=4)
+class ChunkedImportTest(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        DisciplineType.objects.create(name='Экзамен')
+        User.objects.create_user('teacher0')
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(self.admin)
+
+    def content(self, count, bad_row=None):
+        rows = [['Дисциплина ' + str(i), 'Курсовая' if i + 1 == bad_row else 'Экзамен', '', '', 'teacher0']
+                for i in range(count)]
+        return tablib.Dataset(*rows, headers=['name', 'type', 'qualification', 'groups', 'users']).export('csv')
+
+    def csv_format(self):
+        formats = admin.site._registry[Discipline].get_import_formats()
+        return [i for i, f in enumerate(formats) if f().get_title() == 'csv'][0]
+
+    def post_import(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:app_discipline_import'), {
+                'import_file': SimpleUploadedFile('disciplines.csv', content.encode()),
+                'input_format': self.csv_format(), 'background': 'on',
+            })
+        job = ImportJob.objects.latest('id')
+        self.assertRedirects(response, reverse('import_job', args=(job.pk,)))
+        job.refresh_from_db()
+        return job
+
+    def test_import_in_chunks(self):
+        job = self.post_import(self.content(10))
+        self.assertEqual(job.status, ImportJob.STATUS_DONE)
+        self.assertEqual((job.total_rows, job.processed_rows, job.new_rows), (10, 10, 10))
+        self.assertEqual([chunk['rows'] for chunk in job.chunks], [4, 4, 2])
+        self.assertEqual(Discipline.objects.count(), 10)
+        self.assertEqual(Discipline.objects.get(name='Дисциплина 9').users.get().username, 'teacher0')
+
+        response = self.client.get(reverse('import_job', args=(job.pk,)))
+        self.assertContains(response, 'Завершен')
+        self.assertContains(response, '100%')
+        self.assertContains(response, 'Строк/с')
+
+    def test_failed_chunk_is_rolled_back_and_resumed(self):
+        job = self.post_import(self.content(10, bad_row=7))
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        # первая порция сохранена, порция с ошибкой (строки 5-8) - нет
+        self.assertEqual(job.processed_rows, 4)
+        self.assertEqual(Discipline.objects.count(), 4)
+        self.assertIn('Строка 7', job.error)
+
+        DisciplineType.objects.create(name='Курсовая')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('import_job_resume', args=(job.pk,)))
+        self.assertRedirects(response, reverse('import_job', args=(job.pk,)))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_DONE)
+        self.assertEqual(len(job.chunks), 3)
+        self.assertEqual(Discipline.objects.count(), 10)
+        self.assertEqual(Discipline.objects.get(name='Дисциплина 6').type.name, 'Курсовая')
+
+    def test_interrupted_job_continues_from_checkpoint(self):
+        job = ImportJob(model='app.discipline', input_format=self.csv_format(), chunk_size=4,
+                        status=ImportJob.STATUS_RUNNING, processed_rows=4)
+        job.file.save('disciplines.csv', ContentFile(self.content(10).encode()))
+        call_command('run_import_jobs', '--requeue-running', stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_DONE)
+        self.assertEqual(job.processed_rows, 10)
+        # строки сохраненных до перезапуска порций повторно не импортируются
+        self.assertEqual(sorted(Discipline.objects.values_list('name', flat=True)),
+                         ['Дисциплина ' + str(i) for i in range(4, 10)])
+
+    def test_foreign_job_is_hidden(self):
+        job = self.post_import(self.content(1))
+        self.client.force_login(User.objects.create_user('other', is_staff=True))
+        self.assertEqual(self.client.get(reverse('import_job', args=(job.pk,))).status_code, 404)
+
+
+class FosStatTest(CatalogueMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.disciplines = self.create_catalogue(4)
+
+    def assertStatsMatch(self):
+        self.assertEqual(stats.verify(), [])
+
+    def test_stats_follow_fos_changes(self):
+        self.assertEqual(FosStat.objects.get(discipline=self.disciplines[2], fos_type__name='Тип 2').count, 1)
+        fos = Fos.objects.create(name='ФОС', type=FosType.objects.get(name='Тип 2'),
+                                 discipline=self.disciplines[2], years='2022')
+        self.assertEqual(FosStat.objects.get(discipline=self.disciplines[2], fos_type__name='Тип 2').count, 2)
+
+        # перенос ФОСа в другую дисциплину и период
+        fos.discipline = self.disciplines[0]
+        fos.years = None
+        fos.save()
+        self.assertEqual(FosStat.objects.get(discipline=self.disciplines[0], fos_type__name='Тип 2', years='').count, 1)
+        self.assertStatsMatch()
+
+        fos.delete()
+        self.assertFalse(FosStat.objects.filter(discipline=self.disciplines[0], fos_type__name='Тип 2').exists())
+        Fos.objects.filter(discipline=self.disciplines[3]).delete()
+        self.assertFalse(FosStat.objects.filter(discipline=self.disciplines[3]).exists())
+        self.assertStatsMatch()
+
+    def test_stats_follow_qualification(self):
+        magistracy = Qualification.objects.get(name='Магистратура')
+        self.disciplines[0].qualification = magistracy
+        self.disciplines[0].save()
+        self.assertEqual(set(FosStat.objects.filter(discipline=self.disciplines[0]).values_list(
+            'qualification', flat=True)), {magistracy.id})
+        self.assertStatsMatch()
+
+    def test_rebuild_and_verify_command(self):
+        FosStat.objects.filter(discipline=self.disciplines[1]).update(count=5)
+        FosStat.objects.filter(discipline=self.disciplines[2]).delete()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_fos_stats', '--verify', stdout=io.StringIO())
+        self.assertEqual(len(stats.verify()), 5)
+
+        call_command('rebuild_fos_stats', stdout=io.StringIO())
+        self.assertStatsMatch()
+        call_command('rebuild_fos_stats', '--verify', stdout=io.StringIO())
+
+    def test_report_reads_stats(self):
+        FosStat.objects.filter(discipline=self.disciplines[1]).update(count=3)
+        summary = DisciplinesSummary(years='2022')
+        self.assertEqual(summary.total, 1 + 2 * 3 + 3 + 1)
+        self.assertEqual(DisciplinesSummary(years='2021').total_dis, 0)
+
+
+@override_settings(INSTRUMENTATION=True, INSTRUMENTATION_LOG=True)
+class InstrumentationTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        instrumentation.clear()
+        self.addCleanup(instrumentation.clear)
+        self.create_catalogue(3)
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(self.admin)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            instrumentation.fingerprint('SELECT * FROM "app_fos" WHERE "id" IN (%s, %s, %s) AND name = \'a\' LIMIT 21'),
+            'SELECT * FROM "app_fos" WHERE "id" IN (...) AND name = ? LIMIT ?'
+        )
+
+    def test_request_is_recorded_and_logged(self):
+        with self.assertLogs('app.instrumentation', 'INFO') as logs, \
+                CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('admin:app_fos_changelist'))
+        record = instrumentation.get_records()[0]
+        self.assertEqual(record['view'], 'admin:app_fos_changelist')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['queries'], len(queries.captured_queries))
+        self.assertGreaterEqual(record['wall_ms'], record['sql_ms'])
+        self.assertEqual(json.loads(logs.records[0].getMessage())['path'], reverse('admin:app_fos_changelist'))
+
+    def test_duplicate_queries_are_detected(self):
+        recorder = instrumentation.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for d in Discipline.objects.all():
+                list(d.fos_set.all())
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual([count for sql, count in recorder.duplicates()], [3])
+
+    @override_settings(INSTRUMENTATION_BUFFER_SIZE=2, INSTRUMENTATION_LOG=False)
+    def test_buffer_keeps_last_records(self):
+        for url in ('admin:app_fos_changelist', 'admin:app_discipline_changelist', 'admin:app_group_changelist'):
+            self.client.get(reverse(url))
+        self.assertEqual([r['view'] for r in instrumentation.get_records()],
+                         ['admin:app_group_changelist', 'admin:app_discipline_changelist'])
+
+    @override_settings(INSTRUMENTATION_LOG=False)
+    def test_page_is_for_superuser_only(self):
+        self.client.get(reverse('admin:app_discipline_changelist'))
+        response = self.client.get(reverse('instrumentation'))
+        self.assertContains(response, 'admin:app_discipline_changelist')
+        # страница замеров сама не замеряется
+        self.assertEqual(len(instrumentation.get_records()), 1)
+
+        self.client.post(reverse('instrumentation'))
+        self.assertEqual(instrumentation.get_records(), [])
+
+        self.client.force_login(User.objects.create_user('teacher', is_staff=True))
+        self.assertEqual(self.client.get(reverse('instrumentation')).status_code, 302)
+
+
+def make_docx(text):
+    """
+        Содержимое docx файла с одним абзацем текста
+    """
+    output = tempfile.SpooledTemporaryFile()
+    document = docx.Document()
+    document.add_paragraph(text)
+    document.save(output)
+    output.seek(0)
+    return output.read()
+
+
+class MergeDocumentsTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        self.cache_dir = os.path.join(self.media_root, merging.MERGED_DIR)
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        self.fos = Fos.objects.get(pk=self.create_catalogue(1)[0].fos_set.get().pk)
+        self.documents = [self.add_document('Документ ' + str(i)) for i in range(3)]
+
+    def add_document(self, text):
+        document = Document(name=text, fos=self.fos)
+        document.path.save('doc.docx', ContentFile(make_docx(text)))
+        return document
+
+    def merge(self):
+        response = self.client.get(reverse('merge_documents', args=(self.fos.pk,)))
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_merged_document_is_cached(self):
+        with mock.patch('app.merging.compose', wraps=merging.compose) as compose:
+            first = self.merge()
+            second = self.merge()
+        self.assertEqual(compose.call_count, 1)
+        self.assertEqual(first, second)
+        merged = docx.Document(os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0]))
+        self.assertEqual([p.text for p in merged.paragraphs if p.text], ['Документ 0', 'Документ 1', 'Документ 2'])
+
+    def test_invalid_documents(self):
+        broken = Document(name='Не MS Word', fos=self.fos)
+        broken.path.save('broken.docx', ContentFile(b'not a docx'))
+        with self.settings(MERGE_PARSE_WORKERS=4):
+            path = merging.get_merged_document(self.fos.pk, self.documents + [broken] + [self.add_document('Последний')])
+        merged = docx.Document(path)
+        self.assertEqual([p.text for p in merged.paragraphs if p.text][-2:], ['Документ 2', 'Последний'])
+
+        with self.assertRaises(merging.InvalidDocumentError):
+            merging.get_merged_document(self.fos.pk, [broken] + self.documents)
+
+    def test_document_change_invalidates_cache(self):
+        self.merge()
+        self.documents[1].name = 'Переименован'
+        self.documents[1].save()
+        self.assertEqual(os.listdir(self.cache_dir), [])
+        with mock.patch('app.merging.compose', wraps=merging.compose) as compose:
+            self.merge()
+        self.assertEqual(compose.call_count, 1)
+
+    def test_eviction(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for i in range(3):
+            with open(os.path.join(self.cache_dir, 'fos_100{}_key.docx'.format(i)), 'wb') as f:
+                f.write(b'0' * 1024 * 1024)
+            os.utime(f.name, (i, i))
+        with self.settings(MERGED_DOCUMENTS_CACHE_SIZE=2):
+            merging.evict()
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ['fos_1001_key.docx', 'fos_1002_key.docx'])
+
+
+class DocumentDeliveryTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        fos = Fos.objects.get(pk=self.create_catalogue(1)[0].fos_set.get().pk)
+        self.document = Document(name='Документ', fos=fos)
+        self.document.path.save('doc.pdf', ContentFile(bytes(range(256)) * 4))
+        self.url = reverse('document_file', args=(self.document.pk,))
+
+    def test_full_and_conditional(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], '1024')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(len(b''.join(response.streaming_content)), 1024)
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(252, 256)))
+
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=2000-').status_code, 416)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_sendfile(self):
+        with self.settings(SENDFILE_BACKEND='x-accel-redirect', SENDFILE_URL='/protected/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + self.document.path.name)
+        self.assertEqual(response.content, b'')
+
+
+class FosChangelistTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+
+    def add_documents(self, count):
+        for fos in Fos.objects.all():
+            for i in range(count):
+                Document.objects.create(name='Документ ' + str(i), fos=fos, path='documents/doc.pdf')
+
+    def changelist_queries(self, params=None):
+        # первый запрос загружает справочники в кэш, считаем запросы повторного открытия списка
+        self.client.get(reverse('admin:app_fos_changelist'), params or {})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:app_fos_changelist'), params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries.captured_queries)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.create_catalogue(2)
+        self.add_documents(1)
+        small = self.changelist_queries()
+        self.create_catalogue(30)
+        self.add_documents(3)
+        self.assertEqual(self.changelist_queries(), small)
+        self.assertEqual(self.changelist_queries({'all': ''}), small)
+
+
+class ChangelistCountsTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.teacher = User.objects.create_user('teacher', is_staff=True)
+        self.teacher.user_permissions.add(*Permission.objects.filter(
+            codename__in=['view_qualification', 'view_discipline']
+        ))
+
+    def populate(self, count):
+        group = Group.objects.create(name='Группа ' + str(count))
+        for i, d in enumerate(self.create_catalogue(count)):
+            d.groups.add(group)
+            d.users.add(self.admin)
+            if i % 2:
+                d.users.add(self.teacher)
+
+    def changelist_queries(self, url):
+        # первый запрос загружает справочники в кэш (и создает тему админки), считаем запросы повторного открытия
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries.captured_queries)
+
+    def assertConstantQueries(self, user, url):
+        self.client.force_login(user)
+        self.populate(2)
+        small = self.changelist_queries(url)
+        self.populate(25)
+        self.assertEqual(self.changelist_queries(url), small)
+
+    def test_discipline_changelist(self):
+        self.assertConstantQueries(self.admin, reverse('admin:app_discipline_changelist'))
+
+    def test_group_changelist(self):
+        self.assertConstantQueries(self.admin, reverse('admin:app_group_changelist'))
+
+    def test_qualification_changelist(self):
+        self.assertConstantQueries(self.admin, reverse('admin:app_qualification_changelist'))
+
+    def test_qualification_changelist_for_teacher(self):
+        self.assertConstantQueries(self.teacher, reverse('admin:app_qualification_changelist'))
+        response = self.client.get(reverse('admin:app_qualification_changelist'))
+        self.assertContains(response, '(1 дисциплина)</a> <i>всего: 1</i>')
+        self.assertContains(response, '(12 дисциплин)</a> <i>всего: 12</i>')
+        self.assertContains(response, '(0 дисциплин)</a> <i>всего: 13</i>')
+
+
+class OwnershipPermissionsTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create_user('teacher', is_staff=True)
+        self.teacher.user_permissions.add(*Permission.objects.filter(codename__in=[
+            'view_discipline', 'change_discipline', 'add_fos', 'change_fos', 'delete_fos', 'view_fos',
+            'add_document', 'change_document', 'delete_document', 'view_document',
+        ]))
+        self.own, self.foreign = self.create_catalogue(4)[2:]
+        self.own.users.add(self.teacher)
+        for fos in self.own.fos_set.all():
+            Document.objects.create(name='Документ', fos=fos)
+        self.client.force_login(self.teacher)
+
+    def test_ownership_is_loaded_once_per_request(self):
+        url = reverse('admin:app_discipline_change', args=(self.own.pk,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        ownership = [q for q in queries.captured_queries if 'FROM "app_discipline_users"' in q['sql']]
+        self.assertEqual(len(ownership), 1)
+
+    def test_foreign_objects_are_read_only(self):
+        response = self.client.get(reverse('admin:app_discipline_change', args=(self.foreign.pk,)))
+        self.assertNotContains(response, 'name="_save"')
+        response = self.client.get(reverse('admin:app_fos_change', args=(self.foreign.fos_set.first().pk,)))
+        self.assertNotContains(response, 'name="_save"')
+        response = self.client.get(reverse('admin:app_fos_change', args=(self.own.fos_set.first().pk,)))
+        self.assertContains(response, 'name="_save"')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'План запросов проверяется для SQLite')
+class HotPathIndexesTest(MediaRootMixin, CatalogueMixin, TestCase):
+    """
+        Запросы отчетов и фильтров списка ФОСов не должны сканировать таблицы ФОСов и документов целиком
+    """
+
+    FULL_SCAN_RE = re.compile(r'\bSCAN (app_fos|app_document)$')
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.disciplines = self.create_catalogue(6)
+        for d in self.disciplines:
+            d.users.add(self.admin)
+            for fos in d.fos_set.all():
+                Document.objects.create(name='Документ', fos=fos)
+        self.client.force_login(self.admin)
+
+    def assertNoFullScans(self, queries):
+        checked = 0
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or ' WHERE ' not in sql:
+                    continue
+                if 'FROM "app_fos"' not in sql and 'FROM "app_document"' not in sql:
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                for row in cursor.fetchall():
+                    self.assertIsNone(self.FULL_SCAN_RE.search(row[-1]), sql + '\n' + row[-1])
+                checked += 1
+        self.assertGreater(checked, 0)
+
+    def test_fos_changelist_filters(self):
+        fos = Fos.objects.first()
+        for params in ({'years': '2022'}, {'type__id__exact': fos.type_id},
+                       {'discipline__id__exact': fos.discipline_id}, {'teacher': self.admin.id}):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('admin:app_fos_changelist'), params)
+            self.assertNoFullScans(queries.captured_queries)
+
+    def test_reports(self):
+        with CaptureQueriesContext(connection) as queries:
+            DisciplinesSummary(years='2022')
+            TeacherFosSummary(self.admin.id)
+        self.assertNoFullScans(queries.captured_queries)
+
+
+class SearchIndexTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        self.math, self.physics = self.create_catalogue(2)
+        self.math.name = 'Высшая математика'
+        self.math.save()
+        self.fos = self.math.fos_set.first()
+        self.fos.name = 'Контрольные работы'
+        self.fos.description = 'Задачи по линейной алгебре'
+        self.fos.save()
+        self.document = Document.objects.create(name='Экзаменационные билеты', fos=self.physics.fos_set.first())
+
+    def test_index_follows_models(self):
+        self.assertEqual(SearchEntry.objects.filter(kind=SearchEntry.KIND_FOS).count(), Fos.objects.count())
+        self.assertEqual(set(search.match('алгебры', [SearchEntry.KIND_FOS]).values_list('object_id', flat=True)),
+                         {self.fos.id})
+        self.document.delete()
+        self.assertFalse(search.match('билеты', [SearchEntry.KIND_DOCUMENT]).exists())
+
+        self.fos.discipline = self.physics
+        self.fos.save()
+        self.assertEqual(set(search.search_disciplines(Discipline.objects.all(), 'контрольная работа')),
+                         {self.physics})
+
+    def test_word_forms(self):
+        disciplines = Discipline.objects.all()
+        self.assertEqual(list(search.search_disciplines(disciplines, 'математике')), [self.math])
+        self.assertEqual(list(search.search_disciplines(disciplines, 'экзаменационный билет')), [self.physics])
+        self.assertEqual(list(search.search_disciplines(disciplines, 'химия')), [])
+        self.assertEqual(list(search.search_foses(Fos.objects.all(), 'высшей математики')),
+                         list(self.math.fos_set.all()))
+
+    def test_rebuild(self):
+        SearchEntry.objects.all().delete()
+        self.assertEqual(search.rebuild(), Discipline.objects.count() + Fos.objects.count() + Document.objects.count())
+        self.assertTrue(search.match('контрольной', [SearchEntry.KIND_FOS]).exists())
+
+    def test_admin_search(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        response = self.client.get(reverse('admin:app_discipline_changelist'), {'q': 'билетов'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.physics])
+        response = self.client.get(reverse('admin:app_fos_changelist'), {'q': 'контрольная'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.fos])
+        # поля search_fields, которых нет в индексе (тип ФОСа)
+        fos_type = FosType.objects.create(name='Коллоквиум')
+        Fos.objects.filter(pk=self.fos.pk).update(type=fos_type)
+        response = self.client.get(reverse('admin:app_fos_changelist'), {'q': 'Коллоквиум'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.fos])
+        # поля search_fields дисциплины (вид обучения)
+        Discipline.objects.filter(pk=self.math.pk).update(qualification=Qualification.objects.create(name='Аспирантура'))
+        response = self.client.get(reverse('admin:app_discipline_changelist'), {'q': 'Аспирантура'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.math])
+
+
+class DocumentTextExtractionTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        self.fos = Fos.objects.get(pk=self.create_catalogue(1)[0].fos_set.get().pk)
+
+    def upload(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            document = Document(name='Материалы', fos=self.fos)
+            document.path.save(name, ContentFile(content))
+        return document
+
+    def test_docx_text_is_searchable(self):
+        document = self.upload('questions.docx', make_docx('Найдите производные функций'))
+        self.assertIn('производные функций', DocumentText.objects.get(document=document).content)
+        self.assertEqual(list(search.search_foses(Fos.objects.all(), 'производная функции')), [self.fos])
+
+        # текст и миниатюра уже есть - файл повторно не читается
+        with mock.patch('app.extraction.read_file') as read_file:
+            self.assertFalse(processing.process_document(document.id))
+        read_file.assert_not_called()
+
+    def test_file_is_read_once_per_save(self):
+        with mock.patch('app.extraction.read_file', wraps=extraction.read_file) as read_file:
+            document = self.upload('questions.docx', make_docx('Найдите производные функций'))
+        read_file.assert_called_once_with(document.path.path)
+        self.assertTrue(DocumentText.objects.filter(document=document).exists())
+        self.assertEqual(DocumentPreview.objects.get().page_count, 1)
+
+    def test_xlsx(self):
+        output = tempfile.SpooledTemporaryFile()
+        workbook = openpyxl.Workbook()
+        workbook.active.append(['Вопрос', 'Производная сложной функции'])
+        workbook.save(output)
+        output.seek(0)
+        document = self.upload('tests.xlsx', output.read())
+        self.assertEqual(DocumentText.objects.get(document=document).content, 'Вопрос\nПроизводная сложной функции')
+
+    def test_broken_and_unsupported_files(self):
+        self.assertEqual(DocumentText.objects.get(document=self.upload('broken.pdf', b'%PDF broken')).content, '')
+        self.assertEqual(DocumentText.objects.get(document=self.upload('archive.zip', b'PK')).content, '')
+
+
+
+class ReferenceCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_cached_until_changed(self):
+        FosType.objects.create(name='Тест')
+        self.assertEqual([t.name for t in cache.fos_types()], ['Тест'])
+        with self.assertNumQueries(0):
+            cache.fos_types()
+        FosType.objects.create(name='Курсовая работа')
+        self.assertEqual([t.name for t in cache.fos_types()], ['Тест', 'Курсовая работа'])
+        Qualification.objects.create(name='Бакалавриат').delete()
+        self.assertEqual(cache.qualifications(), [])
+
+    @override_settings(REFERENCE_CACHE_ALIAS='default')
+    def test_shared_tier(self):
+        DisciplineType.objects.create(name='Экзамен')
+        cache.discipline_types()
+        # другой процесс (пустой первый уровень) получает значение из общего кэша
+        cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual([t.name for t in cache.discipline_types()], ['Экзамен'])
+        DisciplineType.objects.create(name='Зачет')
+        cache.clear()
+        self.assertEqual([t.name for t in cache.discipline_types()], ['Экзамен', 'Зачет'])
+
+    def test_years_follow_current_year(self):
+        with mock.patch('app.cache.datetime') as dt:
+            dt.date.today.return_value = datetime.date(2031, 9, 1)
+            self.assertEqual(cache.years_choices()[0], ('2031', '2031 - 2032'))
+            self.assertEqual(list(Fos.YEARS_CHOICES)[-1], ('2000', '2000 - 2001'))
+            Fos._meta.get_field('years').validate('2031', None)
+
+
+
+class TeacherDirectoryTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.teacher = User.objects.create_user('ivanov', first_name='Иван', last_name='Иванов', is_staff=True)
+        self.discipline = self.create_catalogue(1)[0]
+
+    def test_only_teachers_with_disciplines(self):
+        self.assertEqual(cache.teachers(), [])
+        self.discipline.users.add(self.teacher)
+        self.assertEqual(cache.teachers(), [cache.Teacher(self.teacher.id, 'Иванов Иван', 'Иван Иванов')])
+        with self.assertNumQueries(0):
+            cache.teachers()
+
+        self.teacher.last_name = 'Петров'
+        self.teacher.save()
+        self.assertEqual(cache.teachers()[0].full_name, 'Иван Петров')
+
+        self.discipline.users.remove(self.teacher)
+        self.assertEqual(cache.teachers(), [])
+        self.discipline.users.add(self.teacher)
+        Fos.objects.filter(discipline=self.discipline).delete()
+        self.discipline.delete()
+        self.assertEqual(cache.teachers(), [])
+
+    def test_changelist_dropdown_and_filter(self):
+        self.discipline.users.add(self.teacher)
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin:app_fos_changelist'), {'teacher': self.teacher.id})
+        self.assertContains(response, '<option value="{}">Иван Иванов</option>'.format(self.teacher.id), html=True)
+        self.assertContains(response, 'Иванов Иван')
+        self.assertContains(response, '(Иван Иванов) Список оценочных средств дисциплин')
+        self.assertNotContains(response, '<option value="{}">'.format(self.admin.id))
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Проверка профиля SQLite')
+class SqliteBackendTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+
+    def connect(self, timeout):
+        settings_dict = dict(connection.settings_dict, NAME=os.path.join(self.tmp_dir, 'db.sqlite3'),
+                             OPTIONS={'timeout': timeout})
+        wrapper = SqliteDatabaseWrapper(settings_dict)
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_wal_and_busy_timeout(self):
+        wrapper = self.connect(7)
+        with wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 7000)
+
+    def test_write_transaction_takes_write_lock_at_start(self):
+        first = self.connect(0)
+        second = self.connect(0)
+        first.begin_immediate = True
+        first._start_transaction_under_autocommit()
+        # вторая пишущая транзакция не начнется, пока первая держит блокировку записи
+        second.begin_immediate = True
+        with self.assertRaises(OperationalError):
+            second._start_transaction_under_autocommit()
+        # а читающая начнется
+        second.begin_immediate = False
+        second._start_transaction_under_autocommit()
+        second.connection.rollback()
+        first.connection.rollback()
+        second.begin_immediate = True
+        second._start_transaction_under_autocommit()
+        second.connection.rollback()
+
+    def test_atomic_write(self):
+        from app.backends import atomic_write
+        wrapper = self.connect(0)
+        statements = []
+        # (блоки транзакций - на соединении с файлом БД)
+        with mock.patch('django.db.transaction.get_connection', return_value=wrapper), \
+                wrapper.execute_wrapper(lambda execute, sql, *args: statements.append(sql) or execute(sql, *args)):
+            with atomic_write():
+                pass
+            self.assertFalse(wrapper.begin_immediate)
+            with transaction.atomic():
+                pass
+        self.assertEqual(statements, ['BEGIN IMMEDIATE', 'BEGIN'])
+
+    def test_write_request_middleware(self):
+        from app.backends import WriteRequestMiddleware
+        seen = []
+        middleware = WriteRequestMiddleware(lambda request: seen.append(connection.begin_immediate))
+        middleware(RequestFactory().get('/'))
+        middleware(RequestFactory().post('/'))
+        self.assertEqual(seen, [False, True])
+        self.assertFalse(connection.begin_immediate)
+
+
+class SyntheticDepartmentTest(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_generate_and_delete(self):
+        from app.synthetic import SyntheticDepartment
+        department = SyntheticDepartment(20, foses_per_discipline=2, documents_per_fos=1, prefix='test')
+        scale = department.generate()
+        self.assertEqual(scale['disciplines'], 20)
+        self.assertEqual(scale['teachers'], 4)
+        self.assertEqual(scale['groups'], 2)
+        self.assertEqual(Fos.objects.count(), scale['foses'])
+        self.assertEqual(Document.objects.count(), scale['foses'])
+        self.assertFalse(Discipline.objects.filter(users=None).exists())
+        self.assertEqual(stats.verify(), [])
+        self.assertEqual(len(cache.teachers()), Discipline.users.through.objects.values('user').distinct().count())
+        document = Document.objects.first()
+        self.assertTrue(docx.Document(document.path.path).paragraphs)
+
+        # одинаковое начальное значение - одинаковая кафедра
+        names = list(department.discipline_queryset().order_by('id').values_list('name', flat=True))
+        # файлы удаляются после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            department.delete()
+        self.assertFalse(Discipline.objects.exists())
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(os.path.exists(document.path.path))
+        department.generate()
+        self.assertEqual(list(department.discipline_queryset().order_by('id').values_list('name', flat=True)), names)
+
+    def test_refreshes_only_generated_rows(self):
+        from app.synthetic import SyntheticDepartment
+        SyntheticDepartment(5, prefix='first').generate()
+        FosStat.objects.update(count=100)
+        department = SyntheticDepartment(5, prefix='second')
+        department.generate()
+        # статистика и индекс других дисциплин не пересчитываются
+        self.assertFalse(FosStat.objects.filter(discipline__name__startswith='first ').exclude(count=100).exists())
+        second = set(department.discipline_queryset().values_list('id', flat=True))
+        mismatches = stats.verify()
+        self.assertTrue(mismatches)
+        self.assertFalse([key for key, stored, live in mismatches if key[0] in second])
+        self.assertEqual(
+            SearchEntry.objects.filter(discipline_id__in=second).count(),
+            len(second) + Fos.objects.filter(discipline_id__in=second).count()
+            + Document.objects.filter(fos__discipline_id__in=second).count()
+        )
+
+
+class BenchmarkCommandTest(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+
+    def test_results_and_regressions(self):
+        output = os.path.join(self.tmp_dir, 'baseline.json')
+        call_command('benchmark', disciplines=10, repeat=1, current_database=True, output=output,
+                     stdout=io.StringIO())
+        with open(output) as f:
+            report = json.load(f)
+        self.assertEqual(report['scale']['disciplines'], 10)
+        self.assertEqual(set(report['results']), {
+            'changelist:fos', 'changelist:discipline', 'changelist:qualification', 'changelist:group',
+            'report:disciplines', 'report:fos', 'merge_documents', 'import:disciplines', 'import:users',
+        })
+        # синтетическая кафедра удаляется после замеров
+        self.assertFalse(Discipline.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+        for result in report['results'].values():
+            result['queries'] = 0
+        with open(output, 'w') as f:
+            json.dump(report, f)
+        with self.assertRaisesMessage(CommandError, 'report:fos'):
+            call_command('benchmark', disciplines=10, repeat=1, current_database=True, only=['report:'],
+                         baseline=output, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_throwaway_database(self):
+        # по умолчанию замеры идут во временной БД: настроенная БД не создается и не меняется
+        live = os.path.join(self.tmp_dir, 'live.sqlite3')
+        env = dict(os.environ, DB_ENGINE='sqlite', DB_NAME=live, DEBUG='True')
+        process = subprocess.run(
+            [sys.executable, 'manage.py', 'benchmark', '--disciplines', '10', '--repeat', '1', '--only', 'report:',
+             '--json'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=300,
+        )
+        self.assertEqual(process.returncode, 0, process.stderr)
+        report = json.loads(process.stdout)
+        self.assertEqual(set(report['results']), {'report:disciplines', 'report:fos'})
+        self.assertFalse(os.path.exists(live))
+
+    def test_keep_requires_current_database(self):
+        with self.assertRaisesMessage(CommandError, '--current-database'):
+            call_command('benchmark', keep=True, stdout=io.StringIO())
+
+    def test_compare(self):
+        from app.management.commands.benchmark import compare
+        baseline = {'a': {'median_ms': 100, 'queries': 5}, 'b': {'median_ms': 10, 'queries': 5}}
+        results = {
+            'a': {'median_ms': 130, 'queries': 5},
+            'b': {'median_ms': 14, 'queries': 5},
+            'c': {'median_ms': 1, 'queries': 1},
+        }
+        self.assertEqual([(name, regression) for name, base, current, regression
+                          in compare(results, baseline, 0.25, 5)], [('a', True), ('b', False)])
+        results['b']['queries'] = 6
+        self.assertTrue(compare(results, baseline, 0.25, 5)[1][3])
+
+
+class SeedCommandTest(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_idempotent(self):
+        # пустой справочник уже в кэше
+        self.assertEqual(cache.fos_types(), [])
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            call_command('seed', stdout=io.StringIO())
+        # запросы не зависят от количества значений справочников и прав
+        self.assertLess(len(queries.captured_queries), 20)
+        teacher = UserGroup.objects.get(name='Преподаватель')
+        self.assertEqual(teacher.permissions.count(), 11)
+        self.assertEqual(FosType.objects.count(), 9)
+        self.assertEqual(len(cache.fos_types()), 9)
+        self.assertEqual(len(cache.qualifications()), 2)
+
+        FosType.objects.filter(name='ФОС').delete()
+        teacher.permissions.remove(Permission.objects.get(codename='view_fos'))
+        call_command('seed', stdout=io.StringIO())
+        self.assertEqual(FosType.objects.count(), 8)
+        self.assertEqual(teacher.permissions.count(), 11)
+        self.assertEqual(UserGroup.objects.filter(name='Преподаватель').count(), 1)
+        self.assertEqual(DisciplineType.objects.count(), 2)
+        self.assertEqual(Qualification.objects.count(), 2)
+
+    def test_scale(self):
+        call_command('seed', scale=25, batch_size=10, stdout=io.StringIO())
+        self.assertEqual(Discipline.objects.count(), 25)
+        self.assertEqual(Document.objects.count(), Fos.objects.count())
+        self.assertEqual(set(Fos.objects.values_list('type__name', flat=True)) - set(
+            FosType.objects.values_list('name', flat=True)
+        ), set())
+        self.assertEqual(stats.verify(), [])
+        self.assertEqual(SearchEntry.objects.count(), 25 + 2 * Fos.objects.count())
+        # повторный запуск добавляет новые записи
+        call_command('seed', scale=5, stdout=io.StringIO())
+        self.assertEqual(Discipline.objects.count(), 30)
+
+
+class DocumentBlobTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        from app.synthetic import make_docx
+        self.fos = self.create_catalogue(1)[0].fos_set.first()
+        self.content = make_docx(['Вопросы к экзамену'])
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+        shutil.rmtree(os.path.join(self.media_root, 'documents'), ignore_errors=True)
+
+    def document(self, file_name, content):
+        document = Document(name=file_name, fos=self.fos)
+        document.path.save(file_name, ContentFile(content))
+        return document
+
+    def stored_files(self):
+        root = os.path.join(self.media_root, 'documents')
+        return sorted(os.path.relpath(os.path.join(d, f), self.media_root)
+                      for d, _, files in os.walk(root) for f in files)
+
+    def test_upload_is_hashed_as_it_streams(self):
+        # небольшой файл загружается в память, большой - во временный файл
+        for max_memory_size in (100, 1024 * 1024):
+            with self.settings(FILE_UPLOAD_MAX_MEMORY_SIZE=max_memory_size):
+                request = RequestFactory().post('/', {'file': SimpleUploadedFile('Методичка.docx', self.content)})
+                upload = request.FILES['file']
+                self.assertEqual(upload.sha256, self.sha256)
+                temporary_path = upload.temporary_file_path() if max_memory_size == 100 else None
+                document = Document.objects.create(name='Методичка', fos=self.fos, path=upload)
+                upload.close()
+            self.assertEqual(document.path.name, 'documents/{}/{}/{}.docx'.format(
+                self.sha256[:2], self.sha256[2:4], self.sha256
+            ))
+            self.assertEqual(document.file_name, 'Методичка.docx')
+            if temporary_path:
+                # временный файл не копируется, а перемещается в хранилище
+                self.assertFalse(os.path.exists(temporary_path))
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(Blob.objects.get().refcount, 2)
+
+    def test_deduplication_and_collection(self):
+        first = self.document('Первый.docx', self.content)
+        second = self.document('Второй.docx', self.content)
+        self.assertEqual(first.path.name, second.path.name)
+        self.assertEqual(self.stored_files(), [first.path.name])
+        blob = Blob.objects.get()
+        self.assertEqual((blob.sha256, blob.size, blob.refcount), (self.sha256, len(self.content), 2))
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        response = self.client.get(reverse('document_file', args=(second.id,)))
+        self.assertIn("filename*=utf-8''%D0%92%D1%82%D0%BE%D1%80%D0%BE%D0%B9.docx", response['Content-Disposition'])
+        response.close()
+
+        second.path.save('Второй.pdf', ContentFile(b'%PDF-1.4'))
+        first.delete()
+        self.assertEqual(dict(Blob.objects.values_list('name', 'refcount')), {blob.name: 0, second.path.name: 1})
+        self.assertEqual(blobs.verify(), [])
+
+        # файл без ссылок хранится DOCUMENT_BLOB_GRACE_HOURS
+        self.assertEqual(blobs.collect(datetime.timedelta(hours=1)), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual([b.name for b in blobs.collect()], [blob.name])
+        self.assertEqual(self.stored_files(), [second.path.name])
+
+        # документ снова ссылается на удаленный файл - запись о файле создается заново
+        self.document('Третий.docx', self.content)
+        self.assertEqual(Blob.objects.get(sha256=self.sha256).refcount, 1)
+
+    def test_reuse_of_unreferenced_file(self):
+        old = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        first = self.document('Первый.docx', self.content)
+        name = first.path.name
+        first.delete()
+        Blob.objects.update(updated_at=old)
+
+        # ссылка на файл без ссылок продлевает его хранение: сборка, начатая до сохранения документа, файл не удаляет
+        upload = SimpleUploadedFile('Второй.docx', self.content)
+        upload.sha256 = self.sha256
+        second = Document.objects.create(name='Второй', fos=self.fos, path=upload)
+        self.assertEqual(second.path.name, name)
+        self.assertGreater(Blob.objects.get().updated_at, old)
+        self.assertEqual(blobs.collect(datetime.timedelta(hours=1)), [])
+        self.assertEqual(blobs.collect(), [])
+        self.assertEqual(self.stored_files(), [name])
+
+        # запись о файле уже удалена - файл записывается заново, даже если он еще есть на диске
+        Blob.objects.all().delete()
+        os.remove(document_storage.path(name))
+        third = Document.objects.create(name='Третий', fos=self.fos, path=upload)
+        self.assertEqual(third.path.name, name)
+        self.assertEqual(self.stored_files(), [name])
+
+    def test_reuse_of_unreferenced_file_without_hash(self):
+        old = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        first = self.document('Первый.docx', self.content)
+        name = first.path.name
+        first.delete()
+        Blob.objects.update(updated_at=old)
+
+        # файл без посчитанного хэша (создан кодом): ссылка на сохраненный файл тоже продлевает его хранение
+        second = self.document('Второй.docx', self.content)
+        self.assertEqual(second.path.name, name)
+        self.assertGreater(Blob.objects.get().updated_at, old)
+        self.assertEqual(blobs.collect(), [])
+        self.assertEqual(self.stored_files(), [name])
+
+        # записи о файле нет - файл на диске заменяется новым и не считается оставшимся после сбоя
+        Blob.objects.all().delete()
+        os.utime(document_storage.path(name), (old.timestamp(), old.timestamp()))
+        third = self.document('Третий.docx', self.content)
+        self.assertEqual(third.path.name, name)
+        self.assertEqual(Blob.objects.get().sha256, self.sha256)
+        self.assertEqual(blobs.orphan_files(datetime.timedelta(hours=1)), [])
+        self.assertGreater(os.path.getmtime(document_storage.path(name)), old.timestamp())
+        self.assertEqual(self.stored_files(), [name])
+
+    def test_duplicate_chunked_upload_is_removed(self):
+        from app.uploads import ChunkedFileInput
+        self.document('Первый.docx', self.content)
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        session = uploads.start_upload(user, 'Второй.docx', len(self.content))
+        part = document_storage.path(uploads.part_name(session.token))
+        with open(part, 'wb') as f:
+            f.write(self.content)
+        UploadSession.objects.filter(pk=session.pk).update(received=len(self.content), sha256=self.sha256)
+
+        upload = ChunkedFileInput(user=user).value_from_datadict({'path_upload': session.token}, {}, 'path')
+        document = Document.objects.create(name='Второй', fos=self.fos, path=upload)
+        self.assertEqual(Blob.objects.get(name=document.path.name).refcount, 2)
+        self.assertFalse(os.path.exists(part))
+
+    def test_collect_command(self):
+        document = self.document('Первый.docx', self.content)
+        stale = self.document('Второй.docx', b'old')
+        Document.objects.filter(pk=stale.pk).delete()
+        Blob.objects.update(updated_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+        orphan = os.path.join(self.media_root, 'documents', 'old.docx')
+        with open(orphan, 'wb') as f:
+            f.write(b'old')
+        os.utime(orphan, (0, 0))
+        # неверное количество ссылок исправляется пересчетом
+        Blob.objects.filter(name=document.path.name).update(refcount=0)
+
+        output = io.StringIO()
+        call_command('collect_document_blobs', rebuild=True, orphans=True, dry_run=True, stdout=output)
+        self.assertIn('Найдено файлов без ссылок: 1, файлов без записей: 1', output.getvalue())
+        self.assertEqual(len(self.stored_files()), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('collect_document_blobs', orphans=True, stdout=io.StringIO())
+        self.assertEqual(self.stored_files(), [document.path.name])
+        self.assertEqual(blobs.verify(), [])
+
+
+class ChunkedUploadTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(self.user)
+        self.content = bytes(range(256)) * 4
+
+    def start(self, file_name='Билеты.pdf', size=None):
+        return self.client.post(reverse('upload_start'), {
+            'file_name': file_name, 'size': len(self.content) if size is None else size
+        })
+
+    def send(self, state, offset, data):
+        return self.client.post(state['url'] + '?offset=' + str(offset), {'chunk': SimpleUploadedFile('blob', data)})
+
+    def test_limits_are_checked_before_upload(self):
+        self.assertEqual(self.start('Билеты.exe').status_code, 400)
+        self.assertEqual(self.start(size=0).status_code, 400)
+        response = self.start(size=2 * 1024 * 1024)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1 Мб', response.json()['error'])
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_parts_with_offsets_and_resume(self):
+        response = self.start()
+        self.assertEqual(response.status_code, 201)
+        state = response.json()
+        self.assertEqual((state['offset'], state['complete']), (0, False))
+
+        state = self.send(state, 0, self.content[:300]).json()
+        self.assertEqual(state['offset'], 300)
+        # часть после пропуска не принимается, клиент продолжает с полученного смещения
+        response = self.send(state, 500, self.content[500:600])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 300)
+        # после обрыва соединения часть отправляется повторно (с перекрытием)
+        state = self.send(state, 200, self.content[200:700]).json()
+        self.assertEqual(state['offset'], 700)
+        self.assertEqual(self.client.get(state['url']).json()['offset'], 700)
+        state = self.send(state, 700, self.content[700:]).json()
+        self.assertTrue(state['complete'])
+
+        session = UploadSession.objects.get()
+        self.assertEqual(session.sha256, hashlib.sha256(self.content).hexdigest())
+        with open(os.path.join(self.media_root, 'documents', '.tmp', session.token + '.part'), 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(self.send(state, 0, self.content[:10]).status_code, 409)
+
+    def test_size_is_enforced_as_bytes_arrive(self):
+        state = self.start(size=100).json()
+        # тело запроса заведомо больше файла - не читается
+        response = self.send(state, 0, b'x' * (100 * 1024))
+        self.assertEqual(response.status_code, 413)
+        # часть выходит за размер файла - прием прерывается
+        response = self.send(state, 0, b'x' * 101)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()['offset'], 0)
+        self.assertEqual(self.send(state, 0, b'x' * 100).json()['complete'], True)
+
+    def test_other_users_upload(self):
+        state = self.start().json()
+        self.client.force_login(User.objects.create_user('teacher', is_staff=True))
+        self.assertEqual(self.client.get(state['url']).status_code, 404)
+        self.assertEqual(self.send(state, 0, self.content).status_code, 404)
+
+    def test_completed_upload_is_moved_into_document(self):
+        from django.forms import modelform_factory
+        from app.uploads import ChunkedFileInput
+        state = self.start().json()
+        self.send(state, 0, self.content)
+        part = os.path.join(self.media_root, 'documents', '.tmp', state['token'] + '.part')
+
+        fos = self.create_catalogue(1)[0].fos_set.first()
+        data = {'name': 'Билеты', 'fos': fos.id, 'path_upload': state['token']}
+        # загрузка другого пользователя в форму не принимается
+        teacher = User.objects.create_user('teacher', is_staff=True)
+        form_class = modelform_factory(Document, fields=['name', 'path', 'fos'], widgets={
+            'path': ChunkedFileInput(user=teacher)
+        })
+        form = form_class(data, {})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertFalse(form.cleaned_data['path'])
+
+        form_class = modelform_factory(Document, fields=['name', 'path', 'fos'], widgets={
+            'path': ChunkedFileInput(user=self.user)
+        })
+        form = form_class(data, {})
+        self.assertIn('data-upload-url="/admin/uploads"', str(form['path']))
+        self.assertTrue(form.is_valid(), form.errors)
+        document = form.save()
+        sha256 = hashlib.sha256(self.content).hexdigest()
+        self.assertEqual(document.path.name, 'documents/{}/{}/{}.pdf'.format(sha256[:2], sha256[2:4], sha256))
+        self.assertEqual(document.file_name, 'Билеты.pdf')
+        self.assertFalse(os.path.exists(part))
+        self.assertEqual(Blob.objects.get(name=document.path.name).refcount, 1)
+
+        # устаревшие загрузки удаляются вместе с временными файлами
+        unfinished = self.start().json()
+        UploadSession.objects.update(updated_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+        call_command('collect_document_blobs', stdout=io.StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+        part = os.path.join(self.media_root, 'documents', '.tmp', unfinished['token'] + '.part')
+        self.assertFalse(os.path.exists(part))
+
+
+class DocumentPreviewTest(MediaRootMixin, CatalogueMixin, TestCase):
+
+    def setUp(self):
+        self.fos = self.create_catalogue(1)[0].fos_set.first()
+        shutil.rmtree(os.path.join(self.media_root, previews.PREVIEWS_DIR), ignore_errors=True)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+
+    def upload(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            document = Document(name=name, fos=self.fos)
+            document.path.save(name, ContentFile(content))
+        return document
+
+    def test_docx_preview_is_shared_by_content(self):
+        from app.synthetic import make_docx
+        source = docx.Document()
+        source.add_paragraph('Вопросы к экзамену')
+        source.add_page_break()
+        source.add_paragraph('Задачи')
+        output = io.BytesIO()
+        source.save(output)
+
+        first = self.upload('Вопросы.docx', output.getvalue())
+        preview = DocumentPreview.objects.get(sha256=merging.document_hash(first))
+        self.assertEqual((preview.page_count, preview.pages_text()), (2, '2 стр.'))
+        self.assertEqual(preview.image, previews.preview_name(preview.sha256))
+        with Image.open(os.path.join(self.media_root, preview.image)) as image:
+            self.assertEqual(image.size[0], settings.DOCUMENT_PREVIEW_WIDTH)
+
+        # документ с тем же файлом использует готовую миниатюру, измененный файл получает новую
+        with mock.patch('app.previews.render_page') as render_page:
+            self.upload('Копия.docx', output.getvalue())
+        render_page.assert_not_called()
+        self.upload('Другой.docx', make_docx(['Билеты']))
+        self.assertEqual(DocumentPreview.objects.count(), 2)
+
+        response = self.client.get(reverse('document_preview', args=(preview.sha256,)))
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('max-age', response['Cache-Control'])
+        response.close()
+        self.assertEqual(self.client.get(reverse('document_preview', args=('0' * 64,))).status_code, 404)
+
+        response = self.client.get(reverse('admin:app_fos_change', args=(self.fos.id,)))
+        self.assertContains(response, reverse('document_preview', args=(preview.sha256,)))
+
+    def test_page_counts(self):
+        workbook = openpyxl.Workbook()
+        workbook.active.append(['Вопрос', 'Ответ'])
+        workbook.create_sheet('Второй')
+        output = io.BytesIO()
+        workbook.save(output)
+        self.upload('Тест.xlsx', output.getvalue())
+
+        writer = PdfWriter()
+        for _ in range(3):
+            writer.add_blank_page(210, 297)
+        output = io.BytesIO()
+        writer.write(output)
+        self.upload('Скан.pdf', output.getvalue())
+
+        self.upload('Поврежденный.pdf', b'%PDF broken')
+        self.upload('Архив.zip', b'PK')
+        self.assertEqual(
+            sorted((p.pages_text(), bool(p.image)) for p in DocumentPreview.objects.all()),
+            [('', False), ('', False), ('2 листа', True), ('3 стр.', True)]
+        )
+
+    def test_changelist_previews_in_one_query(self):
+        from app.synthetic import make_docx
+        for i in range(3):
+            self.upload('Билеты {}.docx'.format(i), make_docx(['Билет ' + str(i)]))
+        url = reverse('admin:app_fos_changelist')
+        # справочники фильтров списка кэшируются при первом запросе
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.content.decode().count('/admin/previews/'), 3)
+        self.assertContains(response, '1 стр.', count=3)
+
+        for i in range(3):
+            self.upload('Ответы {}.docx'.format(i), make_docx(['Ответ ' + str(i)]))
+        with CaptureQueriesContext(connection) as more_queries:
+            response = self.client.get(url)
+        self.assertEqual(response.content.decode().count('/admin/previews/'), 6)
+        self.assertEqual(len(more_queries), len(queries))
+
+    def test_collected_with_file(self):
+        from app.synthetic import make_docx
+        document = self.upload('Вопросы.docx', make_docx(['Вопросы']))
+        preview = DocumentPreview.objects.get()
+        document.delete()
+        # миниатюра удаляется, когда удалена запись о файле
+        self.assertEqual(previews.collect(), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            blobs.collect()
+            self.assertEqual(previews.collect(), 1)
+        self.assertFalse(DocumentPreview.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, preview.image)))
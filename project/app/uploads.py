@@ -0,0 +1,291 @@
+import hashlib
+import io
+import os
+import posixpath
+import uuid
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (
+    FileUploadHandler, MemoryFileUploadHandler, StopUpload, TemporaryFileUploadHandler
+)
+from django.http import QueryDict
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+from django.utils.html import format_html
+
+from app.blobs import DOCUMENTS_DIR, PART_SUFFIX
+from app.models import UploadSession, document_storage
+from app.storage import TMP_DIR
+
+# обработчики загрузки файлов (см. FILE_UPLOAD_HANDLERS), считающие хэш SHA-256 файла по мере получения его частей:
+# хэш сохраняется в атрибуте sha256 загруженного файла, и хранилище документов (app/storage.py) не читает файл
+# повторно, чтобы определить его имя
+#
+# большие файлы документов загружаются по частям (поле ChunkedFileInput в формах документов): загрузка начинается
+# с объявления имени и размера файла (расширение и размер проверяются сразу), затем части отправляются с указанием
+# смещения и записываются на свое место во временном файле загрузки. Прерванная загрузка продолжается с первого
+# не полученного байта; после получения последнего байта файл передается в форму документа
+
+# запас на заголовки multipart части сверх размера данных (байт)
+MULTIPART_OVERHEAD = 64 * 1024
+
+# суффикс имени скрытого поля формы с идентификатором загрузки по частям
+UPLOAD_FIELD_SUFFIX = '_upload'
+
+
+class HashingUploadMixin:
+    """
+        Подсчет хэша SHA-256 файла при загрузке
+    """
+
+    def new_file(self, *args, **kwargs):
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # обработчик, не принявший файл (например, файл в памяти для большого файла), передает части дальше
+        # без изменений - хэш тогда считает следующий обработчик
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    """
+        Загрузка небольшого файла в память с подсчетом хэша
+    """
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    """
+        Загрузка файла во временный файл на диске с подсчетом хэша
+    """
+    pass
+
+
+class UploadError(Exception):
+    """
+        Часть файла загрузки не принята
+
+        Attributes:
+            status: HTTP-статус ответа
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def max_file_size():
+    return settings.MAX_UPLOADED_FILE_SIZE * 1024 * 1024
+
+
+def chunk_size():
+    return settings.UPLOAD_CHUNK_SIZE * 1024 * 1024
+
+
+def part_name(token):
+    """
+        Имя временного файла загрузки в хранилище документов (в каталоге временных файлов хранилища: при сохранении
+        документа файл перемещается на место без копирования)
+    """
+    return posixpath.join(DOCUMENTS_DIR, TMP_DIR, token + PART_SUFFIX)
+
+
+def start_upload(user, file_name, size):
+    """
+        Начало загрузки файла по частям
+
+        Raises:
+            ValidationError: Недопустимое расширение или размер файла
+    """
+    file_name = os.path.basename(file_name or '')[:255]
+    extension = os.path.splitext(file_name)[1].lower().lstrip('.')
+    if extension not in settings.ALLOWED_FILE_UPLOAD_EXTENSIONS:
+        raise ValidationError('Допустимые расширения: ' + ', '.join(settings.ALLOWED_FILE_UPLOAD_EXTENSIONS))
+    if size <= 0:
+        raise ValidationError('Файл пуст')
+    if size > max_file_size():
+        raise ValidationError('Максимальный размер загружаемых файлов: ' + str(settings.MAX_UPLOADED_FILE_SIZE) + ' Мб')
+
+    session = UploadSession.objects.create(token=uuid.uuid4().hex, user=user, file_name=file_name, size=size)
+    path = document_storage.path(part_name(session.token))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return session
+
+
+class ChunkUploadHandler(FileUploadHandler):
+    """
+        Запись части файла загрузки (поле chunk), начинающейся с байта offset, сразу на свое место во временном
+        файле загрузки
+
+        Прием части прерывается, как только она выходит за объявленный размер файла: запрос дальше не читается.
+    """
+
+    def __init__(self, request, session, offset):
+        super().__init__(request)
+        self.session = session
+        self.offset = offset
+        self.position = offset
+        self.file = None
+        self.written = None
+        self.error = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length > self.session.size - self.offset + MULTIPART_OVERHEAD:
+            # тело запроса заведомо больше оставшейся части файла - запрос не разбирается
+            self.error = 'Часть выходит за размер файла'
+            return QueryDict(), MultiValueDict()
+        return None
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        if field_name == 'chunk' and self.written is None and self.file is None:
+            self.file = open(document_storage.path(part_name(self.session.token)), 'r+b')
+            self.file.seek(self.offset)
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.file is None:
+            return None
+        if self.position + len(raw_data) > self.session.size:
+            self.error = 'Часть выходит за размер файла'
+            raise StopUpload(connection_reset=True)
+        self.file.write(raw_data)
+        self.position += len(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.file is None:
+            return None
+        self.file.close()
+        self.file = None
+        self.written = file_size
+        return UploadedFile(io.BytesIO(), name=self.file_name, size=file_size)
+
+    def upload_interrupted(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def upload_complete(self):
+        self.upload_interrupted()
+
+
+def finish_part(session, handler):
+    """
+        Учет принятой части файла загрузки; после получения последнего байта считается хэш файла
+
+        Raises:
+            UploadError: Часть не принята
+    """
+    if handler.error:
+        raise UploadError(handler.error, 413)
+    if handler.written is None:
+        raise UploadError('Нет части файла (поле chunk)')
+
+    end = handler.offset + handler.written
+    # одновременно принятые части с одинаковым началом учитываются один раз
+    UploadSession.objects.filter(pk=session.pk, received__lt=end).update(received=end, updated_at=timezone.now())
+    session.refresh_from_db()
+    if session.received == session.size and not session.complete:
+        sha256 = hashlib.sha256()
+        with open(document_storage.path(part_name(session.token)), 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        session.sha256 = sha256.hexdigest()
+        UploadSession.objects.filter(pk=session.pk).update(sha256=session.sha256)
+    return session
+
+
+def collect_sessions(grace):
+    """
+        Удаление загрузок по частям (незавершенных или не сохраненных в документе) вместе с временными файлами
+
+        Returns:
+            Количество удаленных загрузок
+    """
+    sessions = list(UploadSession.objects.filter(updated_at__lt=timezone.now() - grace).values_list('pk', 'token'))
+    for pk, token in sessions:
+        document_storage.delete(part_name(token))
+    UploadSession.objects.filter(pk__in=[pk for pk, _ in sessions]).delete()
+    return len(sessions)
+
+
+class ChunkedUploadedFile(UploadedFile):
+    """
+        Файл, загруженный по частям: хранилище документов перемещает временный файл загрузки на место, не копируя
+    """
+
+    def __init__(self, session):
+        # файл не открывается: хранилище перемещает его по пути (см. temporary_file_path)
+        super().__init__(None, session.file_name, None, session.size)
+        self.path = document_storage.path(part_name(session.token))
+        self.sha256 = session.sha256
+
+    def temporary_file_path(self):
+        return self.path
+
+    def open(self, mode='rb'):
+        self.file = open(self.path, mode)
+        return self
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class ChunkedFileInput(forms.ClearableFileInput):
+    """
+        Поле файла документа в форме: выбранный файл загружается по частям (app/static/app/chunked_upload.js),
+        с формой отправляется идентификатор завершенной загрузки. Без JavaScript файл отправляется с формой целиком.
+
+        Attributes:
+            user: Пользователь, заполняющий форму: принимаются только его загрузки (без пользователя загрузки
+                по частям не принимаются)
+    """
+
+    class Media:
+        js = ('app/chunked_upload.js',)
+
+    def __init__(self, attrs=None, user=None):
+        super().__init__(attrs)
+        self.user = user
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs'].update({
+            'data-upload-url': reverse('upload_start'),
+            'data-upload-field': name + UPLOAD_FIELD_SUFFIX,
+            'data-chunk-size': chunk_size(),
+            'data-max-size': max_file_size(),
+            'data-extensions': ','.join(settings.ALLOWED_FILE_UPLOAD_EXTENSIONS),
+        })
+        return context
+
+    def render(self, name, value, attrs=None, renderer=None):
+        return super().render(name, value, attrs, renderer) + format_html(
+            '<input type="hidden" name="{}" value="">', name + UPLOAD_FIELD_SUFFIX
+        )
+
+    def value_from_datadict(self, data, files, name):
+        token = data.get(name + UPLOAD_FIELD_SUFFIX)
+        if token and self.user is not None:
+            # идентификатор загрузки другого пользователя не принимается (как и при загрузке частей)
+            session = UploadSession.objects.filter(token=token, user_id=self.user.id).exclude(sha256='').first()
+            if session is not None and os.path.exists(document_storage.path(part_name(token))):
+                return ChunkedUploadedFile(session)
+        return super().value_from_datadict(data, files, name)
+
+    def value_omitted_from_data(self, data, files, name):
+        return not data.get(name + UPLOAD_FIELD_SUFFIX) and super().value_omitted_from_data(data, files, name)
@@ -4,6 +4,15 @@ from .views import *
 # кастомные урлы для приложения
 urlpatterns = [
     path("merge_documents/<int:fos_id>", merge_documents, name="merge_documents"),
+    path('documents/<int:document_id>', document_file, name='document_file'),
+    path('previews/<str:sha256>', document_preview, name='document_preview'),
+    path('uploads', upload_start, name='upload_start'),
+    path('uploads/<str:token>', upload_part, name='upload_part'),
     path('export-fos', export_fos, name='export_fos'),
-    path('export-disciplines', export_disciplines, name='export_disciplines')
+    path('export-disciplines', export_disciplines, name='export_disciplines'),
+    path('reports/<int:job_id>', report_job, name='report_job'),
+    path('reports/<int:job_id>/download', report_job_download, name='report_job_download'),
+    path('imports/<int:job_id>', import_job, name='import_job'),
+    path('imports/<int:job_id>/resume', import_job_resume, name='import_job_resume'),
+    path('instrumentation', instrumentation, name='instrumentation'),
 ]
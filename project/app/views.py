@@ -1,19 +1,28 @@
-import xlsxwriter
-from django.http import FileResponse, HttpResponse
-from app.models import Document as DocModel, Fos, Discipline, Qualification, FosType
-from docxcompose.composer import Composer
-from docx import Document
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import user_passes_test
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+from app import cache, instrumentation as instr
+from app.models import Document as DocModel, DocumentPreview, Fos, FosStat, ImportJob, ReportJob, UploadSession
+from django.conf import settings
+from django.core.files.storage import default_storage
 from django.contrib import messages
-from django.shortcuts import redirect, get_object_or_404
+from django.shortcuts import redirect, get_object_or_404, render
+from django.utils.cache import patch_cache_control
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_POST
 from django.urls import reverse
 from transliterate import translit
-import os
-from django.conf import settings
 import traceback
-from io import BytesIO
-from django.contrib.auth.models import User
+from app.delivery import serve_file
+from app.imports import resume_import
+from app.jobs import enqueue
+from app.merging import InvalidDocumentError, get_merged_document
+from app.uploads import ChunkUploadHandler, UploadError, chunk_size, finish_part, start_upload
 
 
+@staff_member_required
+@require_POST
 def export_disciplines(request):
     """
         Данный метод отвечает за реализацию функционала по экспорту (в excel) отчета дисциплин заданного периода обучения
@@ -23,181 +32,16 @@ def export_disciplines(request):
         messages.add_message(request, messages.ERROR, 'Не выбран период')
         return redirect('/admin/app/discipline/')
 
-    data = Qualification.objects.all()
-    types = FosType.objects.all()
-
-    total_by_types = {}
-    for t in types:
-        total_by_types[t.id] = 0
-
-    total_dis = 0
-
-    max_width = 0
-    for q in data:
-        if request.POST['years'] != 'all':
-            q.disciplines = Discipline.objects.filter(qualification_id=q.id, fos__years=request.POST['years'])
-        else:
-            q.disciplines = Discipline.objects.filter(qualification_id=q.id)
-        total_dis += q.disciplines.count()
-        for d in q.disciplines:
-            if len(d.name) > max_width:
-                max_width = len(d.name)
-            d.count_foses = {}
-            for t in types:
-                if request.POST['years'] != 'all':
-                    d.count_foses[t.id] = Fos.objects.filter(years=request.POST['years'], type_id=t.id, discipline_id=d.id).count()
-                else:
-                    d.count_foses[t.id] = Fos.objects.filter(type_id=t.id, discipline_id=d.id).count()
-                total_by_types[t.id] += d.count_foses[t.id]
-
-    total = 0
-    for tbt in total_by_types.values():
-        total += tbt
-
-    # создаем объект для работы с записью в excel файл
-    output = BytesIO()
-    workbook = xlsxwriter.Workbook(output)
-
-    # инициализируем лист
-    worksheet = workbook.add_worksheet()
-
-    # добавляем заголовок
-    header_format = workbook.add_format({
-        'bg_color': '#F7F7F7', 'bold': True, 'font_size': 14, 'color': 'black', 'align': 'center', 'valign': 'vcenter', 'border': 1
-    })
-    if request.POST['years'] != 'all':
-        title = 'Оценочные средства кафедры ИС и ПИ ('+dict(Fos.YEARS_CHOICES)[request.POST['years']]+')'
-    else:
-        title = 'Оценочные средства кафедры ИС и ПИ'
-    worksheet.merge_range(
-        first_row=1, first_col=2, last_col = 1 + types.count(), last_row=2,
-        data=title, cell_format=header_format
-    )
-
-    default_format = workbook.add_format({
-        'border': 1, 'align': 'center', 'valign': 'vcenter'
-    })
-
-    worksheet.merge_range(
-        first_row=3, first_col=0, last_col=1, last_row=4,
-        data='Дисциплины', cell_format=default_format
-    )
-
-    worksheet.set_column(0, 0, max_width + 10)
-    q_format = workbook.add_format({
-        'border': 1, 'align': 'center', 'valign': 'vcenter',  'text_wrap': True, 'bold': True
-    })
-    disc_format = workbook.add_format({
-        'border': 1, 'align': 'center', 'valign': 'vcenter',  'text_wrap': True, 'color': 'blue', 'underline': 1,
-    })
-    t_format = workbook.add_format({
-        'border': 1, 'align': 'center', 'valign': 'vcenter', 'text_wrap': True
-    })
-
-    col = 2
-    for t in types:
-        worksheet.merge_range(
-            first_row=3, first_col=col, last_col=col, last_row=4,
-            data=t.name, cell_format=t_format
-        )
-        worksheet.set_column(col, col, 17)
-        col += 1
-
-    row = 5
-    for q in data:
-        worksheet.merge_range(
-            first_row=row, first_col=0, last_col=1, last_row=row,
-            data=q.name, cell_format=q_format
-        )
-        worksheet.merge_range(
-            first_row=row, first_col=2, last_col=types.count()+1, last_row=row,
-            data='', cell_format=q_format
-        )
-        row += 1
-        for d in q.disciplines:
-            worksheet.merge_range(
-                first_row=row, first_col=0, last_col=1, last_row=row,
-                data=d.name, cell_format=disc_format
-            )
-            worksheet.write_url(row, 0, request.build_absolute_uri(d.get_admin_url()), string=d.name, cell_format=disc_format)
-            col = 2
-            for cf in d.count_foses.values():
-                worksheet.write(row, col, cf, t_format)
-                col += 1
-            row += 1
-
-    worksheet.write(row, 0, 'Всего', t_format)
-    worksheet.write(row, 1, total, t_format)
-
-    col = 2
-    for tbt in total_by_types.values():
-        worksheet.write(row, col, tbt, t_format)
-        col += 1
-
-    # создаем гистограмму
-    chart = workbook.add_chart({'type': 'column'})
-
-    # наименования - первый столбец (типы ФОСов)
-    # значения - второй столбец (кол-во)
-    # [sheetname, first_row, first_col, last_row, last_col]
-    chart.add_series({
-        "categories": ['Sheet1', 3, 2, 3, types.count()+1],
-        "values": ['Sheet1', row, 2, row, types.count()+1],
-        'data_labels': {'value': True},
-    })
-
-    # добавляем заголовки и убираем легенду
-    chart.set_title({"name": "Оценочные средства кафедры"})
-    chart.set_x_axis({"name": "Оценочные средства"})
-    chart.set_y_axis({"name": "Кол-во"})
-    chart.set_legend({'none': True})
-
-    # вставляем гистограмму на лист
-    worksheet.insert_chart(
-        'A' + str(10 + total_dis + 2),
-        chart, {'x_scale': 2, 'y_scale': 1}
-    )
-
-    data_labels = []
-    empty_indexes = []
-    i = 0
-    for tbt in total_by_types.values():
-        if tbt == 0:
-            data_labels.append({'delete': True})
-            empty_indexes.append(i)
-        else:
-            data_labels.append(None)
-        i += 1
-
-    # создаем и добавляем на лист круговую диаграмму
-    chart_pie = workbook.add_chart({'type': 'pie'})
-    chart_pie.add_series({
-        "categories": ['Sheet1', 3, 2, 3, types.count()+1],
-        "values": ['Sheet1', row, 2, row, types.count()+1],
-        'data_labels': {'percentage': True, 'custom': data_labels},
-    })
-    chart_pie.set_title({"name": "Оценочные средства кафедры"})
-    chart_pie.set_legend({'delete_series': empty_indexes})
-
-    worksheet.insert_chart(
-        'A' + str(10 + total_dis + 19),
-        chart_pie, {'x_scale': 2, 'y_scale': 1}
-    )
-
-    # сохраняем excel документ
-    workbook.close()
-
-    # создаем объект ответа в формате excel
-    response = HttpResponse(content_type='application/vnd.ms-excel')
-
-    # указываем название файла
-    response['Content-Disposition'] = 'attachment;filename="export_total.xlsx"'
-
-    # добавляем сформированный excel файл в объект ответа и отдаем его на скачивание
-    response.write(output.getvalue())
-    return response
+    # ставим формирование отчета в очередь и переходим на страницу состояния задачи
+    job = enqueue(ReportJob.KIND_DISCIPLINES, {
+        'years': None if request.POST['years'] == 'all' else request.POST['years'],
+        'base_url': request.build_absolute_uri('/'),
+    }, user=request.user)
+    return redirect(reverse('report_job', args=(job.pk,)))
 
 
+@staff_member_required
+@require_POST
 def export_fos(request):
     """
         Данный метод отвечает за реализацию функционала по экспорту (в excel) отчета ФОСов заданного преподавателя
@@ -207,231 +51,226 @@ def export_fos(request):
         messages.add_message(request, messages.ERROR, 'Не выбран преподаватель')
         return redirect('/admin/app/fos/')
 
-    # получаем преподавателя и все его дисциплины
-    teacher = User.objects.get(pk=request.POST['teacher'])
-    disciplines = Discipline.objects.filter(users__id=request.POST['teacher'])
+    # получаем преподавателя (в справочнике преподавателей - только пользователи, закрепленные за дисциплинами)
+    teacher = cache.get_by_id(cache.teachers(), request.POST['teacher'])
 
-    if disciplines.count() == 0:
+    if teacher is None:
         messages.add_message(request, messages.ERROR, 'У преподавателя нет дисциплин')
         return redirect('/admin/app/fos/')
 
-    all_fos_disc = []
-    for d in disciplines:
-        for f in d.fos_set.all():
-            all_fos_disc.append(f)
-
-    if len(all_fos_disc) == 0:
+    # наличие ФОСов проверяем по статистике ФОСов (см. app.stats)
+    if not FosStat.objects.filter(discipline__users__id=teacher.id).exists():
         messages.add_message(request, messages.ERROR, 'У преподавателя нет загруженных ФОСов')
         return redirect('/admin/app/fos/')
 
-    # создаем объект для работы с записью в excel файл
-    output = BytesIO()
-    workbook = xlsxwriter.Workbook(output)
+    # ставим формирование отчета в очередь и переходим на страницу состояния задачи
+    job = enqueue(ReportJob.KIND_FOS, {'teacher': teacher.id}, user=request.user)
+    return redirect(reverse('report_job', args=(job.pk,)))
 
-    # инициализируем лист
-    worksheet = workbook.add_worksheet()
 
-    # добавляем заголовок
-    worksheet.merge_range('A2:H2', 'Фонд оценочных средств', workbook.add_format({
-        'bold': True, 'font_size': 14, 'align': 'left', 'valign': 'vcenter'
-    }))
+def get_report_job(request, job_id):
+    """
+        Получение задачи формирования отчета, доступной пользователю
+    """
+    # пользователю доступны только его задачи, супер-администратору - все
+    jobs = ReportJob.objects.all()
+    if not request.user.is_superuser:
+        jobs = jobs.filter(user_id=request.user.id)
+    return get_object_or_404(jobs, pk=job_id)
 
-    # создаем стиль для заголовочной строки таблицы
-    header = workbook.add_format({
-        'bg_color': '#F7F7F7', 'bold': True, 'color': 'black', 'align': 'center', 'valign': 'vcenter', 'border': 1
-    })
 
-    # добавляем заголовочные строки таблицы
-    worksheet.merge_range('A4:A5', 'Преподаватель', header)
-    # формируем заголовок "дисциплины" (3 строка и объединяем столько колонок - сколько дисциплин)
-    if len(disciplines) == 1:
-        worksheet.write(3, 1, 'Дисциплины', header)
-    else:
-        worksheet.merge_range(
-            first_row=3, first_col=1, last_row=3, last_col=len(disciplines),
-            data='Дисциплины', cell_format=header
-        )
-    worksheet.set_column(0, 0, 25)
-    worksheet.set_column(1, len(disciplines), 15)
-
-    style_default = workbook.add_format({'border': 1})
-    style = workbook.add_format({
-        'align': 'center', 'valign': 'vcenter', 'border': 1, 'text_wrap': True
-    })
-    col = 1
-    count_fos = []
-    # перебираем все дисциплины
-    for d in disciplines:
-        # записываем название дисциплины в 4 строку в соответствующую колонку
-        worksheet.write(4, col, d.name, header)
-        # ширина такой ячейки - кол-во букв в дисциплине + 10
-        worksheet.set_column(col, col, len(d.name) + 10)
-
-        row = 5
-        names = []
-        count_fos.append(d.fos_set.count())
-        # перебираем все ФОСы дисциплины
-        for f in d.fos_set.all():
-            fos = f.name + " (" + f.type.name + ")"
-            names.append(fos)
-            # начиная с 5 строки и соответствующей колонки записываем ФОС
-            worksheet.write(row, col, fos, style_default)
-            # переходим на след строку
-            row += 1
-        if len(names) > 0:
-            # выставляем ширину колонки по максимально большому названию из ФОСов
-            worksheet.set_column(col, col, len(max(names, key=len)))
-        else:
-            # если ФОСов в пределах дисциплины нет - пишем прочерк
-            worksheet.write(row, col, '-', style)
-        # переходим на следующую колонку
-        col = col + 1
-
-    # записываем имя преподавателя в 6 строку
-    if teacher.first_name or teacher.last_name:
-        username = teacher.first_name + " " + teacher.last_name
-    else:
-        username = teacher.username
-
-    # делаем эту ячейку по ширине равной самому большому кол-ву строк ФОСов в дисциплинах
-    if (5 + max(count_fos)) == 6:
-        worksheet.write('A6:A6', username, style)
-    else:
-        worksheet.merge_range('A6:A' + str(5 + max(count_fos)), username, style)
-
-    # далее необходимо найти пустые ячейки в каждой колонке (где ФОСов нет)
-    # объединить их и поставить прочерк
-    col = 1
-    for d in disciplines:
-        row = 5
-        last_row = 0
-        for f in range(0, max(count_fos)):
-            # в пределах каждой колонки (дисциплины) ищем последнюю заполненную строчку
-            try:
-                d.fos_set.all()[f]
-            except IndexError:
-                # запоминаем индекс следующей пустой строки
-                last_row = row
-                break
-            row += 1
-        if last_row != 0:
-            # в случае если есть пустые строки
-            fr = last_row
-            lw = max(count_fos) + 4
-
-            if fr == lw:
-                # если такая ячейка одна - ставим прочерк в ней
-                worksheet.write(fr, col, '-', style)
-            else:
-                # если их несколько - объединяем все и ставим прочерк по центру
-                worksheet.merge_range(
-                    first_row=last_row, first_col=col, last_row=max(count_fos) + 4, last_col=col,
-                    data='-', cell_format=style
-                )
-        col = col + 1
-
-    # формируем стили для подписи "оценочные средства" справа от таблицы
-    fos_text_style = workbook.add_format({'align': 'center', 'valign': 'vcenter', 'border': 1})
-    # разворачиваем текст
-    fos_text_style.set_rotation(90)
-    # добавляем перенос слов
-    fos_text_style.set_text_wrap(True)
-    # объединяем ячейки колонки {кол-во дисциплин+1} ОТ 5 строки + кол-во строк ФОСов
-    # и пишем туда текст
-    worksheet.merge_range(
-        first_row=5, first_col=disciplines.count() + 1, last_row=max(count_fos) + 4, last_col=disciplines.count() + 1,
-        data='Оценочные средства', cell_format=fos_text_style
-    )
-
-    # далее формируем итоговую таблицу (где первый столбец - тип ФОСа, второй - их общее количество)
-    # добавляем заголовок
-    row = 7 + max(count_fos)
-    worksheet.merge_range(
-        first_row=row, first_col=0, last_row=row + 2, last_col=1,
-        data='Общее количество оценочных средств', cell_format=style
-    )
-
-    # формируем словарь, где элементы это типы ФОСов без повторений
-    fos_types = dict()
-    for d in disciplines:
-        for f in d.fos_set.all():
-            if f.type not in fos_types:
-                f.type.total = 0
-                fos_types[f.type.id] = f.type
-
-    # считаем кол-во каждого типа ФОСов и общее кол-во
-    all_total = 0
-    for d in disciplines:
-        for f in d.fos_set.all():
-            fos_types[f.type.id].total += 1
-            all_total += 1
-
-    # перебираем все типы ФОСов
-    row = 10 + max(count_fos)
-    for ft in fos_types:
-        # в первую колонку пишем название
-        worksheet.write(row, 0, fos_types[ft].name, style)
-        # во вторую - кол-во
-        worksheet.write(row, 1, fos_types[ft].total, style)
-        row += 1
-
-    # добавляем строку где выводится общее кол-во всех ФОСОв
-    total_format = workbook.add_format({
-        'align': 'center', 'valign': 'vcenter', 'border': 1, 'bold': True
+@staff_member_required
+def report_job(request, job_id):
+    """
+        Данный метод отвечает за отображение страницы состояния задачи формирования отчета
+    """
+    job = get_report_job(request, job_id)
+    return render(request, 'admin/app/reportjob/status.html', {
+        'title': str(job),
+        'job': job,
+        'in_progress': job.status in (ReportJob.STATUS_PENDING, ReportJob.STATUS_RUNNING),
     })
-    worksheet.write(row, 0, 'Всего оценочных средств', total_format)
-    # worksheet.write_formula(row, 1, '=SUM(B16:B'+str(row)+')', total_format)
-    worksheet.write(row, 1, all_total, total_format)
-
-    # создаем гистограмму
-    chart = workbook.add_chart({'type': 'column'})
-
-    # наименования - первый столбец (типы ФОСов)
-    # значения - второй столбец (кол-во)
-    chart.add_series({
-        "categories": '=Sheet1!$A$' + str(11 + max(count_fos)) + ':$A$' + str(row),
-        "values": '=Sheet1!$B$' + str(11 + max(count_fos)) + ':$B$' + str(row)
+
+
+@staff_member_required
+def report_job_download(request, job_id):
+    """
+        Данный метод отвечает за скачивание сформированного отчета
+    """
+    job = get_report_job(request, job_id)
+    if job.status != ReportJob.STATUS_DONE or not job.file:
+        raise Http404('Отчет еще не сформирован')
+    # отдаем файл с диска по частям, не загружая его целиком в память
+    return serve_file(request, job.file.path, filename=job.filename, as_attachment=True,
+                      content_type='application/vnd.ms-excel')
+
+
+def get_import_job(request, job_id):
+    """
+        Получение задачи импорта, доступной пользователю
+    """
+    # пользователю доступны только его задачи, супер-администратору - все
+    import_jobs = ImportJob.objects.all()
+    if not request.user.is_superuser:
+        import_jobs = import_jobs.filter(user_id=request.user.id)
+    return get_object_or_404(import_jobs, pk=job_id)
+
+
+@staff_member_required
+def import_job(request, job_id):
+    """
+        Данный метод отвечает за отображение страницы хода импорта (замеры по порциям строк)
+    """
+    job = get_import_job(request, job_id)
+    app_label, model_name = job.model.split('.')
+    return render(request, 'admin/app/importjob/status.html', {
+        'title': str(job),
+        'job': job,
+        'in_progress': job.status in (ImportJob.STATUS_PENDING, ImportJob.STATUS_RUNNING),
+        'changelist_url': reverse('admin:' + app_label + '_' + model_name + '_changelist'),
     })
 
-    # добавляем заголовки и убираем легенду
-    chart.set_title({"name": "Общее количество ОС"})
-    chart.set_x_axis({"name": "Оценочные средства"})
-    chart.set_y_axis({"name": "Кол-во"})
-    chart.set_legend({'none': True})
-
-    # вставляем гистограмму на лист
-    worksheet.insert_chart(
-        'A' + str(14 + max(count_fos) + len(fos_types)),
-        chart, {'x_scale': 2, 'y_scale': 1}
-    )
-
-    # создаем и добавляем на лист круговую диаграмму
-    chart_pie = workbook.add_chart({'type': 'pie'})
-    chart_pie.add_series({
-        "categories": '=Sheet1!$A$' + str(11 + max(count_fos)) + ':$A$' + str(row),
-        "values": '=Sheet1!$B$' + str(11 + max(count_fos)) + ':$B$' + str(row),
-        'data_labels': {'value': True},
+
+@staff_member_required
+@require_POST
+def import_job_resume(request, job_id):
+    """
+        Данный метод отвечает за продолжение прерванного ошибкой импорта с первой несохраненной порции
+    """
+    job = get_import_job(request, job_id)
+    if not resume_import(job):
+        messages.add_message(request, messages.ERROR, 'Импорт не завершился ошибкой, продолжать нечего')
+    return redirect(reverse('import_job', args=(job.pk,)))
+
+
+@user_passes_test(lambda u: u.is_active and u.is_superuser, login_url='admin:login')
+def instrumentation(request):
+    """
+        Данный метод отвечает за отображение страницы замеров запросов к серверу (только для супер-администратора)
+    """
+    if request.method == 'POST':
+        instr.clear()
+        return redirect(reverse('instrumentation'))
+    records = instr.get_records()
+    view = request.GET.get('view')
+    return render(request, 'admin/app/instrumentation.html', {
+        'title': 'Замеры запросов',
+        'enabled': settings.INSTRUMENTATION,
+        'summary': instr.summary(records),
+        'view': view,
+        'records': [r for r in records if not view or r['view'] == view],
     })
-    chart_pie.set_title({"name": "Общее количество ОС"})
-    worksheet.insert_chart(
-        'A' + str(14 + max(count_fos) + len(fos_types) + 15),
-        chart_pie, {'x_scale': 2, 'y_scale': 1}
-    )
 
-    # сохраняем excel документ
-    workbook.close()
 
-    # создаем объект ответа в формате excel
-    response = HttpResponse(content_type='application/vnd.ms-excel')
+@staff_member_required
+def document_file(request, document_id):
+    """
+        Данный метод отвечает за отдачу загруженного файла документа
+    """
+    document = get_object_or_404(DocModel, pk=document_id)
+    if not document.path:
+        raise Http404('У документа нет загруженного файла')
+    # файл хранится под именем из хэша содержимого - отдается с исходным именем
+    return serve_file(request, document.path.path, filename=document.file_name or None)
+
+
+# сколько секунд браузер использует миниатюру документа без повторного запроса (адрес миниатюры - хэш содержимого
+# файла, поэтому измененный файл получает новый адрес)
+PREVIEW_MAX_AGE = 24 * 60 * 60
 
-    # указываем название файла
-    response['Content-Disposition'] = 'attachment;filename="export.xlsx"'
 
-    # добавляем сформированный excel файл в объект ответа и отдаем его на скачивание
-    response.write(output.getvalue())
+@staff_member_required
+def document_preview(request, sha256):
+    """
+        Данный метод отвечает за отдачу миниатюры первой страницы файла документа (см. app.previews)
+    """
+    preview = get_object_or_404(DocumentPreview, sha256=sha256)
+    if not preview.image:
+        raise Http404('Для файла нет миниатюры')
+    response = serve_file(request, default_storage.path(preview.image), content_type='image/png')
+    patch_cache_control(response, private=True, max_age=PREVIEW_MAX_AGE)
     return response
 
 
+def upload_state(session):
+    """
+        Состояние загрузки файла по частям для клиента
+    """
+    return {
+        'token': session.token,
+        'file_name': session.file_name,
+        'size': session.size,
+        'offset': session.received,
+        'complete': session.complete,
+        'chunk_size': chunk_size(),
+        'url': reverse('upload_part', args=(session.token,)),
+    }
+
+
+@staff_member_required
+@require_POST
+def upload_start(request):
+    """
+        Данный метод отвечает за начало загрузки файла документа по частям (имя и размер файла проверяются сразу)
+    """
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Не указан размер файла'}, status=400)
+    try:
+        session = start_upload(request.user, request.POST.get('file_name'), size)
+    except ValidationError as e:
+        return JsonResponse({'error': ' '.join(e.messages)}, status=400)
+    return JsonResponse(upload_state(session), status=201)
+
+
+@csrf_exempt
+@staff_member_required
+def upload_part(request, token):
+    """
+        Данный метод отвечает за состояние загрузки файла по частям (GET) и прием очередной части (POST,
+        поле chunk, смещение части в параметре offset)
+    """
+    session = get_object_or_404(UploadSession, token=token, user_id=request.user.id)
+    if request.method == 'GET':
+        return JsonResponse(upload_state(session))
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['GET', 'POST'])
+
+    try:
+        offset = int(request.GET.get('offset', ''))
+    except ValueError:
+        return JsonResponse(dict(upload_state(session), error='Не указано смещение части'), status=400)
+    if session.complete:
+        return JsonResponse(dict(upload_state(session), error='Загрузка уже завершена'), status=409)
+    if offset > session.received:
+        # часть не продолжает полученные данные - клиент продолжает загрузку с offset из ответа
+        return JsonResponse(dict(upload_state(session), error='Часть начинается после полученных данных'),
+                            status=409)
+
+    # обработчик загрузки подменяется до чтения тела запроса (в т.ч. проверкой CSRF), поэтому проверка CSRF -
+    # во вложенном представлении
+    request.upload_handlers = [ChunkUploadHandler(request, session, offset)]
+    return receive_upload_part(request, session)
+
+
+@csrf_protect
+def receive_upload_part(request, session):
+    """
+        Прием части файла загрузки (после проверки CSRF)
+    """
+    handler = request.upload_handlers[0]
+    # разбор тела запроса (если его еще не разобрала проверка CSRF): часть записывается обработчиком загрузки
+    # по мере получения
+    request.FILES
+    try:
+        session = finish_part(session, handler)
+    except UploadError as e:
+        session.refresh_from_db()
+        return JsonResponse(dict(upload_state(session), error=str(e)), status=e.status)
+    return JsonResponse(upload_state(session))
+
+
 def merge_documents(request, fos_id):
     """
         Данный метод отвечает за реализацию функционала по объединению документов в пределах ФОСА
@@ -439,7 +278,7 @@ def merge_documents(request, fos_id):
     try:
         # находим требуемый ФОС и получаем его документы
         fos = get_object_or_404(Fos, pk=fos_id)
-        documents = DocModel.objects.filter(fos_id=fos_id)
+        documents = DocModel.objects.filter(fos_id=fos_id).order_by('id')
 
         # если у ФОСа не создано ни одного документа, или у первого из них нет физически загруженного файла
         if documents.count() < 1 or not documents[0].path:
@@ -449,43 +288,23 @@ def merge_documents(request, fos_id):
 
         # если документ всего один - отдаем его на скачивание
         if documents.count() == 1:
-            return FileResponse(
-                open(documents[0].path.path, 'rb')
-            )
+            return serve_file(request, documents[0].path.path, filename=documents[0].file_name or None,
+                              as_attachment=True)
 
         try:
-            # добавляем в слияние первый документ
-            master = Document(documents[0].path.path)
-            composer = Composer(master)
-        except Exception:
+            # объединяем документы с загруженными файлами (или берем готовый файл из кэша, если они не менялись)
+            merged_file_path = get_merged_document(fos_id, [doc for doc in documents if doc.path])
+        except InvalidDocumentError as e:
             # если первый из документов не является валидным MS Word файлом
             # возвращаем ошибку и делаем редирект на страницу ФОСа
-            messages.add_message(request, messages.ERROR, 'Загруженный документ не является валидным MS Word файлом')
+            messages.add_message(request, messages.ERROR, str(e))
             return redirect(reverse('admin:app_fos_change', args=(fos_id,)))
 
-        # перебираем все документы в ФОСе
-        for doc in documents:
-            # исключаем первый документ
-            # проверяем что у каждого документа есть загруженный файл
-            if doc.path and doc.id != documents[0].id:
-                try:
-                    new_doc = Document(doc.path.path)
-                    composer.append(new_doc)
-                except Exception:
-                    # если какой-либо документ не является валидным MS Word файлом - пропускаем такой документ
-                    pass
-
         # формируем название для объединенного файла (транслит названия дисциплины и ID ФОСа)
         merged_file_name = translit(fos.discipline.name, reversed=True) + "_fos_" + str(fos_id) + ".docx"
-        # формируем путь для физического сохранения на диске и сохраняем файл
-        pth = str(settings.BASE_DIR)
-        merged_file_path = os.path.join(pth, "media", 'documents-merged', merged_file_name)
-        composer.save('media/documents-merged/' + merged_file_name)
 
         # отдаем сохраненный файл на скачивание
-        return FileResponse(
-            open(merged_file_path, 'rb')
-        )
+        return serve_file(request, merged_file_path, filename=merged_file_name, as_attachment=True)
     except Exception as e:
         # в случае возникновения ошибок - выводим их в консоль, а также возвращаем пользователю
         print(traceback.format_exc())
@@ -54,6 +54,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "app.instrumentation.InstrumentationMiddleware",
+    # транзакции запросов, изменяющих данные, в SQLite сразу берут блокировку записи (см. app/backends)
+    "app.backends.WriteRequestMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -96,12 +99,46 @@ WSGI_APPLICATION = "project.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# профиль БД выбирается переменной DB_ENGINE:
+# sqlite - для небольших установок (режим WAL, ожидание блокировки записи вместо ошибки "database is locked",
+#          см. app/backends/sqlite3)
+# postgresql - для продакшена (постоянные соединения, проверка соединений, опционально - через пулер PgBouncer)
+DB_ENGINE = os.getenv("DB_ENGINE") or 'sqlite'
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("DB_NAME") or 'fos',
+            "USER": os.getenv("DB_USER") or 'fos',
+            "PASSWORD": os.getenv("DB_PASSWORD") or '',
+            "HOST": os.getenv("DB_HOST") or '127.0.0.1',
+            "PORT": os.getenv("DB_PORT") or '5432',
+            # время жизни соединения в секундах (0 - соединение на каждый запрос)
+            "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE") or 60),
+            # проверка постоянного соединения перед использованием в новом запросе
+            "CONN_HEALTH_CHECKS": True,
+            # пулер в режиме транзакций не поддерживает серверные курсоры
+            "DISABLE_SERVER_SIDE_CURSORS": (os.getenv("DB_POOLER") == 'True'),
+            "OPTIONS": {
+                "connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT") or 5),
+            },
+        }
     }
-}
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "app.backends.sqlite3",
+            "NAME": os.getenv("DB_NAME") or BASE_DIR / "db.sqlite3",
+            "OPTIONS": {
+                # сколько секунд ждать освобождения блокировки записи
+                "timeout": int(os.getenv("DB_BUSY_TIMEOUT") or 20),
+            },
+        }
+    }
+
+# включать режим WAL для SQLite (чтение не блокируется записью)
+SQLITE_WAL = (os.getenv("SQLITE_WAL") or 'True') == 'True'
 
 
 # Password validation
@@ -159,6 +196,84 @@ ALLOWED_FILE_UPLOAD_EXTENSIONS = [
 # максимальный размер загружаемых файлов в Мб
 MAX_UPLOADED_FILE_SIZE = int(os.getenv("MAX_UPLOADED_FILE_SIZE") or 1)
 
+# обработчики загрузки файлов считают хэш содержимого при получении файла (для хранилища документов, см. app/storage.py)
+FILE_UPLOAD_HANDLERS = [
+    'app.uploads.HashingMemoryFileUploadHandler',
+    'app.uploads.HashingTemporaryFileUploadHandler',
+]
+
+# через сколько часов после удаления последней ссылки файл документа может быть удален (collect_document_blobs)
+DOCUMENT_BLOB_GRACE_HOURS = int(os.getenv("DOCUMENT_BLOB_GRACE_HOURS") or 24)
+
+# загрузка файлов документов по частям: размер части в Мб и через сколько часов незавершенная загрузка удаляется
+# (collect_document_blobs)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE") or 5)
+UPLOAD_SESSION_HOURS = int(os.getenv("UPLOAD_SESSION_HOURS") or 24)
+
+# миниатюры первых страниц документов (app/previews.py): ширина в пикселях и шрифт текста (TrueType с кириллицей)
+DOCUMENT_PREVIEW_WIDTH = int(os.getenv("DOCUMENT_PREVIEW_WIDTH") or 240)
+DOCUMENT_PREVIEW_FONT = os.getenv("DOCUMENT_PREVIEW_FONT") or '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+
+# максимальный размер кэша объединенных документов ФОСов в Мб
+MERGED_DOCUMENTS_CACHE_SIZE = int(os.getenv("MERGED_DOCUMENTS_CACHE_SIZE") or 200)
+
+# кол-во потоков для разбора документов ФОСа при их объединении
+MERGE_PARSE_WORKERS = int(os.getenv("MERGE_PARSE_WORKERS") or min(4, os.cpu_count() or 1))
+
+# передача отдачи файлов фронт-прокси: 'x-sendfile' (Apache, lighttpd) или 'x-accel-redirect' (nginx),
+# пусто - файлы отдает приложение
+SENDFILE_BACKEND = os.getenv("SENDFILE_BACKEND") or None
+
+# внутренний адрес nginx (location с директивой internal), по которому доступен каталог MEDIA_ROOT
+SENDFILE_URL = os.getenv("SENDFILE_URL") or '/protected-media/'
+
+# кол-во фоновых обработчиков задач формирования отчетов
+REPORT_JOB_WORKERS = int(os.getenv("REPORT_JOB_WORKERS") or 2)
+
+# выполнять задачи формирования отчетов синхронно, в потоке запроса (для отладки и тестов)
+REPORT_JOBS_SYNC = (os.getenv("REPORT_JOBS_SYNC") == 'True')
+
+# сколько дней хранить сформированные отчеты (старые задачи удаляются вместе с файлами, см. app.jobs.cleanup)
+REPORT_JOB_KEEP_DAYS = int(os.getenv("REPORT_JOB_KEEP_DAYS") or 7)
+
+# размер выгрузки в Мб, до которого она формируется в памяти (больше - во временном файле на диске)
+EXPORT_SPOOL_SIZE = int(os.getenv("EXPORT_SPOOL_SIZE") or 10)
+
+# кол-во строк в порции фонового импорта (каждая порция сохраняется в своей транзакции)
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE") or 500)
+
+# общий кэш процессов сервера (например, django.core.cache.backends.memcached.PyMemcacheCache и 127.0.0.1:11211),
+# по-умолчанию - кэш в памяти процесса
+if os.getenv("CACHE_BACKEND"):
+    CACHES = {
+        "default": {
+            "BACKEND": os.getenv("CACHE_BACKEND"),
+            "LOCATION": os.getenv("CACHE_LOCATION") or '',
+        }
+    }
+
+# кэш справочников (см. app/cache.py): время хранения в памяти процесса в секундах
+# и псевдоним общего кэша (пусто - только память процесса)
+REFERENCE_CACHE_LOCAL_TTL = int(os.getenv("REFERENCE_CACHE_LOCAL_TTL") or 60)
+REFERENCE_CACHE_ALIAS = os.getenv("REFERENCE_CACHE_ALIAS") or ''
+
+# замеры запросов к серверу (кол-во и время SQL-запросов, повторяющиеся запросы, полное время), см. app/instrumentation.py:
+# включение, кол-во хранимых в памяти процесса последних замеров и запись замеров в лог строками JSON
+INSTRUMENTATION = (os.getenv("INSTRUMENTATION") == 'True')
+INSTRUMENTATION_BUFFER_SIZE = int(os.getenv("INSTRUMENTATION_BUFFER_SIZE") or 500)
+INSTRUMENTATION_LOG = (os.getenv("INSTRUMENTATION_LOG") == 'True')
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "app.instrumentation": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
+
 X_FRAME_OPTIONS = 'SAMEORIGIN'
 
 IMPORT_EXPORT_IMPORT_PERMISSION_CODE = 'ie_import'